@@ -0,0 +1,192 @@
+# analytics.py
+"""Vectorized habit analytics over a chat's whole task history.
+
+The history is read in one query straight into a NumPy record array (activities are
+numbered in SQL, so every column is numeric) and all statistics are array operations,
+which keeps /stats fast over years of data.
+"""
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytz
+
+from database_connection import transaction
+
+TASHKENT_TZ = pytz.timezone("Asia/Tashkent")
+DAY = 24 * 60 * 60
+MAX_RESPONSE_MINUTES = 24 * 60  # Longer responses are capped, as in the weekly report
+COMPLETED, MISSED = 1, 2
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+HEATMAP_BLOCK_HOURS = 3
+HEATMAP_SHADES = "·░▒▓█"  # Completion rate from 0% to 100%
+TOP_STREAKS = 5
+
+HISTORY_DTYPE = np.dtype([
+    ("activity", np.int32), ("status", np.int8), ("hour", np.int8),
+    ("notified_ts", np.int64), ("completed_ts", np.int64),
+])
+
+
+def utc_offset():
+    # Tashkent has no daylight saving time, so one offset converts every timestamp
+    return int(datetime.now(TASHKENT_TZ).utcoffset().total_seconds())
+
+
+def load_history(chat_id):
+    """Return (activity names, record array of decided tasks) for one chat."""
+    with transaction() as cursor:
+        cursor.execute("""
+            SELECT DISTINCT lower(trim(task)) AS activity FROM all_tasks
+            WHERE chat_id = ? AND status IN ('completed', 'missed')
+            ORDER BY activity
+        """, (chat_id,))
+        names = [row[0] for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT dense_rank() OVER (ORDER BY lower(trim(task))) - 1,
+                   CASE status WHEN 'completed' THEN 1 ELSE 2 END,
+                   CAST(substr(time, 1, instr(time, ':') - 1) AS INTEGER),
+                   COALESCE(notified_ts, 0),
+                   COALESCE(completed_ts, 0)
+            FROM all_tasks
+            WHERE chat_id = ? AND status IN ('completed', 'missed')
+        """, (chat_id,))
+        history = np.fromiter(cursor, dtype=HISTORY_DTYPE)
+    return names, history
+
+
+def local_days(history, offset):
+    # A task belongs to the day it was notified, or completed if it never was
+    ts = np.where(history["notified_ts"] > 0, history["notified_ts"], history["completed_ts"])
+    return np.where(ts > 0, (ts + offset) // DAY, -1)
+
+
+def response_percentiles(history, percentiles=(50, 90, 99)):
+    notified, completed = history["notified_ts"], history["completed_ts"]
+    valid = (history["status"] == COMPLETED) & (notified > 0) & (completed > notified)
+    minutes = np.minimum((completed[valid] - notified[valid]) / 60.0, MAX_RESPONSE_MINUTES)
+    if not minutes.size:
+        return {}, 0
+    return dict(zip(percentiles, np.percentile(minutes, percentiles))), int(minutes.size)
+
+
+def rolling_completion(days, completed, today, windows=(7, 30)):
+    """Completion rate over the last ``window`` days and the window before it, for each window."""
+    valid = days >= 0
+    first = today - 2 * max(windows) + 1
+    index = days[valid] - first
+    in_range = (index >= 0) & (index <= today - first)
+    index = index[in_range]
+    length = today - first + 1
+    done = np.bincount(index, weights=completed[valid][in_range], minlength=length)
+    total = np.bincount(index, minlength=length).astype(float)
+    # Cumulative sums turn every window total into one subtraction
+    done_sum = np.concatenate(([0.0], np.cumsum(done)))
+    total_sum = np.concatenate(([0.0], np.cumsum(total)))
+    rates = {}
+    for window in windows:
+        end = length
+        current = (done_sum[end] - done_sum[end - window], total_sum[end] - total_sum[end - window])
+        previous = (done_sum[end - window] - done_sum[end - 2 * window],
+                    total_sum[end - window] - total_sum[end - 2 * window])
+        rates[window] = tuple(d / t if t else None for d, t in (current, previous))
+    return rates
+
+
+def activity_streaks(activities, days, completed, today):
+    """(current streak, longest streak) in days per activity, from days with a completed task."""
+    done = completed & (days >= 0)
+    # One key per (activity, day) pair; unique() also sorts by activity, then day
+    keys = np.unique(activities[done].astype(np.int64) * (1 << 32) + days[done])
+    if not keys.size:
+        return {}
+    activity, day = keys >> 32, keys & 0xFFFFFFFF
+    starts = np.ones(keys.size, dtype=bool)
+    starts[1:] = (activity[1:] != activity[:-1]) | (day[1:] != day[:-1] + 1)
+    run = np.cumsum(starts) - 1
+    run_length = np.bincount(run)
+    run_activity = activity[starts]
+    run_last_day = day[np.r_[np.flatnonzero(starts)[1:] - 1, keys.size - 1]]
+
+    longest = np.zeros(run_activity.max() + 1, dtype=np.int64)
+    np.maximum.at(longest, run_activity, run_length)
+    current = np.zeros_like(longest)
+    # A streak is still alive if its last completion was today or yesterday
+    alive = run_last_day >= today - 1
+    current[run_activity[alive]] = run_length[alive]
+    return {int(a): (int(current[a]), int(longest[a])) for a in np.unique(run_activity)}
+
+
+def completion_heatmap(days, hours, completed):
+    """7 x (24 / HEATMAP_BLOCK_HOURS) completion rates by weekday and planned time; NaN where empty."""
+    valid = (days >= 0) & (hours >= 0) & (hours < 24)
+    weekday = (days[valid] + 3) % 7  # 1970-01-01 was a Thursday
+    blocks = 24 // HEATMAP_BLOCK_HOURS
+    cell = weekday * blocks + hours[valid] // HEATMAP_BLOCK_HOURS
+    done = np.bincount(cell, weights=completed[valid], minlength=7 * blocks)
+    total = np.bincount(cell, minlength=7 * blocks)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (done / total).reshape(7, blocks)
+
+
+def compute_stats(names, history, now=None):
+    now = now or datetime.now(TASHKENT_TZ)
+    offset = utc_offset()
+    today = int((int(now.timestamp()) + offset) // DAY)
+    days = local_days(history, offset)
+    completed = history["status"] == COMPLETED
+    percentiles, responses = response_percentiles(history)
+    streaks = activity_streaks(history["activity"], days, completed, today)
+    return {
+        "tasks": int(history.size),
+        "completed": int(completed.sum()),
+        "first_day": int(days[days >= 0].min()) if (days >= 0).any() else None,
+        "percentiles": percentiles,
+        "responses": responses,
+        "rolling": rolling_completion(days, completed, today),
+        "streaks": {names[activity]: streak for activity, streak in streaks.items()},
+        "heatmap": completion_heatmap(days, history["hour"].astype(np.int64), completed),
+    }
+
+
+def format_change(current, previous):
+    if current is None:
+        return "no data"
+    text = f"{current * 100:.0f}%"
+    if previous is not None:
+        change = (current - previous) * 100
+        text += f" ({'▲' if change >= 0 else '▼'} {abs(change):.0f} pts)"
+    return text
+
+
+def format_stats(stats):
+    if not stats["tasks"]:
+        return "⚠ No completed or missed tasks yet."
+    since = date(1970, 1, 1) + timedelta(days=stats["first_day"]) if stats["first_day"] is not None else "?"
+    lines = [f"📊 **Habit Stats** ({stats['tasks']} tasks since {since}, {stats['completed']} completed)"]
+
+    if stats["percentiles"]:
+        p = stats["percentiles"]
+        lines.append(f"⏱ Response time: p50 {p[50]:.1f} min · p90 {p[90]:.1f} min · p99 {p[99]:.1f} min ({stats['responses']} videos)")
+    rolling = stats["rolling"]
+    lines.append(f"✅ Completion: 7 days {format_change(*rolling[7])}, 30 days {format_change(*rolling[30])}")
+
+    streaks = sorted(stats["streaks"].items(), key=lambda item: (-item[1][0], -item[1][1], item[0]))[:TOP_STREAKS]
+    if streaks:
+        lines.append("\n🔥 Streaks (current / best):")
+        lines.extend(f"- {name}: {current} / {longest} days" for name, (current, longest) in streaks)
+
+    heatmap = stats["heatmap"]
+    lines.append(f"\n🗓 Completion by weekday and planned time ({HEATMAP_SHADES[0]} 0% → {HEATMAP_SHADES[-1]} 100%):")
+    lines.append("     " + " ".join(f"{hour:02d}" for hour in range(0, 24, HEATMAP_BLOCK_HOURS)))
+    for weekday, row in zip(WEEKDAYS, heatmap):
+        cells = [
+            "  " if np.isnan(rate) else HEATMAP_SHADES[min(int(rate * len(HEATMAP_SHADES)), len(HEATMAP_SHADES) - 1)] * 2
+            for rate in row
+        ]
+        lines.append(f"{weekday}  " + " ".join(cells))
+    return "\n".join(lines)
+
+
+def build_stats_report(chat_id):
+    names, history = load_history(chat_id)
+    return format_stats(compute_stats(names, history))
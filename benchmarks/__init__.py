@@ -0,0 +1,5 @@
+# benchmarks/__init__.py
+"""Synthetic-data benchmarks for the database helpers, reports and reminder scheduler.
+
+Run ``python -m benchmarks.run --help`` from the repository root.
+"""
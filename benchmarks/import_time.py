@@ -0,0 +1,79 @@
+# benchmarks/import_time.py
+"""Check that importing the bot stays fast and free of side effects.
+
+Usage:
+    python -m benchmarks.import_time [--budget-ms 400] [--module main]
+
+Runs ``python -X importtime -c "import main"`` in a fresh interpreter from an empty
+working directory and fails (exit status 1) when the cumulative import time is over
+budget, when report-only libraries such as matplotlib were imported, or when the
+import created a database file.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+IMPORT_BUDGET_MS = 400  # Cumulative import time of main, best of --runs
+FORBIDDEN_MODULES = ("matplotlib", "numpy", "chart_rendering", "webhook", "metrics_middleware")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr):
+    """Return {module: (self_us, cumulative_us)} from ``-X importtime`` output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def measure(module):
+    """Import ``module`` in a fresh interpreter; return (import times, loaded modules, files created)."""
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        code = f"import sys, {module}; print('\\n'.join(sorted(sys.modules)))"
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=workdir, env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+        created = os.listdir(workdir)
+    return parse_importtime(result.stderr), set(result.stdout.split()), created
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.import_time", description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=3, help="take the fastest of this many fresh imports")
+    parser.add_argument("--top", type=int, default=10, help="show the slowest modules by self time")
+    args = parser.parse_args(argv)
+
+    runs = [measure(args.module) for _ in range(args.runs)]
+    times, loaded, created = min(runs, key=lambda run: run[0][args.module][1])
+    total_ms = times[args.module][1] / 1000
+
+    print(f"import {args.module}: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, (self_us, _) in sorted(times.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import took {total_ms:.1f} ms, over the {args.budget_ms:.0f} ms budget")
+    heavy = sorted(name for name in loaded if name.split(".")[0] in FORBIDDEN_MODULES)
+    if heavy:
+        failures.append(f"imported report-only modules eagerly: {', '.join(heavy)}")
+    if created:
+        failures.append(f"import created files: {', '.join(created)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
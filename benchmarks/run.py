@@ -0,0 +1,209 @@
+# benchmarks/run.py
+"""Time the database helpers, reports and a scheduler tick on synthetic data.
+
+Usage:
+    python -m benchmarks.run --tasks 100000 --bills 20000 --output bench.json
+    python -m benchmarks.run --db bench.db --reuse --compare bench.json
+
+Results are written as JSON (seconds per run: min, median, max) together with the
+git commit and data volumes, so runs from different commits can be compared with
+``--compare``. The bot never talks to Telegram here: messages go to ``FakeBot``.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import config
+import database_connection
+from benchmarks.synthetic import TASHKENT_TZ, generate, use_database
+
+SEARCH_QUERIES = ("workout", "read book", "gym status:missed", "run 2024-01-01..2030-12-31", "study 17:00")
+REGRESSION_THRESHOLD = 1.25  # A median this many times slower than the baseline counts as a regression
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(timings):
+    return {
+        "runs": len(timings),
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "max": max(timings),
+    }
+
+
+async def timed(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await func()
+        timings.append(time.perf_counter() - started)
+    return summarize(timings)
+
+
+def load_bot_module():
+    """Build the app with a placeholder token and route its outbox to a FakeBot."""
+    import main
+    from fake_bot import FakeBot
+    from outbox import Outbox
+
+    main.create_app(token="123456:benchmark")  # aiogram only validates the token's shape
+    # Unthrottled, so the timings measure the bot rather than Telegram's rate limits
+    main.outbox = Outbox(FakeBot(), global_rate=1e9, global_burst=1e9, chat_rate=1e9, chat_burst=1e9, coalesce_delay=0)
+    return main
+
+
+async def run_benchmarks(repeat):
+    import database_async
+    from reminder_scheduler import ReminderScheduler
+    from report_cache import report_cache
+
+    main = load_bot_module()
+    chat_id = config.DEFAULT_CHAT_ID
+    await main.topics.load()
+    sender = asyncio.create_task(main.outbox.run())
+
+    async def delivered(coroutine):
+        await coroutine
+        await main.outbox.wait_empty(poll=0.001)
+
+    def uncached(report):
+        # Reports and chart images are cached after the first run; clear both so every
+        # run measures the queries and the rendering
+        async def run():
+            report_cache.clear()
+            chart_rendering = sys.modules.get("chart_rendering")  # Loaded by the first weekly report
+            if chart_rendering is not None:
+                chart_rendering.clear_cache()
+            await delivered(report(chat_id))
+        return run
+
+    async def search():
+        # The first page and the next one, as /search and its Next button read them
+        for query in SEARCH_QUERIES:
+            rows, more = await database_async.search_tasks_page(chat_id, query)
+            if more:
+                await database_async.search_tasks_page(chat_id, query, after=(rows[-1][4], rows[-1][0]))
+
+    async def scheduler_tick():
+        # Startup load plus firing every reminder that is due right now
+        scheduler = ReminderScheduler(main.outbox, main.topics)
+        now = datetime.now(TASHKENT_TZ)
+        await scheduler.load(now)
+        await asyncio.gather(*[
+            scheduler._fire(kind, task_chat, task_id, task_text)
+            for _, _, kind, task_chat, task_id, task_text in scheduler.pop_due(now)
+        ])
+        await main.outbox.wait_empty(poll=0.001)
+
+    results = {}
+    try:
+        results["get_pending_tasks"] = await timed(lambda: database_async.get_pending_tasks(chat_id), repeat)
+        results["search_tasks_page"] = await timed(search, repeat)
+        results["get_daily_response_times"] = await timed(lambda: database_async.get_daily_response_times(chat_id), repeat)
+        results["generate_daily_bills_report"] = await timed(uncached(main.generate_daily_bills_report), repeat)
+        results["generate_weekly_report"] = await timed(uncached(main.generate_weekly_report), repeat)
+        results["generate_weekly_report_cached"] = await timed(lambda: delivered(main.generate_weekly_report(chat_id)), repeat)
+        # Firing marks reminders as sent, so only the first tick has work to do
+        results["task_scheduler_tick"] = await timed(scheduler_tick, 1)
+    finally:
+        sender.cancel()
+        import chart_rendering
+        chart_rendering.shutdown()
+    return results
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Print median changes against a previous results file; return the names that regressed."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            print(f"{name:32} {current['median'] * 1000:10.2f} ms  (new)")
+            continue
+        ratio = current["median"] / previous["median"] if previous["median"] else float("inf")
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print(f"{name:32} {current['median'] * 1000:10.2f} ms  vs {previous['median'] * 1000:10.2f} ms  x{ratio:.2f}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="benchmark database file (default: a temporary file)")
+    parser.add_argument("--reuse", action="store_true", help="use the rows already in --db instead of generating")
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--bills", type=int, default=5000)
+    parser.add_argument("--chats", type=int, default=1)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare medians against")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    temporary = None
+    if not args.db:
+        temporary = tempfile.TemporaryDirectory()
+        args.db = os.path.join(temporary.name, "bench.db")
+    if os.path.abspath(args.db) == os.path.abspath(config.DB_NAME):
+        parser.error("refusing to benchmark against the bot's own database")
+
+    use_database(args.db)
+    if not args.reuse:
+        started = time.perf_counter()
+        generate(args.tasks, args.bills, args.chats, args.days, args.seed)
+        print(f"Generated {args.tasks} tasks and {args.bills} bills in {time.perf_counter() - started:.2f}s")
+    with database_connection.transaction() as cursor:
+        cursor.execute("SELECT (SELECT COUNT(*) FROM tasks), (SELECT COUNT(*) FROM bills)")
+        task_count, bill_count = cursor.fetchone()
+
+    try:
+        results = asyncio.run(run_benchmarks(args.repeat))
+    finally:
+        database_connection.close_connection()
+        if temporary:
+            temporary.cleanup()
+
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now(TASHKENT_TZ).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "data": {"tasks": task_count, "bills": bill_count, "chats": args.chats, "days": args.days, "seed": args.seed},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+    else:
+        for name, result in results.items():
+            print(f"{name:32} {result['median'] * 1000:10.2f} ms  (min {result['min'] * 1000:.2f}, max {result['max'] * 1000:.2f})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
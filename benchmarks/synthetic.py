@@ -0,0 +1,154 @@
+# benchmarks/synthetic.py
+"""Fill the tasks and bills tables with realistic synthetic history.
+
+Usage:
+    python -m benchmarks.synthetic bench.db --tasks 1000000 --bills 200000
+
+Rows are generated lazily and written with the importer's chunked writers, so
+millions of rows load with flat memory.
+"""
+import argparse
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+
+import pytz
+
+import database_connection
+from config import DEFAULT_CHAT_ID
+
+TASHKENT_TZ = pytz.timezone("Asia/Tashkent")
+CHUNK_SIZE = 10000
+
+ACTIVITIES = (
+    "Workout", "Gym", "Morning run", "Evening walk", "Read book", "Study Python", "Meditate",
+    "Breakfast", "Lunch", "Dinner", "Journal", "Call parents", "Clean room", "English lesson",
+    "Math homework", "Stretching", "Swimming", "Plan tomorrow", "Practice guitar", "Cook",
+)
+DETAILS = ("", "", "", " chapter", " session", " 30 min", " with friends", " outside", " notes")
+EXPENSES = ("Coffee", "Lunch", "Taxi", "Groceries", "Books", "Internet", "Gym pass", "Snacks", "Cinema")
+ADDITIONS = ("Freelance work", "Gift", "Refund", "Sold old phone")
+
+
+def chat_ids(chats):
+    return [DEFAULT_CHAT_ID - offset for offset in range(chats)]
+
+
+def random_task_time(rng):
+    # Most plans sit between 06:00 and 23:00, on five-minute marks
+    hour = min(23, max(5, int(rng.gauss(14, 4.5))))
+    return f"{hour:02d}:{rng.randrange(0, 60, 5):02d}"
+
+
+def task_rows(count, chats, days, seed=0, today=None):
+    """Yield tasks rows in the column order of ``importer.write_tasks``.
+
+    Past days are mostly completed (about 70%) or missed (about 25%) with log-normal
+    response times around ten minutes. Today's tasks are still pending and mostly
+    not yet notified.
+    """
+    rng = random.Random(seed)
+    today = today or datetime.now(TASHKENT_TZ).date()
+    owners = chat_ids(chats)
+    for index in range(count):
+        chat_id = owners[index % chats]
+        day = today - timedelta(days=int(days * (1 - (index + 1) / count)))
+        task = rng.choice(ACTIVITIES) + rng.choice(DETAILS)
+        task_time = random_task_time(rng)
+        hour, minute = map(int, task_time.split(":"))
+        scheduled = TASHKENT_TZ.localize(datetime(day.year, day.month, day.day, hour, minute))
+        notified_ts = int(scheduled.timestamp()) + rng.randrange(0, 5)
+        completed_ts = video_id = None
+        roll = rng.random()
+        if day == today:
+            status = "pending"
+            if roll < 0.7:
+                notified_ts = None
+        elif roll < 0.70:
+            status = "completed"
+            completed_ts = notified_ts + int(60 * min(40, math.exp(rng.gauss(math.log(10), 0.8))))
+            video_id = f"BAACAgIAAxkBAAI{index:08d}"
+        elif roll < 0.95:
+            status = "missed"
+        else:
+            status = "pending"
+            notified_ts = None
+        notified_day = day.isoformat() if notified_ts else None
+        yield (chat_id, index % 50 + 1, task, task_time, status, notified_ts, notified_day, video_id, completed_ts)
+
+
+def bill_rows(count, chats, days, seed=0, today=None):
+    """Yield bills rows in the column order of ``importer.write_bills``.
+
+    Every day starts with a 100 allowance; the rest are small log-normal expenses
+    and an occasional addition.
+    """
+    rng = random.Random(seed + 1)
+    today = today or datetime.now(TASHKENT_TZ).date()
+    owners = chat_ids(chats)
+    for index in range(count):
+        chat_id = owners[index % chats]
+        day = (today - timedelta(days=int(days * (1 - (index + 1) / count)))).isoformat()
+        roll = rng.random()
+        if index // chats % 10 == 0:
+            row = ("income", 100.0, "Morning allowance", "08:00")
+        elif roll < 0.9:
+            amount = round(min(90.0, math.exp(rng.gauss(math.log(6), 0.9))), 2)
+            row = ("expense", -amount, rng.choice(EXPENSES), f"{rng.randint(9, 22):02d}:{rng.randrange(60):02d}")
+        else:
+            row = ("income", float(rng.randint(5, 80)), rng.choice(ADDITIONS), f"{rng.randint(9, 22):02d}:{rng.randrange(60):02d}")
+        bill_type, amount, description, bill_time = row
+        yield (chat_id, index % 50 + 1, day, bill_type, amount, description, bill_time)
+
+
+def write_rows(rows, write, chunk_size=CHUNK_SIZE):
+    written = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return written
+        with database_connection.transaction() as cursor:
+            write(cursor, chunk)
+        written += len(chunk)
+
+
+def generate(tasks, bills, chats=1, days=365, seed=0):
+    """Append synthetic rows to the current database. Returns (tasks written, bills written)."""
+    from importer import write_bills, write_tasks
+
+    written_tasks = write_rows(task_rows(tasks, chats, days, seed), write_tasks)
+    written_bills = write_rows(bill_rows(bills, chats, days, seed), write_bills)
+    return written_tasks, written_bills
+
+
+def use_database(path):
+    """Point the shared connection at ``path`` and create or migrate its schema there."""
+    database_connection.close_connection()
+    database_connection.DB_NAME = path
+    from database_creation import init_db
+    init_db()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.synthetic", description=__doc__.splitlines()[0])
+    parser.add_argument("db", help="database file to fill; never point this at the bot's own database")
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--bills", type=int, default=5000)
+    parser.add_argument("--chats", type=int, default=1)
+    parser.add_argument("--days", type=int, default=365, help="span of history ending today")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    use_database(args.db)
+    started = time.perf_counter()
+    written = generate(args.tasks, args.bills, args.chats, args.days, args.seed)
+    database_connection.close_connection()
+    print(f"Generated {written[0]} tasks and {written[1]} bills in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
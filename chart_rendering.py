@@ -0,0 +1,80 @@
+# chart_rendering.py
+import asyncio
+import hashlib
+import io
+import json
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+CHART_WORKERS = 2
+CACHE_SIZE = 64  # Rendered PNGs kept in memory, keyed by a hash of their input
+
+_executor = None
+_cache = OrderedDict()
+
+
+def render_line_chart(labels, values, title, xlabel, ylabel, color="#FFA500"):
+    """Render a line chart to PNG bytes. Runs inside a worker process."""
+    # Imported here so the bot process never pays for matplotlib, and the OO Agg
+    # API keeps each figure independent instead of sharing pyplot's global state
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(6, 4))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.plot(labels, values, marker="o", linestyle="-", color=color)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    ax.tick_params(axis="x", labelrotation=45)
+    ax.grid(True, linestyle="--", alpha=0.7)  # Add grid for better readability
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    return buf.getvalue()
+
+
+def chart_cache_key(*parts):
+    return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=CHART_WORKERS)
+    return _executor
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def clear_cache():
+    _cache.clear()
+
+
+async def render_chart(labels, values, title, xlabel, ylabel):
+    key = chart_cache_key(labels, values, title, xlabel, ylabel)
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    loop = asyncio.get_running_loop()
+    png = await loop.run_in_executor(
+        _get_executor(), partial(render_line_chart, list(labels), list(values), title, xlabel, ylabel)
+    )
+    _cache[key] = png
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return png
+
+
+async def render_response_time_chart(dates, daily_averages):
+    return await render_chart(
+        dates, daily_averages, "Task Response Time Trend", "Date", "Avg Response Time (minutes)"
+    )
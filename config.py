@@ -1,2 +1,39 @@
 TOKEN = "YOUR_TELEGRAM_BOT_API"
 DB_NAME = "self_improvement.db"
+
+# Chat that owned all data before multi-chat support; existing rows are assigned to it
+DEFAULT_CHAT_ID = -1002265534780
+# Forum topic ids used by chats that have not configured their own with /topic
+DEFAULT_TOPICS = {"plans": 5, "results": 6, "bills": 3}
+
+# Webhook mode (python main.py --webhook). Telegram must be able to reach WEBHOOK_URL over HTTPS.
+WEBHOOK_URL = ""  # Public base URL, e.g. "https://bot.example.com"
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_SECRET = ""  # Optional; Telegram echoes it in X-Telegram-Bot-Api-Secret-Token
+WEBAPP_HOST = "0.0.0.0"
+WEBAPP_PORT = 8080
+
+# Logging and metrics
+LOG_LEVEL = "INFO"  # "DEBUG" also logs every parsed plan and incoming message
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s %(message)s"
+METRICS_ENABLED = False  # Record handler, SQL, scheduler and outbox timings
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108  # Prometheus text at http://METRICS_HOST:METRICS_PORT/metrics
+ADMIN_IDS = []  # Telegram user ids allowed to use /stats
+
+# Retention: finished tasks and bills older than ARCHIVE_AFTER_DAYS move to <DB_NAME>_archive.db
+ARCHIVE_AFTER_DAYS = 180  # At least 31; reports of the current month read the live tables only
+ARCHIVE_HOUR = 4  # Local hour of the daily archive run
+ARCHIVE_BATCH_SIZE = 500  # Rows moved per transaction
+
+# Schedulers run in the bot process unless it is started with --no-schedulers; then run
+# one or more `python worker.py`. Schedulers re-read pending tasks this often (seconds)
+# to pick up plans saved by other processes.
+SCHEDULER_POLL_INTERVAL = 10
+
+# Updates are handled by UPDATE_WORKERS concurrent workers in polling and webhook mode;
+# each chat topic's updates stay in order. Handlers are cancelled after HANDLER_TIMEOUT
+# seconds, or the per-handler value in HANDLER_TIMEOUTS.
+UPDATE_WORKERS = 4
+HANDLER_TIMEOUT = 30
+HANDLER_TIMEOUTS = {"handle_report_command": 120, "handle_export_command": 300}
@@ -1,111 +1,666 @@
 # database_actions.py
-import sqlite3
-from datetime import datetime
-from config import DB_NAME
+import re
+import time
+from datetime import datetime, timedelta
 import pytz
+from database_connection import ARCHIVE_SCHEMA, read_only_connection, transaction
+from report_cache import report_cache
 
-def save_task(task_text, time):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO tasks (task, time) VALUES (?, ?)",
-        (task_text, time)
-    )
-    conn.commit()
-    conn.close()
-
-def get_pending_tasks():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, task, time, notified_at FROM tasks WHERE status = 'pending'"
-    )
-    tasks = cursor.fetchall()
-    conn.close()
+TASHKENT_TZ = pytz.timezone("Asia/Tashkent")
+
+def parse_timestamp(value):
+    """Convert an epoch number or ISO string (old +04:37 offsets included) to UTC epoch seconds."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)) or str(value).isdigit():
+        return int(float(value))
+    parsed = datetime.fromisoformat(str(value).replace("+04:37", "+05:00"))
+    if parsed.tzinfo is None:
+        parsed = TASHKENT_TZ.localize(parsed)
+    return int(parsed.timestamp())
+
+def local_day(timestamp):
+    """Tashkent calendar date (YYYY-MM-DD) of a UTC epoch timestamp."""
+    return datetime.fromtimestamp(timestamp, TASHKENT_TZ).date().isoformat()
+
+def save_task(chat_id, user_id, task_text, time):
+    return save_tasks(chat_id, user_id, [(task_text, time)])[0]
+
+def save_tasks(chat_id, user_id, tasks):
+    """Insert ``(task_text, time)`` pairs in one transaction and return their ids in order."""
+    if not tasks:
+        return []
+    created_ts = int(time.time())  # The reminder is due at the first HH:MM after this
+    with transaction() as cursor:
+        cursor.executemany(
+            "INSERT INTO tasks (chat_id, user_id, task, time, created_ts) VALUES (?, ?, ?, ?, ?)",
+            [(chat_id, user_id, task, task_time, created_ts) for task, task_time in tasks]
+        )
+        # The write lock is held for the whole transaction, so the new ids are contiguous
+        cursor.execute("SELECT last_insert_rowid()")
+        last_id = cursor.fetchone()[0]
+    # Pending tasks are in no cached report; they invalidate once they are completed or missed
+    return list(range(last_id - len(tasks) + 1, last_id + 1))
+
+def get_pending_tasks(chat_id=None):
+    """Pending tasks of one chat, or of every chat when ``chat_id`` is None (scheduler startup)."""
+    with transaction() as cursor:
+        if chat_id is None:
+            cursor.execute(
+                "SELECT id, chat_id, task, time, notified_ts, created_ts FROM tasks WHERE status = 'pending'"
+            )
+        else:
+            cursor.execute(
+                "SELECT id, chat_id, task, time, notified_ts, created_ts FROM tasks WHERE chat_id = ? AND status = 'pending'",
+                (chat_id,)
+            )
+        tasks = cursor.fetchall()
     return tasks
 
-def mark_task_missed(task_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE tasks SET status = 'missed' WHERE id = ?",
-        (task_id,)
-    )
-    conn.commit()
-    conn.close()
-
-def mark_task_completed(task_id, video_id, completed_at):
-    TASHKENT_TZ = pytz.timezone("Asia/Tashkent")
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE tasks SET status = 'completed', video_id = ?, completed_at = ? WHERE id = ?",
-        (video_id, datetime.now(TASHKENT_TZ).isoformat(), task_id)
-    )
-    conn.commit()
-    conn.close()
-
-
-def save_task_video(task_name: str, task_time: str, video_id: str, completed_at: str):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
+def save_templates(chat_id, user_id, templates):
+    """Insert ``(task_text, time, rule)`` recurring templates in one transaction and return their ids.
+
+    A template the chat already has active is not added again; its existing id is returned.
+    """
+    ids = []
+    with transaction() as cursor:
+        for task, time, rule in templates:
+            cursor.execute(
+                "INSERT OR IGNORE INTO task_templates (chat_id, user_id, task, time, rule) VALUES (?, ?, ?, ?, ?)",
+                (chat_id, user_id, task, time, rule)
+            )
+            if cursor.rowcount:
+                ids.append(cursor.lastrowid)
+                continue
+            cursor.execute(
+                "SELECT id FROM task_templates WHERE chat_id = ? AND task = ? AND time = ? AND rule = ? AND active = 1",
+                (chat_id, task, time, rule)
+            )
+            ids.append(cursor.fetchone()[0])
+    return ids
+
+def get_active_templates(chat_id=None):
+    """Active templates of one chat, or of every chat when ``chat_id`` is None (scheduler startup)."""
+    with transaction() as cursor:
+        if chat_id is None:
+            cursor.execute(
+                "SELECT id, chat_id, task, time, rule, last_fired_day FROM task_templates WHERE active = 1"
+            )
+        else:
+            cursor.execute(
+                "SELECT id, chat_id, task, time, rule, last_fired_day FROM task_templates WHERE chat_id = ? AND active = 1 ORDER BY time, id",
+                (chat_id,)
+            )
+        templates = cursor.fetchall()
+    return templates
+
+def fire_template(chat_id, template_id, notified_ts):
+    """Create today's notified task for an active template; return (task_id, task, time, rule) or None.
+
+    Claiming the day on the template first makes a second firing for the same day
+    (after a restart, say) a no-op instead of a duplicate task.
+    """
+    day = local_day(notified_ts)
+    with transaction() as cursor:
+        cursor.execute("""
+            UPDATE task_templates SET last_fired_day = ?
+            WHERE id = ? AND chat_id = ? AND active = 1 AND (last_fired_day IS NULL OR last_fired_day < ?)
+            RETURNING user_id, task, time, rule
+        """, (day, template_id, chat_id, day))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        user_id, task, time, rule = row
+        cursor.execute("""
+            INSERT INTO tasks (chat_id, user_id, task, time, template_id, notified_ts, notified_day)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (chat_id, user_id, task, time, template_id, notified_ts, day))
+        task_id = cursor.lastrowid
+    return task_id, task, time, rule
+
+def stop_template(chat_id, template_id):
+    with transaction() as cursor:
+        cursor.execute(
+            "UPDATE task_templates SET active = 0 WHERE id = ? AND chat_id = ? AND active = 1",
+            (template_id, chat_id)
+        )
+        stopped = cursor.rowcount > 0
+    return stopped
+
+def mark_task_notified(chat_id, task_id, notified_ts):
+    """Claim a pending task's reminder; False if it was already sent (by another process) or the task is done."""
+    with transaction() as cursor:
+        cursor.execute(
+            "UPDATE tasks SET notified_ts = ?, notified_day = ? WHERE id = ? AND chat_id = ? AND status = 'pending' AND notified_ts IS NULL",
+            (notified_ts, local_day(notified_ts), task_id, chat_id)
+        )
+        claimed = cursor.rowcount > 0
+    return claimed
+
+def get_open_windows(chat_id, notified_after):
+    """Pending tasks of a chat notified after ``notified_after``: (id, task, notified_ts), oldest first."""
+    with transaction() as cursor:
+        cursor.execute(
+            "SELECT id, task, notified_ts FROM tasks WHERE chat_id = ? AND notified_ts > ? AND status = 'pending' ORDER BY notified_ts",
+            (chat_id, notified_after)
+        )
+        results = cursor.fetchall()
+    return results
+
+def bump_report_version(cursor, chat_id):
+    """Count a write to the chat's reports, so every process drops its cached copies (see report_cache)."""
     cursor.execute("""
-        INSERT INTO tasks (task, time, video_id, completed_at, status)
-        VALUES (?, ?, ?, ?, 'completed')
-    """, (task_name, task_time, video_id, completed_at))
-    
-    conn.commit()
-    conn.close()
-
-def get_latest_pending_task_id():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id FROM tasks WHERE status = 'pending' ORDER BY id DESC LIMIT 1"
-    )
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] if result else None
-
-def get_task_statistics():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT COUNT(*) FROM tasks WHERE status = 'completed'")
-    completed = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM tasks WHERE status = 'missed'")
-    missed = cursor.fetchone()[0]
-    
-    total = completed + missed
-    completion_rate = (completed / total * 100) if total > 0 else 0
-    
-    conn.close()
+        INSERT INTO report_versions (chat_id, version) VALUES (?, 1)
+        ON CONFLICT(chat_id) DO UPDATE SET version = version + 1
+        RETURNING version
+    """, (chat_id,))
+    return cursor.fetchone()[0]
+
+def sync_report_cache(chat_id=None):
+    """Drop cached reports of one chat (or all) that writes by other processes made stale."""
+    with transaction() as cursor:
+        if chat_id is None:
+            cursor.execute("SELECT chat_id, version FROM report_versions")
+            return report_cache.sync_all(dict(cursor.fetchall()))
+        cursor.execute("SELECT version FROM report_versions WHERE chat_id = ?", (chat_id,))
+        row = cursor.fetchone()
+    return report_cache.sync(chat_id, row[0] if row else 0)
+
+def mark_task_missed(chat_id, task_id):
+    with transaction() as cursor:
+        cursor.execute(
+            "UPDATE tasks SET status = 'missed' WHERE id = ? AND chat_id = ? AND status = 'pending' RETURNING notified_day",
+            (task_id, chat_id)
+        )
+        row = cursor.fetchone()
+        if row:
+            stored_version = bump_report_version(cursor, chat_id)
+    if row:
+        report_cache.invalidate(chat_id, [row[0]], stored_version)
+    return row is not None
+
+def mark_task_overdue(chat_id, task_id):
+    """Mark missed a pending task whose reminder was never sent; False if it has been sent since."""
+    with transaction() as cursor:
+        cursor.execute(
+            "UPDATE tasks SET status = 'missed' WHERE id = ? AND chat_id = ? AND status = 'pending' AND notified_ts IS NULL",
+            (task_id, chat_id)
+        )
+        missed = cursor.rowcount > 0
+        if missed:
+            stored_version = bump_report_version(cursor, chat_id)
+    if missed:
+        report_cache.invalidate(chat_id, [], stored_version)  # Never notified, so only all-time results count it
+    return missed
+
+def mark_task_completed(chat_id, task_id, video_id, completed_at):
+    completed_ts = int(time.time())
+    with transaction() as cursor:
+        cursor.execute(
+            "UPDATE tasks SET status = 'completed', video_id = ?, completed_ts = ? WHERE id = ? AND chat_id = ? AND status = 'pending' RETURNING notified_day",
+            (video_id, completed_ts, task_id, chat_id)
+        )
+        row = cursor.fetchone()
+        if row:
+            stored_version = bump_report_version(cursor, chat_id)
+    if row:
+        # Reports date a task by its notification day, or by its completion day if it was never notified
+        report_cache.invalidate(chat_id, [row[0] or local_day(completed_ts)], stored_version)
+    return row is not None  # False if the task was already marked missed
+
+
+def save_task_video(chat_id, user_id, task_name: str, task_time: str, video_id: str, completed_at: str):
+    completed_ts = int(time.time())
+    with transaction() as cursor:
+        cursor.execute("""
+            INSERT INTO tasks (chat_id, user_id, task, time, video_id, completed_ts, status)
+            VALUES (?, ?, ?, ?, ?, ?, 'completed')
+        """, (chat_id, user_id, task_name, task_time, video_id, completed_ts))
+        stored_version = bump_report_version(cursor, chat_id)
+    report_cache.invalidate(chat_id, [local_day(completed_ts)], stored_version)
+
+
+def get_task_statistics(chat_id):
+    key = ("task_statistics", chat_id)
+    sync_report_cache(chat_id)
+    cached = report_cache.get(key)
+    if cached is not None:
+        return cached
+    version = report_cache.version(chat_id)
+    with transaction() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM all_tasks WHERE chat_id = ? AND status = 'completed'", (chat_id,))
+        completed = cursor.fetchone()[0]
+
+        cursor.execute("SELECT COUNT(*) FROM all_tasks WHERE chat_id = ? AND status = 'missed'", (chat_id,))
+        missed = cursor.fetchone()[0]
+
+        total = completed + missed
+        completion_rate = (completed / total * 100) if total > 0 else 0
+
+    report_cache.put(key, (completed, missed, completion_rate), chat_id, version=version)
     return completed, missed, completion_rate
 
-def get_daily_response_times():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT date(notified_at), 
-               (strftime('%s', completed_at) - strftime('%s', notified_at)) / 60.0 AS response_time
-        FROM tasks 
-        WHERE completed_at IS NOT NULL 
-          AND notified_at IS NOT NULL
-          AND completed_at > notified_at  -- Ensure positive response times
-        ORDER BY date(notified_at)
-    """)
-    
-    data = cursor.fetchall()
-    conn.close()
-    
+def group_response_times(data):
     formatted_data = {}
     for date, response_minutes in data:
         if response_minutes is not None and response_minutes >= 0:
             if date not in formatted_data:
                 formatted_data[date] = []
             formatted_data[date].append(response_minutes)
+    return formatted_data
+
+def get_daily_response_times(chat_id):
+    with transaction() as cursor:
+        cursor.execute("""
+            SELECT notified_day, (completed_ts - notified_ts) / 60.0 AS response_time
+            FROM all_tasks
+            WHERE chat_id = ?
+              AND notified_day IS NOT NULL
+              AND completed_ts > notified_ts  -- Ensure positive response times
+            ORDER BY notified_day
+        """, (chat_id,))
+
+        data = cursor.fetchall()
+    
+    return group_response_times(data)
+
+def get_response_times_between(chat_id, start_date, end_date):
+    with transaction() as cursor:
+        cursor.execute("""
+            SELECT notified_day, (completed_ts - notified_ts) / 60.0 AS response_time
+            FROM all_tasks
+            WHERE chat_id = ?
+              AND notified_day BETWEEN ? AND ?
+              AND completed_ts > notified_ts
+            ORDER BY notified_day
+        """, (chat_id, start_date, end_date))
+
+        data = cursor.fetchall()
+    
+    return group_response_times(data)
+
+def get_response_times_by_chat(start_date, end_date):
+    """Response times of every chat between two dates in one query: ``{chat_id: {date: [minutes]}}``."""
+    with transaction() as cursor:
+        cursor.execute("""
+            SELECT chat_id, notified_day, (completed_ts - notified_ts) / 60.0 AS response_time
+            FROM all_tasks
+            WHERE notified_day BETWEEN ? AND ?
+              AND completed_ts > notified_ts
+            ORDER BY chat_id, notified_day
+        """, (start_date, end_date))
+
+        data = cursor.fetchall()
     
-    return formatted_data
\ No newline at end of file
+    by_chat = {}
+    for chat_id, date, response_minutes in data:
+        by_chat.setdefault(chat_id, []).append((date, response_minutes))
+    return {chat_id: group_response_times(rows) for chat_id, rows in by_chat.items()}
+
+def add_to_bills_daily(cursor, rows):
+    """Fold ``(chat_id, date, amount)`` rows into the bills_daily rollup, one upsert per chat and date."""
+    totals = {}
+    for chat_id, date, amount in rows:
+        income, expenses, income_count, expense_count = totals.get((chat_id, date), (0, 0, 0, 0))
+        if amount > 0:
+            income, income_count = income + amount, income_count + 1
+        elif amount < 0:
+            expenses, expense_count = expenses - amount, expense_count + 1
+        totals[(chat_id, date)] = (income, expenses, income_count, expense_count)
+    cursor.executemany("""
+        INSERT INTO bills_daily (chat_id, date, income, expenses, income_count, expense_count, balance)
+        VALUES (?, ?, ?, ?, ?, ?, ? - ?)
+        ON CONFLICT(chat_id, date) DO UPDATE SET
+            income = income + excluded.income,
+            expenses = expenses + excluded.expenses,
+            income_count = income_count + excluded.income_count,
+            expense_count = expense_count + excluded.expense_count,
+            balance = balance + excluded.balance
+    """, [(*key, *values, values[0], values[1]) for key, values in totals.items()])
+
+def save_bills(chat_id, user_id, date, bills):
+    """Insert ``(type, amount, description, time)`` rows of one day and fold them into the rollup in one transaction."""
+    if not bills:
+        return 0
+    with transaction() as cursor:
+        cursor.executemany("""
+            INSERT INTO bills (chat_id, user_id, date, type, amount, description, time)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(chat_id, user_id, date, *bill) for bill in bills])
+        add_to_bills_daily(cursor, [(chat_id, date, amount) for _, amount, _, _ in bills])
+        stored_version = bump_report_version(cursor, chat_id)
+    report_cache.invalidate(chat_id, [date], stored_version)
+    return len(bills)
+
+def save_bill(chat_id, user_id, date, bill_type, amount, description, time):
+    save_bills(chat_id, user_id, date, [(bill_type, amount, description, time)])
+
+def get_daily_bills(chat_id, date):
+    with transaction() as cursor:
+        cursor.execute("""
+            SELECT type, amount, description, time 
+            FROM bills 
+            WHERE date = ? AND chat_id = ?
+            ORDER BY time
+        """, (date, chat_id))
+        results = cursor.fetchall()
+    return results
+
+def get_yesterday_bills(chat_id):
+    yesterday = (datetime.now(TASHKENT_TZ).date() - timedelta(days=1)).isoformat()
+    return get_daily_bills(chat_id, yesterday)
+
+def get_bills_by_chat(date):
+    """Every chat's bills for one date in one query: ``{chat_id: [(type, amount, description, time)]}``."""
+    with transaction() as cursor:
+        cursor.execute("""
+            SELECT chat_id, type, amount, description, time 
+            FROM bills 
+            WHERE date = ?
+            ORDER BY chat_id, time
+        """, (date,))
+        results = cursor.fetchall()
+    by_chat = {}
+    for chat_id, *bill in results:
+        by_chat.setdefault(chat_id, []).append(tuple(bill))
+    return by_chat
+
+def get_bills_summary(chat_id, date):
+    with transaction() as cursor:
+        cursor.execute("""
+            SELECT income, expenses, income_count, expense_count, balance
+            FROM bills_daily
+            WHERE chat_id = ? AND date = ?
+        """, (chat_id, date))
+        result = cursor.fetchone()
+    return result
+
+def get_bills_summaries_by_chat(date):
+    """Rollup rows of every chat for one date: ``{chat_id: (income, expenses, income_count, expense_count, balance)}``."""
+    with transaction() as cursor:
+        cursor.execute("""
+            SELECT chat_id, income, expenses, income_count, expense_count, balance
+            FROM bills_daily
+            WHERE date = ?
+        """, (date,))
+        results = cursor.fetchall()
+    return {chat_id: tuple(summary) for chat_id, *summary in results}
+
+def get_bills_range(chat_id, start_date, end_date, by_month=False):
+    """Totals per day (or per month) between two dates with a running balance, read from the rollup."""
+    period = "substr(date, 1, 7)" if by_month else "date"
+    with transaction() as cursor:
+        cursor.execute(f"""
+            SELECT {period} AS period,
+                   SUM(income), SUM(expenses), SUM(income_count), SUM(expense_count), SUM(balance),
+                   SUM(SUM(balance)) OVER (ORDER BY {period}) AS running_balance
+            FROM bills_daily
+            WHERE chat_id = ? AND date BETWEEN ? AND ?
+            GROUP BY period
+            ORDER BY period
+        """, (chat_id, start_date, end_date))
+        results = cursor.fetchall()
+    return results
+
+def get_chat_topics():
+    with transaction() as cursor:
+        cursor.execute("SELECT chat_id, role, thread_id FROM chat_topics")
+        results = cursor.fetchall()
+    return results
+
+def set_chat_topic(chat_id, role, thread_id):
+    with transaction() as cursor:
+        cursor.execute("""
+            INSERT INTO chat_topics (chat_id, role, thread_id) VALUES (?, ?, ?)
+            ON CONFLICT(chat_id, role) DO UPDATE SET thread_id = excluded.thread_id
+        """, (chat_id, role, thread_id))
+
+SEARCH_COLUMNS = "t.id, t.task, t.time, t.status, t.notified_ts, t.video_id, t.completed_ts"
+TASK_STATUSES = ("pending", "completed", "missed")
+
+_STATUS_RE = re.compile(r"\bstatus:(\w+)", re.IGNORECASE)
+_DATE_RANGE_RE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\.\.(\d{4}-\d{2}-\d{2})\b")
+_DATE_RE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+_TIME_RE = re.compile(r"\b(\d{1,2}:\d{2})\b")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+def parse_search_query(query):
+    """Split a /search query into FTS terms and filters.
+
+    Supports free words (prefix-matched, all must appear), ``HH:MM``, ``YYYY-MM-DD``,
+    ``YYYY-MM-DD..YYYY-MM-DD`` and ``status:pending|completed|missed`` in any order,
+    e.g. ``Workout 17:00``, ``Workout:17:00`` or ``gym run 2025-02-01..2025-02-18 status:missed``.
+    """
+    filters = {"time": None, "start_date": None, "end_date": None, "status": None}
+
+    def take_status(match):
+        if match.group(1).lower() in TASK_STATUSES:
+            filters["status"] = match.group(1).lower()
+        return " "
+
+    def take_range(match):
+        filters["start_date"], filters["end_date"] = sorted(match.groups())
+        return " "
+
+    def take_date(match):
+        filters["start_date"] = filters["end_date"] = match.group(1)
+        return " "
+
+    def take_time(match):
+        try:
+            filters["time"] = datetime.strptime(match.group(1), "%H:%M").strftime("%H:%M")
+        except ValueError:
+            return match.group(0)
+        return " "
+
+    rest = _STATUS_RE.sub(take_status, query)
+    rest = _DATE_RANGE_RE.sub(take_range, rest)
+    rest = _DATE_RE.sub(take_date, rest)
+    rest = _TIME_RE.sub(take_time, rest)
+    for key in ("start_date", "end_date"):
+        if filters[key]:
+            try:
+                datetime.strptime(filters[key], "%Y-%m-%d")
+            except ValueError:
+                filters["start_date"] = filters["end_date"] = None
+    return _WORD_RE.findall(rest), filters
+
+SEARCH_SCHEMAS = ("main", ARCHIVE_SCHEMA)  # Live tasks first, then archived ones
+
+def build_search_filters(chat_id, terms, filters, schema="main"):
+    """Return the FROM/WHERE clause and parameters shared by the search queries."""
+    clauses, params = ["t.chat_id = ?"], [chat_id]
+    if terms:
+        source = f"{schema}.tasks_fts JOIN {schema}.tasks t ON t.id = tasks_fts.rowid"
+        clauses.append("tasks_fts MATCH ?")
+        params.append(" ".join('"' + term.replace('"', '""') + '"*' for term in terms))
+    else:
+        source = f"{schema}.tasks t"
+    if filters["time"]:
+        clauses.append("t.time = ?")
+        params.append(filters["time"])
+    if filters["start_date"]:
+        clauses.append("t.notified_day BETWEEN ? AND ?")
+        params.extend([filters["start_date"], filters["end_date"]])
+    if filters["status"]:
+        clauses.append("t.status = ?")
+        params.append(filters["status"])
+    where = " AND ".join(clauses)
+    return source, where, params
+
+SEARCH_PAGE_SIZE = 10
+
+def search_tasks_page(chat_id, query, after=None, limit=SEARCH_PAGE_SIZE):
+    """Return one page of matches ordered by (notified_ts, id) descending, and whether more follow.
+
+    ``after`` is the ``(notified_ts, id)`` key of the last row of the previous page, so each
+    page is a single index range read no matter how deep the user pages. The live and
+    archived tables are read the same way and their pages merged.
+    """
+    terms, filters = parse_search_query(query)
+    if not terms and not any(filters.values()):
+        return [], False
+    results = []
+    with transaction() as cursor:
+        for schema in SEARCH_SCHEMAS:
+            source, where, params = build_search_filters(chat_id, terms, filters, schema)
+            if after:
+                notified_ts, task_id = after
+                if notified_ts is None:
+                    # NULLs sort last in descending order, so only older unnotified rows remain
+                    where += " AND t.notified_ts IS NULL AND t.id < ?"
+                    params.append(task_id)
+                else:
+                    where += " AND (t.notified_ts < ? OR t.notified_ts IS NULL OR (t.notified_ts = ? AND t.id < ?))"
+                    params.extend([notified_ts, notified_ts, task_id])
+            cursor.execute(f"""
+                SELECT {SEARCH_COLUMNS} FROM {source}
+                WHERE {where}
+                ORDER BY t.notified_ts DESC, t.id DESC
+                LIMIT ?
+            """, params + [limit + 1])
+            results += cursor.fetchall()
+    # Same order as the queries: notified_ts descending with NULLs last, then id descending
+    results.sort(key=lambda row: (row[4] is not None, row[4] or 0, row[0]), reverse=True)
+    return results[:limit], len(results) > limit
+
+def get_task(chat_id, task_id):
+    with transaction() as cursor:
+        cursor.execute(
+            "SELECT id, task, time, status, notified_ts, video_id, completed_ts FROM all_tasks WHERE id = ? AND chat_id = ?",
+            (task_id, chat_id)
+        )
+        result = cursor.fetchone()
+    return result
+
+def add_outbox_message(chat_id, thread_id, kind, text, photo=None, coalesce_key=None, owner=None):
+    with transaction() as cursor:
+        cursor.execute("""
+            INSERT INTO outbox (chat_id, thread_id, kind, text, photo, coalesce_key, created_ts, owner)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (chat_id, thread_id, kind, text, photo, coalesce_key, int(time.time()), owner))
+        message_id = cursor.lastrowid
+    return message_id
+
+def update_outbox_text(message_id, text):
+    with transaction() as cursor:
+        cursor.execute("UPDATE outbox SET text = ? WHERE id = ?", (text, message_id))
+
+def record_outbox_attempt(message_id):
+    with transaction() as cursor:
+        cursor.execute("UPDATE outbox SET attempts = attempts + 1 WHERE id = ?", (message_id,))
+
+def delete_outbox_message(message_id):
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM outbox WHERE id = ?", (message_id,))
+
+def claim_outbox_messages(owner, now):
+    """Take over messages whose owner is gone (no live lease) and return them in id order."""
+    with transaction() as cursor:
+        cursor.execute("""
+            UPDATE outbox SET owner = ?
+            WHERE owner IS NULL
+               OR owner NOT IN (SELECT holder FROM leases WHERE name LIKE 'instance:%' AND expires_ts > ?)
+            RETURNING id, chat_id, thread_id, kind, text, photo, coalesce_key, attempts
+        """, (owner, now))
+        results = cursor.fetchall()
+    return sorted(results)
+
+def renew_lease(name, holder, expires_ts, now):
+    """Take or extend a lease; False while another holder's lease is unexpired."""
+    with transaction() as cursor:
+        cursor.execute("""
+            INSERT INTO leases (name, holder, expires_ts) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_ts = excluded.expires_ts
+            WHERE leases.holder = excluded.holder OR leases.expires_ts <= ?
+        """, (name, holder, expires_ts, now))
+        renewed = cursor.rowcount > 0
+    return renewed
+
+def release_lease(name, holder):
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+
+def count_other_instances(holder, now):
+    with transaction() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*) FROM leases WHERE name LIKE 'instance:%' AND holder != ? AND expires_ts > ?",
+            (holder, now)
+        )
+        count = cursor.fetchone()[0]
+    return count
+
+def claim_scheduler_run(job, period, holder, now):
+    """True for the first process to claim ``job`` for ``period``; False for every later one."""
+    with transaction() as cursor:
+        cursor.execute(
+            "INSERT OR IGNORE INTO scheduler_runs (job, period, holder, claimed_ts) VALUES (?, ?, ?, ?)",
+            (job, period, holder, now)
+        )
+        claimed = cursor.rowcount > 0
+    return claimed
+
+def get_fsm_record(chat, user, now):
+    with transaction() as cursor:
+        cursor.execute("""
+            SELECT state, data, bucket, expires_ts
+            FROM fsm_storage
+            WHERE chat = ? AND user = ? AND expires_ts > ?
+        """, (chat, user, now))
+        result = cursor.fetchone()
+    return result
+
+def save_fsm_records(records, deleted):
+    """Upsert ``(chat, user, state, data, bucket, expires_ts)`` rows and delete ``(chat, user)`` keys in one transaction."""
+    with transaction() as cursor:
+        cursor.executemany("""
+            INSERT INTO fsm_storage (chat, user, state, data, bucket, expires_ts)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(chat, user) DO UPDATE SET
+                state = excluded.state, data = excluded.data,
+                bucket = excluded.bucket, expires_ts = excluded.expires_ts
+        """, records)
+        cursor.executemany("DELETE FROM fsm_storage WHERE chat = ? AND user = ?", deleted)
+
+def delete_expired_fsm_records(now):
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM fsm_storage WHERE expires_ts <= ?", (now,))
+        deleted = cursor.rowcount
+    return deleted
+
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_COLUMNS = {
+    "tasks": ("id", "chat_id", "user_id", "task", "time", "status", "notified_ts", "notified_day", "video_id", "completed_ts"),
+    "bills": ("id", "chat_id", "user_id", "date", "type", "amount", "description", "time"),
+}
+
+def day_start_ts(date):
+    """UTC epoch of local midnight at the start of a YYYY-MM-DD date."""
+    return int(TASHKENT_TZ.localize(datetime.strptime(date, "%Y-%m-%d")).timestamp())
+
+def iter_export_rows(kind, chat_id, start_date=None, end_date=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of up to ``chunk_size`` rows (columns as in EXPORT_COLUMNS) in id order.
+
+    Tasks are dated by the day they were notified, or completed if they never were;
+    tasks with neither are only included when no range is given. Archived rows come
+    first, then the live ones; each part is in id order.
+    """
+    columns = ", ".join(EXPORT_COLUMNS[kind])
+    clauses, params = ["chat_id = ?"], [chat_id]
+    if start_date and end_date:
+        if kind == "tasks":
+            clauses.append("(notified_day BETWEEN ? AND ? OR (notified_day IS NULL AND completed_ts >= ? AND completed_ts < ?))")
+            end_ts = day_start_ts(end_date) + 24 * 60 * 60
+            params += [start_date, end_date, day_start_ts(start_date), end_ts]
+        else:
+            clauses.append("date BETWEEN ? AND ?")
+            params += [start_date, end_date]
+    with read_only_connection() as conn:
+        schemas = [row[1] for row in conn.execute("PRAGMA database_list") if row[1] == ARCHIVE_SCHEMA] + ["main"]
+        for schema in schemas:
+            cursor = conn.execute(f"SELECT {columns} FROM {schema}.{kind} WHERE {' AND '.join(clauses)} ORDER BY id", params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
@@ -0,0 +1,146 @@
+# database_async.py
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import database_actions
+
+# All SQLite work runs on one dedicated thread so the event loop never waits on
+# a query or a lock, and writes stay serialized the same way they were before.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+
+async def run_db(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+
+
+def shutdown():
+    _executor.shutdown(wait=True)
+
+
+async def sync_report_cache(chat_id=None):
+    return await run_db(database_actions.sync_report_cache, chat_id)
+
+async def save_task(chat_id, user_id, task_text, time):
+    return await run_db(database_actions.save_task, chat_id, user_id, task_text, time)
+
+async def save_tasks(chat_id, user_id, tasks):
+    return await run_db(database_actions.save_tasks, chat_id, user_id, tasks)
+
+async def get_pending_tasks(chat_id=None):
+    return await run_db(database_actions.get_pending_tasks, chat_id)
+
+async def save_templates(chat_id, user_id, templates):
+    return await run_db(database_actions.save_templates, chat_id, user_id, templates)
+
+async def get_active_templates(chat_id=None):
+    return await run_db(database_actions.get_active_templates, chat_id)
+
+async def fire_template(chat_id, template_id, notified_ts):
+    return await run_db(database_actions.fire_template, chat_id, template_id, notified_ts)
+
+async def stop_template(chat_id, template_id):
+    return await run_db(database_actions.stop_template, chat_id, template_id)
+
+async def mark_task_notified(chat_id, task_id, notified_ts):
+    return await run_db(database_actions.mark_task_notified, chat_id, task_id, notified_ts)
+
+async def get_open_windows(chat_id, notified_after):
+    return await run_db(database_actions.get_open_windows, chat_id, notified_after)
+
+async def mark_task_missed(chat_id, task_id):
+    return await run_db(database_actions.mark_task_missed, chat_id, task_id)
+
+async def mark_task_overdue(chat_id, task_id):
+    return await run_db(database_actions.mark_task_overdue, chat_id, task_id)
+
+async def mark_task_completed(chat_id, task_id, video_id, completed_at):
+    return await run_db(database_actions.mark_task_completed, chat_id, task_id, video_id, completed_at)
+
+async def save_task_video(chat_id, user_id, task_name: str, task_time: str, video_id: str, completed_at: str):
+    return await run_db(database_actions.save_task_video, chat_id, user_id, task_name, task_time, video_id, completed_at)
+
+async def get_task_statistics(chat_id):
+    return await run_db(database_actions.get_task_statistics, chat_id)
+
+async def get_daily_response_times(chat_id):
+    return await run_db(database_actions.get_daily_response_times, chat_id)
+
+async def get_response_times_between(chat_id, start_date, end_date):
+    return await run_db(database_actions.get_response_times_between, chat_id, start_date, end_date)
+
+async def get_response_times_by_chat(start_date, end_date):
+    return await run_db(database_actions.get_response_times_by_chat, start_date, end_date)
+
+async def save_bills(chat_id, user_id, date, bills):
+    return await run_db(database_actions.save_bills, chat_id, user_id, date, bills)
+
+async def save_bill(chat_id, user_id, date, bill_type, amount, description, time):
+    return await run_db(database_actions.save_bill, chat_id, user_id, date, bill_type, amount, description, time)
+
+async def get_daily_bills(chat_id, date):
+    return await run_db(database_actions.get_daily_bills, chat_id, date)
+
+async def get_yesterday_bills(chat_id):
+    return await run_db(database_actions.get_yesterday_bills, chat_id)
+
+async def get_bills_by_chat(date):
+    return await run_db(database_actions.get_bills_by_chat, date)
+
+async def get_bills_summary(chat_id, date):
+    return await run_db(database_actions.get_bills_summary, chat_id, date)
+
+async def get_bills_summaries_by_chat(date):
+    return await run_db(database_actions.get_bills_summaries_by_chat, date)
+
+async def get_bills_range(chat_id, start_date, end_date, by_month=False):
+    return await run_db(database_actions.get_bills_range, chat_id, start_date, end_date, by_month)
+
+async def get_chat_topics():
+    return await run_db(database_actions.get_chat_topics)
+
+async def set_chat_topic(chat_id, role, thread_id):
+    return await run_db(database_actions.set_chat_topic, chat_id, role, thread_id)
+
+async def search_tasks_page(chat_id, query, after=None, limit=database_actions.SEARCH_PAGE_SIZE):
+    return await run_db(database_actions.search_tasks_page, chat_id, query, after, limit)
+
+async def get_task(chat_id, task_id):
+    return await run_db(database_actions.get_task, chat_id, task_id)
+
+async def add_outbox_message(chat_id, thread_id, kind, text, photo=None, coalesce_key=None, owner=None):
+    return await run_db(database_actions.add_outbox_message, chat_id, thread_id, kind, text, photo, coalesce_key, owner)
+
+async def update_outbox_text(message_id, text):
+    return await run_db(database_actions.update_outbox_text, message_id, text)
+
+async def record_outbox_attempt(message_id):
+    return await run_db(database_actions.record_outbox_attempt, message_id)
+
+async def delete_outbox_message(message_id):
+    return await run_db(database_actions.delete_outbox_message, message_id)
+
+async def claim_outbox_messages(owner, now):
+    return await run_db(database_actions.claim_outbox_messages, owner, now)
+
+async def renew_lease(name, holder, expires_ts, now):
+    return await run_db(database_actions.renew_lease, name, holder, expires_ts, now)
+
+async def release_lease(name, holder):
+    return await run_db(database_actions.release_lease, name, holder)
+
+async def count_other_instances(holder, now):
+    return await run_db(database_actions.count_other_instances, holder, now)
+
+async def claim_scheduler_run(job, period, holder, now):
+    return await run_db(database_actions.claim_scheduler_run, job, period, holder, now)
+
+async def get_fsm_record(chat, user, now):
+    return await run_db(database_actions.get_fsm_record, chat, user, now)
+
+async def save_fsm_records(records, deleted):
+    return await run_db(database_actions.save_fsm_records, records, deleted)
+
+async def delete_expired_fsm_records(now):
+    return await run_db(database_actions.delete_expired_fsm_records, now)
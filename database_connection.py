@@ -0,0 +1,106 @@
+# database_connection.py
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from config import DB_NAME
+import metrics
+
+# Applied once when the process-wide connection is opened
+PRAGMAS = (
+    "PRAGMA auto_vacuum = INCREMENTAL",  # Only takes effect on a new database; see retention.py
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",  # Safe with WAL; only the last commit can be lost on power failure
+    "PRAGMA cache_size = -16000",  # 16 MB page cache
+    "PRAGMA mmap_size = 268435456",  # 256 MB memory-mapped reads
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+# Finished tasks and old bills are moved to this attached database by retention.py.
+# Readers that span a chat's whole history use the all_tasks view over both.
+ARCHIVE_SCHEMA = "archive"
+ARCHIVED_COLUMNS = {
+    "tasks": ("id", "chat_id", "user_id", "task", "time", "status", "notified_ts", "notified_day",
+              "video_id", "completed_ts", "template_id"),
+    "bills": ("id", "chat_id", "user_id", "date", "type", "amount", "description", "time"),
+}
+
+_connection = None
+_lock = threading.RLock()
+
+
+def archive_path():
+    path = Path(DB_NAME)
+    return path.with_name(f"{path.stem}_archive{path.suffix}")
+
+
+def create_archive_view(db, archived=True):
+    """(Re)create the all_tasks view; ``db`` is a connection or cursor."""
+    columns = ", ".join(ARCHIVED_COLUMNS["tasks"])
+    union = f" UNION ALL SELECT {columns} FROM {ARCHIVE_SCHEMA}.tasks" if archived else ""
+    db.execute("DROP VIEW IF EXISTS temp.all_tasks")
+    db.execute(f"CREATE TEMP VIEW all_tasks AS SELECT {columns} FROM main.tasks{union}")
+
+
+def attach_archive(conn, read_only=False):
+    archive = archive_path()
+    if read_only and not archive.exists():
+        create_archive_view(conn, archived=False)  # Nothing has been archived yet
+        return
+    # Read-only connections are opened with uri=True, so the archive is attached read-only too
+    target = archive.resolve().as_uri() + "?mode=ro" if read_only else str(archive)
+    conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (target,))
+    create_archive_view(conn)
+
+
+def get_connection():
+    global _connection
+    with _lock:
+        if _connection is None:
+            _connection = sqlite3.connect(DB_NAME, check_same_thread=False)
+            for pragma in PRAGMAS:
+                _connection.execute(pragma)
+            attach_archive(_connection)
+        return _connection
+
+
+def close_connection():
+    global _connection
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+            _connection = None
+
+
+@contextmanager
+def transaction():
+    """Yield a cursor on the shared connection; commit on success, roll back on error."""
+    with _lock:
+        conn = get_connection()
+        if not metrics.enabled:
+            with conn:
+                yield conn.cursor()
+            return
+        cursor = metrics.InstrumentedCursor(conn.cursor())
+        try:
+            with conn:
+                yield cursor
+        finally:
+            cursor.finish()
+
+
+@contextmanager
+def read_only_connection():
+    """Private read-only connection for long scans such as exports.
+
+    It does not take the shared lock, and WAL gives it a consistent snapshot while
+    the bot keeps writing through the shared connection.
+    """
+    conn = sqlite3.connect(Path(DB_NAME).resolve().as_uri() + "?mode=ro", uri=True, check_same_thread=False)
+    try:
+        conn.execute("PRAGMA busy_timeout = 5000")
+        attach_archive(conn, read_only=True)
+        yield conn
+    finally:
+        conn.close()
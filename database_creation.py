@@ -1,30 +1,345 @@
 # database_creation.py
-import sqlite3
-from config import DB_NAME
+import logging
+from datetime import datetime
+import pytz
+from config import DEFAULT_CHAT_ID
+from database_connection import ARCHIVE_SCHEMA, close_connection, create_archive_view, transaction
+
+logger = logging.getLogger(__name__)
+
+TASHKENT_TZ = pytz.timezone("Asia/Tashkent")
 
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    
-    # Existing tasks table
-    c.execute('''CREATE TABLE IF NOT EXISTS tasks (
-                 id INTEGER PRIMARY KEY AUTOINCREMENT,  -- Changed to AUTOINCREMENT for consistency
-                 task TEXT NOT NULL,
-                 time TEXT NOT NULL,
-                 status TEXT DEFAULT 'pending',
-                 notified_at TEXT DEFAULT NULL,
-                 video_id TEXT DEFAULT NULL,
-                 completed_at TEXT DEFAULT NULL)''')
-    
-    # New bills table for tracking daily transactions
-    c.execute('''CREATE TABLE IF NOT EXISTS bills (
+    init_archive()
+    if get_schema_version() == SCHEMA_VERSION:
+        return  # Already current; skip the CREATE TABLE checks and migration scan
+    with transaction() as c:
+        # Existing tasks table
+        c.execute('''CREATE TABLE IF NOT EXISTS tasks (
+                     id INTEGER PRIMARY KEY AUTOINCREMENT,  -- Changed to AUTOINCREMENT for consistency
+                     task TEXT NOT NULL,
+                     time TEXT NOT NULL,
+                     status TEXT DEFAULT 'pending',
+                     notified_at TEXT DEFAULT NULL,
+                     video_id TEXT DEFAULT NULL,
+                     completed_at TEXT DEFAULT NULL)''')
+
+        # New bills table for tracking daily transactions
+        c.execute('''CREATE TABLE IF NOT EXISTS bills (
+                     id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     date TEXT NOT NULL,  -- Date of the transaction (YYYY-MM-DD)
+                     type TEXT NOT NULL,  -- 'income', 'expense', or 'addition'
+                     amount REAL NOT NULL,  -- Amount of money (positive for income/addition, negative for expense)
+                     description TEXT,  -- Description or reason for the transaction
+                     time TEXT NOT NULL  -- Time of the transaction (HH:MM)
+                     )''')
+
+    migrate()
+
+# Schema migrations. Each entry upgrades the database from the previous version;
+# the current version is stored in PRAGMA user_version, so every step runs exactly once.
+def _add_core_indexes(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_id ON tasks(status, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_notified_at ON tasks(notified_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bills_date_time ON bills(date, time)")
+
+def _add_tasks_fts(c):
+    # External-content FTS5 index over tasks.task, kept in sync by triggers
+    c.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+                 task, content='tasks', content_rowid='id',
+                 tokenize='unicode61 remove_diacritics 2')""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+                     INSERT INTO tasks_fts(rowid, task) VALUES (new.id, new.task);
+                 END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+                     INSERT INTO tasks_fts(tasks_fts, rowid, task) VALUES ('delete', old.id, old.task);
+                 END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF task ON tasks BEGIN
+                     INSERT INTO tasks_fts(tasks_fts, rowid, task) VALUES ('delete', old.id, old.task);
+                     INSERT INTO tasks_fts(rowid, task) VALUES (new.id, new.task);
+                 END""")
+    c.execute("INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')")
+
+def _add_bills_daily(c):
+    # Per-day rollup of bills, maintained by save_bills in the same transaction as the insert
+    c.execute("""CREATE TABLE IF NOT EXISTS bills_daily (
+                 date TEXT PRIMARY KEY,  -- YYYY-MM-DD
+                 income REAL NOT NULL DEFAULT 0,  -- Sum of positive amounts
+                 expenses REAL NOT NULL DEFAULT 0,  -- Sum of negative amounts, stored as a positive number
+                 income_count INTEGER NOT NULL DEFAULT 0,
+                 expense_count INTEGER NOT NULL DEFAULT 0,
+                 balance REAL NOT NULL DEFAULT 0  -- income - expenses
+                 ) WITHOUT ROWID""")
+    c.execute("""INSERT OR REPLACE INTO bills_daily (date, income, expenses, income_count, expense_count, balance)
+                 SELECT date,
+                        COALESCE(SUM(CASE WHEN amount > 0 THEN amount END), 0),
+                        COALESCE(SUM(CASE WHEN amount < 0 THEN -amount END), 0),
+                        COUNT(CASE WHEN amount > 0 THEN 1 END),
+                        COUNT(CASE WHEN amount < 0 THEN 1 END),
+                        COALESCE(SUM(amount), 0)
+                 FROM bills GROUP BY date""")
+
+def _parse_legacy_timestamp(value):
+    # Older rows carry a bogus +04:37 offset (pytz LMT); completed_at may also be a bare HH:MM
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("+04:37", "+05:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = TASHKENT_TZ.localize(parsed)
+    return parsed
+
+def _add_epoch_timestamps(c):
+    # notified_at/completed_at (ISO text) are legacy and no longer written; the integer UTC
+    # epoch columns and the local notified_day key replace them
+    c.execute("ALTER TABLE tasks ADD COLUMN notified_ts INTEGER DEFAULT NULL")  # UTC epoch seconds
+    c.execute("ALTER TABLE tasks ADD COLUMN completed_ts INTEGER DEFAULT NULL")  # UTC epoch seconds
+    c.execute("ALTER TABLE tasks ADD COLUMN notified_day TEXT DEFAULT NULL")  # Tashkent date (YYYY-MM-DD)
+
+    c.execute("SELECT id, notified_at, completed_at FROM tasks WHERE notified_at IS NOT NULL OR completed_at IS NOT NULL")
+    updates = []
+    for task_id, notified_at, completed_at in c.fetchall():
+        notified = _parse_legacy_timestamp(notified_at)
+        completed = _parse_legacy_timestamp(completed_at)
+        updates.append((
+            int(notified.timestamp()) if notified else None,
+            notified.astimezone(TASHKENT_TZ).date().isoformat() if notified else None,
+            int(completed.timestamp()) if completed else None,
+            notified.isoformat() if notified else notified_at,
+            completed.isoformat() if completed else completed_at,
+            task_id,
+        ))
+    c.executemany("""UPDATE tasks SET notified_ts = ?, notified_day = ?, completed_ts = ?,
+                                      notified_at = ?, completed_at = ?
+                     WHERE id = ?""", updates)
+
+    c.execute("DROP INDEX IF EXISTS idx_tasks_notified_at")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_notified_ts ON tasks(notified_ts)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_notified_day ON tasks(notified_day, completed_ts, notified_ts)")
+
+def _add_outbox(c):
+    # Outbound Telegram messages waiting for delivery; rows are deleted once sent
+    c.execute("""CREATE TABLE IF NOT EXISTS outbox (
+                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 chat_id INTEGER NOT NULL,
+                 thread_id INTEGER DEFAULT NULL,
+                 kind TEXT NOT NULL DEFAULT 'text',  -- 'text' or 'photo'
+                 text TEXT,  -- Message text, or the caption of a photo
+                 photo BLOB DEFAULT NULL,  -- PNG bytes for kind = 'photo'
+                 coalesce_key TEXT DEFAULT NULL,  -- Messages sharing a key may be merged into one
+                 created_ts INTEGER NOT NULL,  -- UTC epoch seconds
+                 attempts INTEGER NOT NULL DEFAULT 0
+                 )""")
+
+def _add_fsm_storage(c):
+    # Conversation state for aiogram's FSM (see fsm_storage.SQLiteStorage)
+    c.execute("""CREATE TABLE IF NOT EXISTS fsm_storage (
+                 chat TEXT NOT NULL,
+                 user TEXT NOT NULL,
+                 state TEXT DEFAULT NULL,
+                 data TEXT NOT NULL DEFAULT '{}',  -- JSON
+                 bucket TEXT NOT NULL DEFAULT '{}',  -- JSON
+                 expires_ts INTEGER NOT NULL,  -- UTC epoch seconds after which the entry is ignored
+                 PRIMARY KEY (chat, user)
+                 ) WITHOUT ROWID""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_fsm_storage_expires ON fsm_storage(expires_ts)")
+
+def _add_chat_scoping(c):
+    # Every task and bill belongs to a chat (and optionally the user who sent it);
+    # rows created before multi-chat support belong to DEFAULT_CHAT_ID
+    for table in ("tasks", "bills"):
+        c.execute(f"ALTER TABLE {table} ADD COLUMN chat_id INTEGER DEFAULT NULL")
+        c.execute(f"ALTER TABLE {table} ADD COLUMN user_id INTEGER DEFAULT NULL")
+        c.execute(f"UPDATE {table} SET chat_id = ?", (DEFAULT_CHAT_ID,))
+
+    # bills_daily is keyed by (chat_id, date) now; rebuild it since the primary key changes
+    c.execute("ALTER TABLE bills_daily RENAME TO bills_daily_old")
+    c.execute("""CREATE TABLE bills_daily (
+                 chat_id INTEGER NOT NULL,
+                 date TEXT NOT NULL,  -- YYYY-MM-DD
+                 income REAL NOT NULL DEFAULT 0,  -- Sum of positive amounts
+                 expenses REAL NOT NULL DEFAULT 0,  -- Sum of negative amounts, stored as a positive number
+                 income_count INTEGER NOT NULL DEFAULT 0,
+                 expense_count INTEGER NOT NULL DEFAULT 0,
+                 balance REAL NOT NULL DEFAULT 0,  -- income - expenses
+                 PRIMARY KEY (chat_id, date)
+                 ) WITHOUT ROWID""")
+    c.execute("""INSERT INTO bills_daily (chat_id, date, income, expenses, income_count, expense_count, balance)
+                 SELECT ?, date, income, expenses, income_count, expense_count, balance FROM bills_daily_old""",
+              (DEFAULT_CHAT_ID,))
+    c.execute("DROP TABLE bills_daily_old")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bills_daily_date ON bills_daily(date, chat_id)")
+
+    # Per-chat forum topic ids; chats without a row use config.DEFAULT_TOPICS
+    c.execute("""CREATE TABLE IF NOT EXISTS chat_topics (
+                 chat_id INTEGER NOT NULL,
+                 role TEXT NOT NULL,  -- 'plans', 'results' or 'bills'
+                 thread_id INTEGER NOT NULL,
+                 PRIMARY KEY (chat_id, role)
+                 ) WITHOUT ROWID""")
+
+    # Per-chat lookups lead with chat_id; the scheduler-wide ones stay keyed by status/day/date
+    c.execute("DROP INDEX IF EXISTS idx_tasks_notified_ts")
+    c.execute("DROP INDEX IF EXISTS idx_bills_date_time")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_chat_status ON tasks(chat_id, status, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_chat_notified ON tasks(chat_id, notified_ts)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tasks_chat_day ON tasks(chat_id, notified_day, completed_ts, notified_ts)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bills_date_chat ON bills(date, chat_id, time)")
+
+def _add_task_templates(c):
+    # Recurring plans; the scheduler creates a tasks row per occurrence only when it fires
+    c.execute("""CREATE TABLE IF NOT EXISTS task_templates (
                  id INTEGER PRIMARY KEY AUTOINCREMENT,
-                 date TEXT NOT NULL,  -- Date of the transaction (YYYY-MM-DD)
-                 type TEXT NOT NULL,  -- 'income', 'expense', or 'addition'
-                 amount REAL NOT NULL,  -- Amount of money (positive for income/addition, negative for expense)
-                 description TEXT,  -- Description or reason for the transaction
-                 time TEXT NOT NULL  -- Time of the transaction (HH:MM)
-                 )''')
-    
-    conn.commit()
-    conn.close()
\ No newline at end of file
+                 chat_id INTEGER NOT NULL,
+                 user_id INTEGER,
+                 task TEXT NOT NULL,
+                 time TEXT NOT NULL,  -- HH:MM
+                 rule TEXT NOT NULL,  -- 'daily', 'weekdays', 'weekends' or days such as 'mon,wed,fri'
+                 active INTEGER NOT NULL DEFAULT 1,
+                 last_fired_day TEXT DEFAULT NULL  -- Tashkent date of the latest occurrence created
+                 )""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_task_templates_chat ON task_templates(chat_id, active)")
+    c.execute("ALTER TABLE tasks ADD COLUMN template_id INTEGER DEFAULT NULL")
+
+def _add_coordination(c):
+    # Several processes may share the database (see worker.py). Each keeps a lease that
+    # it renews while alive; outbox rows belong to the process that queued them.
+    c.execute("""CREATE TABLE IF NOT EXISTS leases (
+                 name TEXT PRIMARY KEY,
+                 holder TEXT NOT NULL,
+                 expires_ts INTEGER NOT NULL  -- UTC epoch seconds
+                 ) WITHOUT ROWID""")
+    # One row per run of a periodic job, so only the first process to claim a run performs it
+    c.execute("""CREATE TABLE IF NOT EXISTS scheduler_runs (
+                 job TEXT NOT NULL,  -- e.g. 'weekly_report'
+                 period TEXT NOT NULL,  -- e.g. the local date of the run
+                 holder TEXT NOT NULL,
+                 claimed_ts INTEGER NOT NULL,
+                 PRIMARY KEY (job, period)
+                 ) WITHOUT ROWID""")
+    c.execute("ALTER TABLE outbox ADD COLUMN owner TEXT DEFAULT NULL")
+
+def _add_report_versions(c):
+    # Bumped by every write that changes a chat's reports, in any process; cached reports
+    # of a chat are dropped once its version moves past the one the cache saw (report_cache.py)
+    c.execute("""CREATE TABLE IF NOT EXISTS report_versions (
+                 chat_id INTEGER PRIMARY KEY,
+                 version INTEGER NOT NULL
+                 )""")
+
+def _add_active_templates_index(c):
+    # Schedulers polling for templates read the active ones of every chat
+    c.execute("CREATE INDEX IF NOT EXISTS idx_task_templates_active ON task_templates(active)")
+
+def _add_unique_active_templates(c):
+    # Sending the same plan again must not schedule a second copy of a recurring task;
+    # earlier duplicates are stopped, keeping the oldest, before the index is built
+    c.execute("""UPDATE task_templates SET active = 0
+                 WHERE active = 1 AND id NOT IN (
+                     SELECT MIN(id) FROM task_templates WHERE active = 1 GROUP BY chat_id, task, time, rule
+                 )""")
+    c.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_task_templates_unique_active
+                 ON task_templates(chat_id, task, time, rule) WHERE active = 1""")
+
+def _add_task_created_ts(c):
+    # When a plan was saved, so a reminder that fell due while no scheduler ran can be told
+    # from one for tomorrow; older rows keep NULL and are scheduled from their time alone
+    c.execute("ALTER TABLE tasks ADD COLUMN created_ts INTEGER DEFAULT NULL")  # UTC epoch seconds
+
+MIGRATIONS = [
+    (1, _add_core_indexes),
+    (2, _add_tasks_fts),
+    (3, _add_bills_daily),
+    (4, _add_epoch_timestamps),
+    (5, _add_outbox),
+    (6, _add_fsm_storage),
+    (7, _add_chat_scoping),
+    (8, _add_task_templates),
+    (9, _add_coordination),
+    (10, _add_report_versions),
+    (11, _add_active_templates_index),
+    (12, _add_unique_active_templates),
+    (13, _add_task_created_ts),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version():
+    with transaction() as c:
+        c.execute("PRAGMA user_version")
+        return c.fetchone()[0]
+
+# The archive database (see retention.py) holds the columns the bot still reads, with
+# the same ids, so rows keep their identity when they move. Versioned on its own.
+ARCHIVE_SCHEMA_VERSION = 1
+
+def init_archive():
+    with transaction() as c:
+        c.execute(f"PRAGMA {ARCHIVE_SCHEMA}.user_version")
+        if c.fetchone()[0] == ARCHIVE_SCHEMA_VERSION:
+            return
+        c.execute("BEGIN")
+        c.execute(f"""CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.tasks (
+                     id INTEGER PRIMARY KEY,
+                     chat_id INTEGER,
+                     user_id INTEGER,
+                     task TEXT NOT NULL,
+                     time TEXT NOT NULL,
+                     status TEXT,
+                     notified_ts INTEGER,
+                     notified_day TEXT,
+                     video_id TEXT,
+                     completed_ts INTEGER,
+                     template_id INTEGER
+                     )""")
+        c.execute(f"CREATE INDEX IF NOT EXISTS {ARCHIVE_SCHEMA}.idx_tasks_chat_notified ON tasks(chat_id, notified_ts)")
+        c.execute(f"CREATE INDEX IF NOT EXISTS {ARCHIVE_SCHEMA}.idx_tasks_chat_day ON tasks(chat_id, notified_day, completed_ts, notified_ts)")
+        c.execute(f"CREATE INDEX IF NOT EXISTS {ARCHIVE_SCHEMA}.idx_tasks_notified_day ON tasks(notified_day, completed_ts, notified_ts)")
+        # Archived tasks stay searchable through their own full-text index
+        c.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.tasks_fts USING fts5(
+                     task, content='tasks', content_rowid='id',
+                     tokenize='unicode61 remove_diacritics 2')""")
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {ARCHIVE_SCHEMA}.tasks_fts_insert AFTER INSERT ON tasks BEGIN
+                         INSERT INTO tasks_fts(rowid, task) VALUES (new.id, new.task);
+                     END""")
+        c.execute(f"""CREATE TRIGGER IF NOT EXISTS {ARCHIVE_SCHEMA}.tasks_fts_delete AFTER DELETE ON tasks BEGIN
+                         INSERT INTO tasks_fts(tasks_fts, rowid, task) VALUES ('delete', old.id, old.task);
+                     END""")
+        c.execute(f"""CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.bills (
+                     id INTEGER PRIMARY KEY,
+                     chat_id INTEGER,
+                     user_id INTEGER,
+                     date TEXT NOT NULL,
+                     type TEXT NOT NULL,
+                     amount REAL NOT NULL,
+                     description TEXT,
+                     time TEXT NOT NULL
+                     )""")
+        c.execute(f"CREATE INDEX IF NOT EXISTS {ARCHIVE_SCHEMA}.idx_bills_chat_date ON bills(chat_id, date, time)")
+        c.execute(f"PRAGMA {ARCHIVE_SCHEMA}.user_version = {ARCHIVE_SCHEMA_VERSION}")
+
+def migrate():
+    version = get_schema_version()
+    if version == SCHEMA_VERSION:
+        return
+    with transaction() as c:
+        # ALTER TABLE checks every view, and all_tasks names columns older schemas lack
+        c.execute("DROP VIEW IF EXISTS temp.all_tasks")
+    for target, migration in MIGRATIONS:
+        if target <= version:
+            continue
+        with transaction() as c:
+            # DDL does not open a transaction implicitly; do it so a failed step leaves no trace
+            c.execute("BEGIN")
+            migration(c)
+            c.execute(f"PRAGMA user_version = {target}")
+        logger.info("database migrated schema_version=%s", target)
+    with transaction() as c:
+        create_archive_view(c)
+
+if __name__ == "__main__":
+    from config import LOG_FORMAT
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    init_db()
+    close_connection()
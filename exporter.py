@@ -0,0 +1,108 @@
+# exporter.py
+"""Streaming export of tasks and bills to CSV or JSONL, optionally gzipped.
+
+Usage:
+    python -m exporter tasks tasks.csv.gz
+    python -m exporter bills bills.jsonl --from 2025-01-01 --to 2025-03-31 --chat-id -1001234567890
+
+Rows are read in chunks from a private read-only connection and encoded into the
+output stream as they arrive, so memory stays flat whatever the history size. The
+files can be loaded back with ``python -m importer``.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import sys
+import time
+
+from config import DEFAULT_CHAT_ID
+from database_actions import EXPORT_CHUNK_SIZE, EXPORT_COLUMNS, iter_export_rows
+from database_connection import close_connection
+from database_creation import init_db
+
+FORMATS = ("csv", "jsonl")
+
+
+def encode_csv(columns, chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def encode_jsonl(columns, chunks):
+    for rows in chunks:
+        yield "".join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows)
+
+
+ENCODERS = {"csv": encode_csv, "jsonl": encode_jsonl}
+
+
+def write_export(stream, kind, chat_id, start_date=None, end_date=None, file_format="csv",
+                 compress=True, chunk_size=EXPORT_CHUNK_SIZE):
+    """Encode ``kind`` rows of one chat into the binary ``stream``. Returns the number of rows written."""
+    count = 0
+
+    def counted(chunks):
+        nonlocal count
+        for rows in chunks:
+            count += len(rows)
+            yield rows
+
+    chunks = counted(iter_export_rows(kind, chat_id, start_date, end_date, chunk_size))
+    output = gzip.GzipFile(fileobj=stream, mode="wb") if compress else stream
+    try:
+        for text in ENCODERS[file_format](EXPORT_COLUMNS[kind], chunks):
+            output.write(text.encode("utf-8"))
+    finally:
+        if compress:
+            output.close()  # Writes the gzip trailer; the underlying stream stays open
+    return count
+
+
+def export_filename(kind, file_format, start_date=None, end_date=None, compress=True):
+    span = f"_{start_date}_{end_date}" if start_date and end_date else ""
+    return f"{kind}{span}.{file_format}" + (".gz" if compress else "")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m exporter", description=__doc__.splitlines()[0])
+    parser.add_argument("kind", choices=sorted(EXPORT_COLUMNS))
+    parser.add_argument("path", help="output file; .gz compresses, '-' writes to stdout")
+    parser.add_argument("--format", choices=FORMATS, help="override detection by file extension")
+    parser.add_argument("--chat-id", type=int, default=DEFAULT_CHAT_ID)
+    parser.add_argument("--from", dest="start_date", help="first date, YYYY-MM-DD")
+    parser.add_argument("--to", dest="end_date", help="last date, YYYY-MM-DD")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    if bool(args.start_date) != bool(args.end_date):
+        parser.error("--from and --to must be given together")
+    compress = args.path.endswith(".gz")
+    name = args.path[:-3] if compress else args.path
+    file_format = args.format or ("jsonl" if name.endswith(".jsonl") else "csv")
+
+    init_db()  # Older databases lack the columns being exported
+    close_connection()
+    started = time.perf_counter()
+    if args.path == "-":
+        count = write_export(sys.stdout.buffer, args.kind, args.chat_id, args.start_date, args.end_date,
+                             file_format, compress, args.chunk_size)
+    else:
+        with open(args.path, "wb") as f:
+            count = write_export(f, args.kind, args.chat_id, args.start_date, args.end_date,
+                                 file_format, compress, args.chunk_size)
+    elapsed = time.perf_counter() - started
+    print(f"Exported {count} {args.kind} in {elapsed:.2f}s ({count / elapsed if elapsed else 0:.0f} rows/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+# fake_bot.py
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+from aiogram.utils.exceptions import RetryAfter
+
+API_METHODS = (
+    "send_message", "send_photo", "send_document", "answer_callback_query",
+    "edit_message_text", "edit_message_reply_markup", "get_chat_member",
+)
+
+
+class FakeBot:
+    """Offline stand-in for aiogram's Bot that records every outgoing call.
+
+    ``latency`` adds a delay to each call, and ``flood_every``/``retry_after`` make every
+    n-th call raise ``RetryAfter`` the way Telegram's flood control does. ``install()``
+    puts it behind a real ``Bot`` so whole updates can be run through the Dispatcher.
+    """
+
+    def __init__(self, latency=0.0, flood_every=0, retry_after=1, admins=()):
+        self.latency = latency
+        self.admins = set(admins)  # User ids get_chat_member reports as chat admins
+        self.flood_every = flood_every
+        self.retry_after = retry_after
+        self.calls = []  # (method, chat_id, payload) for every successful call
+        self.flood_errors = 0
+        self._counter = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    async def _call(self, method, chat_id, **payload):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.flood_every and next(self._counter) % self.flood_every == 0:
+            self.flood_errors += 1
+            raise RetryAfter(self.retry_after)
+        self.calls.append((method, chat_id, payload))
+        return SimpleNamespace(message_id=next(self._message_ids), chat=SimpleNamespace(id=chat_id))
+
+    @property
+    def sent(self):
+        return [payload.get("text", payload.get("caption")) for _, _, payload in self.calls]
+
+    async def send_message(self, chat_id, text, message_thread_id=None, **kwargs):
+        return await self._call("send_message", chat_id, text=text, message_thread_id=message_thread_id, **kwargs)
+
+    async def send_photo(self, chat_id, photo, caption=None, message_thread_id=None, **kwargs):
+        return await self._call("send_photo", chat_id, photo=photo, caption=caption, message_thread_id=message_thread_id, **kwargs)
+
+    async def send_document(self, chat_id, document, caption=None, message_thread_id=None, **kwargs):
+        # Uploads are read right away: the file behind an InputFile is closed once the call returns
+        content = document.file.read() if hasattr(document, "file") else None
+        return await self._call(
+            "send_document", chat_id, document=document, content=content, caption=caption,
+            message_thread_id=message_thread_id, **kwargs
+        )
+
+    async def answer_callback_query(self, callback_query_id, text=None, **kwargs):
+        return True
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        return await self._call("edit_message_text", chat_id, text=text, message_id=message_id, **kwargs)
+
+    async def edit_message_reply_markup(self, chat_id=None, message_id=None, reply_markup=None, **kwargs):
+        return True
+
+    async def get_chat_member(self, chat_id, user_id):
+        return SimpleNamespace(user=SimpleNamespace(id=user_id), is_chat_admin=lambda: user_id in self.admins)
+
+    def install(self, bot):
+        """Route a real aiogram ``Bot``'s API calls here; a Dispatcher only accepts a real Bot."""
+        for name in API_METHODS:
+            setattr(bot, name, getattr(self, name))
+        return self
+
+    async def close(self):
+        pass
@@ -0,0 +1,202 @@
+# fsm_storage.py
+import asyncio
+import copy
+import json
+import logging
+import time
+import typing
+from collections import OrderedDict
+
+from aiogram.dispatcher.storage import BaseStorage
+
+from database_async import delete_expired_fsm_records, get_fsm_record, save_fsm_records
+
+logger = logging.getLogger(__name__)
+
+FSM_TTL = 24 * 60 * 60  # Seconds an untouched conversation state is kept
+CACHE_SIZE = 10000  # (chat, user) entries kept in memory
+FLUSH_INTERVAL = 1.0  # Seconds between write-behind batches
+PURGE_INTERVAL = 10 * 60  # Seconds between sweeps of expired rows
+
+
+def _empty_record():
+    return {"state": None, "data": {}, "bucket": {}, "expires": 0}
+
+
+class SQLiteStorage(BaseStorage):
+    """aiogram FSM storage persisted in the bot's SQLite database.
+
+    Reads go through an in-process LRU cache; writes update the cache immediately and are
+    written to the ``fsm_storage`` table in batches every ``flush_interval`` seconds. Entries
+    not touched for ``ttl`` seconds expire, so abandoned flows do not accumulate.
+    """
+
+    def __init__(self, ttl=FSM_TTL, cache_size=CACHE_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self._cache = OrderedDict()  # (chat, user) -> record
+        self._dirty = {}  # (chat, user) -> record waiting to be written
+        self._flusher = None
+        self._last_purge = time.time()
+
+    def _key(self, chat, user):
+        chat, user = self.check_address(chat=chat, user=user)
+        return str(chat), str(user)
+
+    def _cache_record(self, key, record):
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            # Dirty records stay reachable through self._dirty until they are flushed
+            self._cache.popitem(last=False)
+
+    def _lookup(self, key, now):
+        record = self._dirty.get(key) or self._cache.get(key)
+        if record is not None and record["expires"] <= now:
+            record = _empty_record()
+        return record
+
+    async def _get_record(self, chat, user):
+        key = self._key(chat, user)
+        now = time.time()
+        record = self._lookup(key, now)
+        if record is None:
+            row = await get_fsm_record(key[0], key[1], int(now))
+            # Another coroutine may have loaded or written this key while we waited
+            record = self._lookup(key, now)
+            if record is None:
+                record = _empty_record()
+                if row:
+                    state, data, bucket, expires = row
+                    record = {"state": state, "data": json.loads(data), "bucket": json.loads(bucket), "expires": expires}
+        self._cache_record(key, record)
+        return key, record
+
+    def _touch(self, key, record):
+        record["expires"] = time.time() + self.ttl
+        self._cache_record(key, record)
+        self._dirty[key] = record
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.time() - self._last_purge >= PURGE_INTERVAL:
+                    await self.purge_expired()
+            except Exception as e:
+                logger.exception("FSM storage flush failed: %s", e)
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        records, deleted = [], []
+        for (chat, user), record in dirty.items():
+            if record["state"] is None and not record["data"] and not record["bucket"]:
+                deleted.append((chat, user))
+            else:
+                records.append((
+                    chat, user, record["state"], json.dumps(record["data"]),
+                    json.dumps(record["bucket"]), int(record["expires"])
+                ))
+        try:
+            await save_fsm_records(records, deleted)
+        except Exception:
+            # Keep the batch for the next attempt unless newer writes replaced it
+            for key, record in dirty.items():
+                self._dirty.setdefault(key, record)
+            raise
+
+    async def purge_expired(self):
+        now = time.time()
+        self._last_purge = now
+        for key in [key for key, record in self._cache.items() if record["expires"] <= now]:
+            del self._cache[key]
+        return await delete_expired_fsm_records(int(now))
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+    async def wait_closed(self):
+        pass
+
+    async def get_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        default: typing.Optional[str] = None) -> typing.Optional[str]:
+        _, record = await self._get_record(chat, user)
+        return record["state"] if record["state"] is not None else self.resolve_state(default)
+
+    async def get_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       default: typing.Optional[dict] = None) -> typing.Dict:
+        _, record = await self._get_record(chat, user)
+        return copy.deepcopy(record["data"])
+
+    async def set_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        state: typing.AnyStr = None):
+        key, record = await self._get_record(chat, user)
+        record["state"] = self.resolve_state(state)
+        self._touch(key, record)
+
+    async def set_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None):
+        key, record = await self._get_record(chat, user)
+        record["data"] = copy.deepcopy(data or {})
+        self._touch(key, record)
+
+    async def update_data(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          data: typing.Dict = None, **kwargs):
+        key, record = await self._get_record(chat, user)
+        record["data"].update(data or {}, **kwargs)
+        self._touch(key, record)
+
+    async def reset_state(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          with_data: typing.Optional[bool] = True):
+        key, record = await self._get_record(chat, user)
+        record["state"] = None
+        if with_data:
+            record["data"] = {}
+        self._touch(key, record)
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *,
+                         chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         default: typing.Optional[dict] = None) -> typing.Dict:
+        _, record = await self._get_record(chat, user)
+        return copy.deepcopy(record["bucket"])
+
+    async def set_bucket(self, *,
+                         chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         bucket: typing.Dict = None):
+        key, record = await self._get_record(chat, user)
+        record["bucket"] = copy.deepcopy(bucket or {})
+        self._touch(key, record)
+
+    async def update_bucket(self, *,
+                            chat: typing.Union[str, int, None] = None,
+                            user: typing.Union[str, int, None] = None,
+                            bucket: typing.Dict = None, **kwargs):
+        key, record = await self._get_record(chat, user)
+        record["bucket"].update(bucket or {}, **kwargs)
+        self._touch(key, record)
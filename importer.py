@@ -0,0 +1,162 @@
+# importer.py
+"""Bulk import of historical tasks and bills from CSV or JSONL exports.
+
+Usage:
+    python -m importer tasks history.csv
+    python -m importer bills bills.jsonl.gz --chunk-size 20000 --chat-id -1001234567890
+
+Rows are streamed from the file and written in large chunked transactions, so
+memory stays flat and years of history load in seconds.
+"""
+import argparse
+import contextlib
+import csv
+import gzip
+import io
+import json
+import re
+import sys
+import time
+from functools import partial
+from itertools import islice
+
+from config import DEFAULT_CHAT_ID
+from database_actions import add_to_bills_daily, bump_report_version, local_day, parse_timestamp
+from database_connection import close_connection, transaction
+from database_creation import init_db
+
+CHUNK_SIZE = 10000
+TASK_STATUSES = ("pending", "completed", "missed")
+BARE_TIME_RE = re.compile(r"\d{1,2}:\d{2}")
+
+
+def open_text(path):
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def read_records(path, file_format=None):
+    """Yield one dict per CSV row or JSONL line without loading the file into memory."""
+    name = path[:-3] if path.endswith(".gz") else path
+    file_format = file_format or ("csv" if name.endswith(".csv") else "jsonl")
+    # Only files opened here are closed; stdin stays open for the caller
+    with contextlib.nullcontext(sys.stdin) if path == "-" else open_text(path) as f:
+        if file_format == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def record_owner(record, chat_id):
+    # Records may carry their own chat_id/user_id; otherwise they belong to --chat-id
+    user_id = record.get("user_id")
+    return int(record.get("chat_id") or chat_id), int(user_id) if user_id else None
+
+
+def task_row(record, chat_id=DEFAULT_CHAT_ID):
+    notified_ts = parse_timestamp(record.get("notified_ts") or record.get("notified_at"))
+    completed = record.get("completed_ts") or record.get("completed_at")
+    # Old rows may carry a bare HH:MM completion without a date; like migration 4, keep no timestamp
+    bare_time = isinstance(completed, str) and BARE_TIME_RE.fullmatch(completed.strip())
+    completed_ts = None if bare_time else parse_timestamp(completed)
+    # History without a status is settled: pending rows would be picked up by the scheduler
+    status = (record.get("status") or ("completed" if completed else "missed")).lower()
+    if status not in TASK_STATUSES:
+        raise ValueError(f"unknown status {status!r}")
+    return (
+        *record_owner(record, chat_id),
+        record["task"].strip(),
+        record["time"].strip(),
+        status,
+        notified_ts,
+        local_day(notified_ts) if notified_ts else None,
+        record.get("video_id") or None,
+        completed_ts,
+    )
+
+
+def bill_row(record, chat_id=DEFAULT_CHAT_ID):
+    amount = float(record["amount"])
+    bill_type = record.get("type") or ("income" if amount > 0 else "expense")
+    return (
+        *record_owner(record, chat_id),
+        record["date"].strip(), bill_type, amount, record.get("description") or None, record["time"].strip()
+    )
+
+
+def write_tasks(cursor, rows):
+    cursor.executemany("""
+        INSERT INTO tasks (chat_id, user_id, task, time, status, notified_ts, notified_day, video_id, completed_ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+
+
+def write_bills(cursor, rows):
+    cursor.executemany("""
+        INSERT INTO bills (chat_id, user_id, date, type, amount, description, time)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    add_to_bills_daily(cursor, [(chat_id, date, amount) for chat_id, _, date, _, amount, _, _ in rows])
+
+
+KINDS = {
+    "tasks": (task_row, write_tasks),
+    "bills": (bill_row, write_bills),
+}
+
+
+def convert(records, to_row, errors):
+    for line_number, record in enumerate(records, 1):
+        try:
+            yield to_row(record)
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            errors.append(f"record {line_number}: {e!r}")
+
+
+def import_records(kind, records, chunk_size=CHUNK_SIZE, chat_id=DEFAULT_CHAT_ID):
+    """Write records in chunks of ``chunk_size`` rows per transaction. Returns (imported, errors)."""
+    to_row, write = KINDS[kind]
+    errors = []
+    rows = convert(records, partial(to_row, chat_id=chat_id), errors)
+    imported = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        with transaction() as cursor:
+            write(cursor, chunk)
+            # A running bot drops its cached reports of these chats on their next read
+            for chat_id in {row[0] for row in chunk}:
+                bump_report_version(cursor, chat_id)
+        imported += len(chunk)
+    return imported, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m importer", description=__doc__.splitlines()[0])
+    parser.add_argument("kind", choices=sorted(KINDS))
+    parser.add_argument("path", help="CSV or JSONL file, optionally .gz; '-' reads JSONL from stdin")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="override detection by file extension")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--chat-id", type=int, default=DEFAULT_CHAT_ID, help="chat for records without a chat_id")
+    args = parser.parse_args(argv)
+
+    init_db()
+    started = time.perf_counter()
+    imported, errors = import_records(args.kind, read_records(args.path, args.format), args.chunk_size, args.chat_id)
+    elapsed = time.perf_counter() - started
+    close_connection()
+
+    for error in errors[:20]:
+        print(f"Skipped {error}")
+    if len(errors) > 20:
+        print(f"... and {len(errors) - 20} more skipped records")
+    print(f"Imported {imported} {args.kind} in {elapsed:.2f}s ({imported / elapsed if elapsed else 0:.0f} rows/s)")
+    return 1 if errors and not imported else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
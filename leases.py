@@ -0,0 +1,72 @@
+# leases.py
+"""Coordination between processes that share the database.
+
+Every process (the bot, and any ``worker.py``) holds an ``instance:<id>`` lease that it
+renews while it runs. Outbox messages belong to the instance that queued them and are
+adopted by another one once that lease expires. Periodic jobs claim each run in
+``scheduler_runs``, so a report or archive run happens once however many schedulers
+are alive; reminders are claimed per task by ``mark_task_notified``.
+
+Each renewal also counts the other live instances. A process that is ``alone()`` may
+trust what it keeps in memory (open reminder windows); otherwise it reads the database.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+
+from database_async import claim_scheduler_run, count_other_instances, release_lease, renew_lease
+
+logger = logging.getLogger(__name__)
+
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+LEASE_TTL = 90  # Seconds an instance counts as alive after its last renewal
+HEARTBEAT_INTERVAL = 30
+
+peers = 0  # Other live instances at the last renewal
+
+
+def instance_lease():
+    return f"instance:{INSTANCE_ID}"
+
+
+async def renew_instance_lease():
+    global peers
+    now = int(time.time())
+    renewed = await renew_lease(instance_lease(), INSTANCE_ID, now + LEASE_TTL, now)
+    count = await count_other_instances(INSTANCE_ID, now)
+    if count != peers:
+        logger.info("peer instances changed instance=%s peers=%d", INSTANCE_ID, count)
+        peers = count
+    return renewed
+
+
+def alone():
+    """True if no other process shared the database at the last renewal."""
+    return peers == 0
+
+
+async def release_instance_lease():
+    await release_lease(instance_lease(), INSTANCE_ID)
+
+
+async def heartbeat(on_renew=None):
+    """Keep this instance's lease alive; ``on_renew`` runs after every renewal (e.g. to adopt orphans)."""
+    while True:
+        try:
+            await renew_instance_lease()
+            if on_renew is not None:
+                await on_renew()
+        except Exception as e:
+            logger.exception("lease renewal failed instance=%s: %s", INSTANCE_ID, e)
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+
+async def claim_run(job, period):
+    """True if this instance should perform ``job`` for ``period``; every other claimant gets False."""
+    claimed = await claim_scheduler_run(job, period, INSTANCE_ID, int(time.time()))
+    if not claimed:
+        logger.info("skipping job=%s period=%s: claimed by another instance", job, period)
+    return claimed
@@ -1,252 +1,341 @@
 # main.py
-import sqlite3
 import asyncio
+import logging
+import re
+import sys
+import tempfile
 import pytz
-import io
-import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 from aiogram import Bot, Dispatcher, types
-from aiogram.types import Message, InputFile, InlineKeyboardButton, InlineKeyboardMarkup
-from config import TOKEN, DB_NAME
-from database_creation import init_db
-from database_actions import (
-    save_task, get_pending_tasks, mark_task_missed, mark_task_completed, 
-    get_latest_pending_task_id, get_daily_response_times, save_task_video, get_task_statistics
+from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
+from config import (
+    TOKEN, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT,
+    LOG_LEVEL, LOG_FORMAT, METRICS_ENABLED, METRICS_HOST, METRICS_PORT, ADMIN_IDS, ARCHIVE_HOUR,
+    SCHEDULER_POLL_INTERVAL, UPDATE_WORKERS, HANDLER_TIMEOUT, HANDLER_TIMEOUTS
 )
+import metrics
+from database_connection import close_connection
+from database_async import (
+    run_db, save_tasks, mark_task_completed, save_task_video, get_response_times_between, get_response_times_by_chat, get_daily_bills,
+    save_bills, get_bills_by_chat, get_bills_summary, get_bills_summaries_by_chat, get_bills_range,
+    search_tasks_page, get_task, save_templates, get_active_templates, stop_template, get_open_windows, sync_report_cache
+)
+from database_actions import SEARCH_PAGE_SIZE
+from reminder_scheduler import RESPONSE_WINDOW, ReminderScheduler, parse_rule
+from leases import alone, claim_run, heartbeat, release_instance_lease, renew_instance_lease
+from report_cache import report_cache
+from tenants import TOPIC_ROLES, TopicRegistry
+from outbox import Outbox
+from update_pool import UpdatePool, with_timeout
 from aiogram.dispatcher import FSMContext
+from aiogram.dispatcher.filters import StateFilter
 from aiogram.dispatcher.filters.state import State, StatesGroup
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from fsm_storage import SQLiteStorage
 
-storage = MemoryStorage()
+logger = logging.getLogger(__name__)
 
 class TaskVideoState(StatesGroup):
     waiting_for_task_name = State()
+    choosing_task = State()  # Several reminders are open; the user picks the one the video is for
 
 class SearchState(StatesGroup):
     waiting_for_query = State()
     showing_results = State()  # State to store search results for callback handling
 
-# Initialize timezone and bot
 TASHKENT_TZ = pytz.timezone("Asia/Tashkent")
-bot = Bot(token=TOKEN)
-dp = Dispatcher(bot, storage=storage)
-
-# Initialize database
-init_db()
 
-# Thread IDs
-THIRD_ID = 3  # Bills topic ID
-TOPIC_ID_PLANS = 5
-TOPIC_ID_TODAYS_RESULTS = 6
-waiting_for_task = {}
+# Built by create_app(); importing this module has no side effects
+bot = None
+dp = None
+storage = None
+topics = None
+outbox = None
+reminder_scheduler = None
+update_pool = None
+run_schedulers = True  # False when worker.py processes run the schedulers instead
+startup_time = None
 
-# Global variable to store startup time
-startup_time = datetime.now(TASHKENT_TZ)
+TASK_LINE_RE = re.compile(r"^([^:]*):\s*(\d{1,2}):(\d{2})(?:\s+(.+?))?\s*$")
 
 def parse_task_message(message_text):
+    """Return (task, HH:MM, rule) tuples; rule is None for one-off tasks, else a normalized recurrence."""
     tasks = []
-    print(f"Parsing message: {message_text}")  # Debug: Log the input message
+    logger.debug("parsing plan text=%r", message_text)
     for line in message_text.split("\n"):
         if ":" in line:
-            try:
-                task, time = line.split(":", 1)
-                # Ensure time is in HH:MM format
-                datetime.strptime(time.strip(), "%H:%M")
-                tasks.append((task.strip(), time.strip()))
-            except ValueError as e:
-                print(f"Error parsing line '{line}': {str(e)}")  # Debug: Log parsing errors
+            match = TASK_LINE_RE.match(line.strip())
+            # Ensure time is in HH:MM format
+            if not match or int(match.group(2)) > 23 or int(match.group(3)) > 59:
+                logger.debug("skipping plan line=%r: expected Task: HH:MM", line)
+                continue
+            rule = parse_rule(match.group(4)) if match.group(4) else None
+            if match.group(4) and rule is None:
+                logger.debug("skipping plan line=%r: unknown repeat rule", line)
                 continue
-    tasks.sort(key=lambda x: datetime.strptime(x[1], "%H:%M"))
+            tasks.append((match.group(1).strip(), f"{int(match.group(2)):02d}:{match.group(3)}", rule))
+    tasks.sort(key=lambda x: x[1])  # Zero-padded HH:MM sorts chronologically
     return tasks
 
-# Database functions for bills
-def save_bill(date, bill_type, amount, description, time):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO bills (date, type, amount, description, time) 
-        VALUES (?, ?, ?, ?, ?)
-    """, (date, bill_type, amount, description, time))
-    conn.commit()
-    conn.close()
-
-def get_daily_bills(date):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT type, amount, description, time 
-        FROM bills 
-        WHERE date = ? 
-        ORDER BY time
-    """, (date,))
-    results = cursor.fetchall()
-    conn.close()
-    return results
-
-def get_yesterday_bills():
-    yesterday = (datetime.now(TASHKENT_TZ).date() - timedelta(days=1)).isoformat()
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT type, amount, description, time 
-        FROM bills 
-        WHERE date = ? 
-        ORDER BY time
-    """, (yesterday,))
-    results = cursor.fetchall()
-    conn.close()
-    return results
-
-@dp.message_handler(lambda message: message.message_thread_id == TOPIC_ID_PLANS)
+# "100", "100: Allowance", "-50: Coffee", "+20.5: Freelance work"; "$" and a comma decimal are accepted
+BILL_LINE_RE = re.compile(r"^([+-]?)\s*\$?\s*(\d+(?:[.,]\d{1,2})?)\s*(?::\s*(.*?))?\s*$")
+BILL_TYPES = {"": "income", "-": "expense", "+": "addition"}
+ALLOWANCE_DESCRIPTION = "Daily allowance from parents"
+MAX_REPORTED_ERRORS = 10  # Keeps the reply to a long pasted statement readable
+
+def parse_bills_message(message_text):
+    """Return ((type, signed amount, description) per valid line, (line number, line, reason) per invalid one)."""
+    bills, errors = [], []
+    for number, line in enumerate(message_text.split("\n"), 1):
+        line = line.strip()
+        if not line:
+            continue
+        match = BILL_LINE_RE.match(line)
+        if not match:
+            errors.append((number, line, "expected 100, -50: Coffee or +20: reason"))
+            continue
+        sign, amount, description = match.groups()
+        amount = float(amount.replace(",", "."))
+        if not amount:
+            errors.append((number, line, "amount must not be zero"))
+            continue
+        bill_type = BILL_TYPES[sign]
+        if not description:
+            description = ALLOWANCE_DESCRIPTION if bill_type == "income" else bill_type.capitalize()
+        bills.append((bill_type, -amount if sign == "-" else amount, description))
+    logger.debug("parsed bills lines=%d errors=%d", len(bills), len(errors))
+    return bills, errors
+
+def format_bill_errors(errors):
+    # Replies are plain text, so the offending line is quoted rather than marked up
+    lines = [f"⚠ Line {number}: \"{line}\" – {reason}" for number, line, reason in errors[:MAX_REPORTED_ERRORS]]
+    if len(errors) > MAX_REPORTED_ERRORS:
+        lines.append(f"… and {len(errors) - MAX_REPORTED_ERRORS} more invalid lines")
+    return "\n".join(lines)
+
+def chat_link_id(chat_id):
+    # t.me/c links use the supergroup id without its -100 prefix
+    link_id = str(abs(chat_id))
+    return link_id[3:] if link_id.startswith("100") else link_id
+
+async def handle_topic_command(message: Message):
+    role = message.get_args().strip().lower()
+    if role not in TOPIC_ROLES or not message.message_thread_id:
+        await message.reply(f"⚠ Send /topic {'|'.join(TOPIC_ROLES)} inside the topic to bind it.")
+        return
+    member = await bot.get_chat_member(message.chat.id, message.from_user.id)
+    if not member.is_chat_admin():
+        await message.reply("⚠ Only chat admins can bind topics.")
+        return
+    await topics.set_topic(message.chat.id, role, message.message_thread_id)
+    await message.reply(f"✅ This topic now receives {role}.")
+
+async def handle_stats_command(message: Message):
+    if message.get_args().strip().lower() == "metrics":
+        if message.from_user.id not in ADMIN_IDS:
+            await message.reply("⚠ Only bot admins can view metrics.")
+            return
+        if not metrics.enabled:
+            await message.reply("⚠ Metrics are disabled; set METRICS_ENABLED in config.py.")
+            return
+        cache = report_cache.stats()
+        await message.reply(
+            metrics.summary()
+            + f"\n🗃 Report cache: {cache['entries']} entries, {cache['hits']} hits, {cache['misses']} misses"
+        )
+        return
+    chat_id = message.chat.id
+    # Rolling rates and streaks are relative to today; every write for the chat drops the entry
+    key = ("stats", chat_id, datetime.now(TASHKENT_TZ).date().isoformat())
+    await sync_report_cache(chat_id)
+    report = report_cache.get(key)
+    if report is None:
+        version = report_cache.version(chat_id)
+        import analytics  # NumPy is only loaded once someone asks for stats
+        report = await run_db(analytics.build_stats_report, chat_id)
+        report_cache.put(key, report, chat_id, version=version)
+    await message.reply(report)
+
+async def handle_bills_message(message: Message):
+    bills, errors = parse_bills_message(message.text)
+    if not bills:
+        await message.reply("❌ No valid transactions found.\n" + format_bill_errors(errors))
+        return
+    now = datetime.now(TASHKENT_TZ)
+    time = now.strftime("%H:%M")
+    # A whole pasted statement is one transaction and one rollup update
+    await save_bills(
+        message.chat.id, message.from_user.id, now.date().isoformat(),
+        [(bill_type, amount, description, time) for bill_type, amount, description in bills]
+    )
+    income = sum(amount for _, amount, _ in bills if amount > 0)
+    expenses = -sum(amount for _, amount, _ in bills if amount < 0)
+    logger.info("saved bills chat_id=%s count=%d errors=%d", message.chat.id, len(bills), len(errors))
+    reply = f"✅ Saved {len(bills)} transaction{'s' if len(bills) != 1 else ''}: +${income:.2f} / -${expenses:.2f}"
+    if errors:
+        reply += f"\nSkipped {len(errors)} line{'s' if len(errors) != 1 else ''}:\n" + format_bill_errors(errors)
+    await message.reply(reply)
+
 async def handle_task_message(message: Message):
-    print(f"Received message in thread {message.message_thread_id}: {message.text}")  # Debug: Log the message
+    logger.debug("plan message chat_id=%s thread_id=%s", message.chat.id, message.message_thread_id)
     try:
-        tasks = parse_task_message(message.text)
-        if not tasks:
-            await message.reply("❌ No valid tasks found. Use format: Task: HH:MM")
+        parsed = parse_task_message(message.text)
+        if not parsed:
+            await message.reply("❌ No valid tasks found. Use format: Task: HH:MM (optionally followed by daily, weekdays, weekends or mon,wed,fri)")
             return
         
-        for task, time in tasks:
-            save_task(task, time)
-        await message.reply("✅ Tasks saved and scheduled.")
+        # One transaction for the one-off tasks and one for the recurring templates
+        tasks = [(task, time) for task, time, rule in parsed if rule is None]
+        templates = [entry for entry in parsed if entry[2] is not None]
+        task_ids = await save_tasks(message.chat.id, message.from_user.id, tasks)
+        template_ids = await save_templates(message.chat.id, message.from_user.id, templates)
+        if run_schedulers:
+            # Otherwise the workers pick the new rows up on their next poll
+            for task_id, (task, time) in zip(task_ids, tasks):
+                reminder_scheduler.schedule_task(message.chat.id, task_id, task, time)
+            for template_id, (task, time, rule) in zip(template_ids, templates):
+                reminder_scheduler.schedule_template(message.chat.id, template_id, task, time, rule)
+        reply = "✅ Tasks saved and scheduled."
+        if templates:
+            reply += f" 🔁 {len(templates)} recurring; see /recurring."
+        await message.reply(reply)
     except Exception as e:
-        print(f"Error in handle_task_message: {str(e)}")  # Debug: Log any errors
+        logger.exception("saving plan failed chat_id=%s: %s", message.chat.id, e)
         await message.reply(f"❌ Error saving tasks: {str(e)}")
 
-@dp.message_handler(lambda message: message.text.startswith('/report') and message.message_thread_id == THIRD_ID)
+async def handle_recurring_command(message: Message):
+    args = message.get_args().split()
+    if len(args) == 2 and args[0].lower() == "stop" and args[1].isdigit():
+        if await stop_template(message.chat.id, int(args[1])):
+            await message.reply(f"✅ Recurring task {args[1]} stopped.")
+        else:
+            await message.reply(f"⚠ No active recurring task {args[1]}.")
+        return
+    if args:
+        await message.reply("⚠ Use: /recurring or /recurring stop <id>")
+        return
+    templates = await get_active_templates(message.chat.id)
+    if not templates:
+        await message.reply("🔁 No recurring tasks. Add one in the plans topic, e.g. Workout: 07:00 weekdays")
+        return
+    lines = [f"{template_id}. {task} at {time}, {rule}" for template_id, _, task, time, rule, _ in templates]
+    await message.reply("🔁 **Recurring tasks:**\n" + "\n".join(lines) + "\n\nStop one with /recurring stop <id>.")
+
 async def handle_bills_report_command(message: Message):
-    print('handle_bills_report_command')
+    period = message.get_args().strip().lower()
+    if period:
+        await message.reply(text=f"📊 Generating Bills Report ({period})...", reply_markup=None)
+        await generate_bills_range_report(message.chat.id, period)
+        return
     await message.reply(
         text="📊 Generating Daily Bills Report...",  # Positional argument first (or explicitly as keyword)
         reply_markup=None  # Keyword argument after
     )
     await generate_daily_bills_report(message.chat.id)
 
-@dp.message_handler(commands=["report"])
 async def handle_report_command(message: Message):
     await message.reply("📊 Generating Weekly Report...")
     await generate_weekly_report(message.chat.id)
 
-@dp.message_handler(commands=["search"])
 async def handle_search_command(message: types.Message):
-    await message.reply("🔍 Please enter your search query (e.g., 'Workout', '2025-02-18', or 'Workout:17:00'):")
+    await message.reply(
+        "🔍 Please enter your search query (e.g., 'Workout', '2025-02-18', 'Workout:17:00', "
+        "'gym run 2025-02-01..2025-02-18' or 'Workout status:missed'):"
+    )
     await SearchState.waiting_for_query.set()
 
-@dp.message_handler(state=SearchState.waiting_for_query)
 async def process_search_query(message: types.Message, state: FSMContext):
     query = message.text.strip()
-    results = search_tasks(query)
+    results, has_next = await search_tasks_page(message.chat.id, query)
     
     if not results:
         await message.reply("⚠ No matching tasks found.")
         await state.finish()
         return
     
-    # Format the list of results
-    formatted_results = format_search_results(results, query)
-    full_text = f"📋 Search results for '{query}':\n{formatted_results}"
-    
-    if len(results) == 1:
-        task_info = format_task_info(results[0])
+    if len(results) == 1 and not has_next:
+        task_info = format_task_info(message.chat.id, results[0])
         await message.reply(task_info)
         await state.finish()
         return
     
-    # Store results in state for callback handling and send a new bot message with inline buttons
-    await state.update_data(results=results)
+    # Keep only the query, the page cursors and the ids shown on this page in state;
+    # other pages are fetched lazily when Next/Prev is pressed
     await state.set_state(SearchState.showing_results)
-    
-    # Create inline keyboard with numbered buttons
-    keyboard = InlineKeyboardMarkup(row_width=1)
-    buttons = [InlineKeyboardButton(text=str(i + 1), callback_data=str(i)) for i in range(len(results))]
-    keyboard.inline_keyboard = [buttons]
+    await state.update_data(query=query, cursors=[None])
+    text, keyboard = await build_search_page(state, results, has_next)
     
     # Send a new message with the results and buttons (ensure correct argument order)
     sent_message = await message.answer(
-        text=f"{full_text}\n\n📋 Multiple results found. Select a number to view details:",  # Positional argument first
+        text=text,  # Positional argument first
         reply_markup=keyboard  # Keyword argument after
     )
     
     # Store the bot's message ID in state for potential future edits
     await state.update_data(message_id=sent_message.message_id)
 
-@dp.callback_query_handler(state=SearchState.showing_results)
+async def build_search_page(state: FSMContext, results, has_next):
+    user_data = await state.get_data()
+    query, cursors = user_data["query"], user_data["cursors"]
+    first_number = (len(cursors) - 1) * SEARCH_PAGE_SIZE + 1
+    last = results[-1]
+    await state.update_data(
+        ids=[task[0] for task in results],
+        next_cursor=[last[4], last[0]] if has_next else None
+    )
+    
+    full_text = f"📋 Search results for '{query}' (page {len(cursors)}):\n{format_search_results(results, query, first_number)}"
+    keyboard = InlineKeyboardMarkup(row_width=5)
+    keyboard.add(*[
+        InlineKeyboardButton(text=str(first_number + i), callback_data=f"task:{task[0]}")
+        for i, task in enumerate(results)
+    ])
+    navigation = []
+    if len(cursors) > 1:
+        navigation.append(InlineKeyboardButton(text="⬅ Prev", callback_data="page:prev"))
+    if has_next:
+        navigation.append(InlineKeyboardButton(text="Next ➡", callback_data="page:next"))
+    if navigation:
+        keyboard.row(*navigation)
+    return f"{full_text}\n\n📋 Multiple results found. Select a number to view details:", keyboard
+
 async def process_search_result(callback_query: types.CallbackQuery, state: FSMContext):
     user_data = await state.get_data()
-    results = user_data.get('results', [])
-    message_id = user_data.get('message_id')
+    action, _, value = callback_query.data.partition(":")
     
-    try:
-        index = int(callback_query.data)
-        if 0 <= index < len(results):
-            task_info = format_task_info(results[index])
-            await bot.send_message(callback_query.message.chat.id, task_info)
-        else:
-            await bot.send_message(callback_query.message.chat.id, "⚠ Invalid selection.")
-    except ValueError:
+    if action == "page":
+        cursors = user_data.get('cursors', [None])
+        if value == "next" and user_data.get('next_cursor'):
+            cursors = cursors + [user_data['next_cursor']]
+        elif value == "prev" and len(cursors) > 1:
+            cursors = cursors[:-1]
+        await state.update_data(cursors=cursors)
+        results, has_next = await search_tasks_page(callback_query.message.chat.id, user_data['query'], after=cursors[-1])
+        if results:
+            text, keyboard = await build_search_page(state, results, has_next)
+            await callback_query.message.edit_text(text, reply_markup=keyboard)
+        await bot.answer_callback_query(callback_query.id)
+        return
+    
+    task = None
+    if action == "task" and value.isdigit() and int(value) in user_data.get('ids', []):
+        task = await get_task(callback_query.message.chat.id, int(value))
+    if task:
+        await bot.send_message(callback_query.message.chat.id, format_task_info(callback_query.message.chat.id, task))
+    else:
         await bot.send_message(callback_query.message.chat.id, "⚠ Invalid selection.")
     
     await bot.answer_callback_query(callback_query.id)
     await state.finish()
 
-def search_tasks(query):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    # Handle different query formats
-    if ':' in query:  # Format: ActivityName:HH:MM
-        try:
-            task_name, time = query.split(':', 1)
-            task_name = task_name.strip()
-            time = time.strip()
-            datetime.strptime(time, "%H:%M")
-            cursor.execute("""
-                SELECT id, task, time, status, notified_at, video_id, completed_at 
-                FROM tasks 
-                WHERE task LIKE ? AND time = ? 
-                ORDER BY notified_at DESC
-            """, (f"%{task_name}%", time))
-        except ValueError:
-            cursor.execute("""
-                SELECT id, task, time, status, notified_at, video_id, completed_at 
-                FROM tasks 
-                WHERE task LIKE ? 
-                ORDER BY notified_at DESC
-            """, (f"%{query}%",))
-    elif '-' in query and len(query.split('-')) == 3:  # Format: YYYY-MM-DD
-        try:
-            datetime.strptime(query, "%Y-%m-%d")
-            cursor.execute("""
-                SELECT id, task, time, status, notified_at, video_id, completed_at 
-                FROM tasks 
-                WHERE date(notified_at) = ? 
-                ORDER BY notified_at DESC
-            """, (query,))
-        except ValueError:
-            cursor.execute("""
-                SELECT id, task, time, status, notified_at, video_id, completed_at 
-                FROM tasks 
-                WHERE task LIKE ? 
-                ORDER BY notified_at DESC
-            """, (f"%{query}%",))
-    else:  # Search by activity name only
-        cursor.execute("""
-            SELECT id, task, time, status, notified_at, video_id, completed_at 
-            FROM tasks 
-            WHERE task LIKE ? 
-            ORDER BY notified_at DESC
-        """, (f"%{query}%",))
-    
-    results = cursor.fetchall()
-    conn.close()
-    return results
-
-def format_task_info(task):
-    task_id, task_name, task_time, status, notified_at, video_id, completed_at = task
-    # Convert timezone from +04:37 to +05:00 (Tashkent)
-    notified = datetime.fromisoformat(notified_at.replace("+04:37", "+05:00")).astimezone(TASHKENT_TZ).strftime("%Y-%m-%d %H:%M")
-    completed = datetime.fromisoformat(completed_at.replace("+04:37", "+05:00")).astimezone(TASHKENT_TZ).strftime("%Y-%m-%d %H:%M") if completed_at else "Not completed"
-    video_link = f"https://t.me/c/2265534780/6/{video_id}" if video_id else "No video available"
+def format_timestamp(timestamp):
+    return datetime.fromtimestamp(timestamp, TASHKENT_TZ).strftime("%Y-%m-%d %H:%M")
+
+def format_task_info(chat_id, task):
+    task_id, task_name, task_time, status, notified_ts, video_id, completed_ts = task
+    notified = format_timestamp(notified_ts) if notified_ts else "Not notified"
+    completed = format_timestamp(completed_ts) if completed_ts else "Not completed"
+    results_thread = topics.thread(chat_id, "results")
+    video_link = f"https://t.me/c/{chat_link_id(chat_id)}/{results_thread}/{video_id}" if video_id else "No video available"
     
     return (
         f"📋 **Task Details**\n"
@@ -259,54 +348,86 @@ def format_task_info(task):
         f"Video Link: {video_link}"
     )
 
-def format_search_results(results, query):
-    if '-' in query and len(query.split('-')) == 3:  # Date search (YYYY-MM-DD)
-        return "\n".join([f"{task[1]}: {datetime.fromisoformat(task[4].replace('+04:37', '+05:00')).astimezone(TASHKENT_TZ).strftime('%Y-%m-%d %H:%M')}" for task in results])
-    else:  # Activity name or activity:time search
-        return "\n".join([f"{task[1]}: {datetime.fromisoformat(task[4].replace('+04:37', '+05:00')).astimezone(TASHKENT_TZ).strftime('%Y-%m-%d %H:%M')}" for task in results])
+def format_search_results(results, query, first_number=1):
+    lines = []
+    for number, task in enumerate(results, first_number):
+        notified = format_timestamp(task[4]) if task[4] else "not notified"
+        lines.append(f"{number}. {task[1]}: {notified}")
+    return "\n".join(lines)
 
-@dp.message_handler(content_types=types.ContentType.VIDEO)
 async def handle_video_message(message: Message, state: FSMContext):
-    if message.message_thread_id != TOPIC_ID_TODAYS_RESULTS:
+    if not topics.is_topic(message, "results"):
         return
 
-    task_id = get_latest_pending_task_id()
-    if task_id:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT time, notified_at FROM tasks WHERE id = ?", (task_id,))
-        result = cursor.fetchone()
-        conn.close()
-
-        if result and result[1]:
-            scheduled_time, notified_at = result
-            notified_time = datetime.fromisoformat(notified_at.replace("+04:37", "+05:00")).astimezone(TASHKENT_TZ)
-            now = datetime.now(TASHKENT_TZ)
-            time_diff = (now - notified_time).total_seconds()
-
-            if time_diff <= 2400:
-                chat_id = message.chat.id
-                message_id = message.message_id
-
-                # Generate public link
-                public_link = f"https://t.me/c/{abs(chat_id)}/{message_id}"
-                print(public_link)
-
-                # Save video ID and mark task completed
-                video_id = message.video.file_id
-                mark_task_completed(task_id, video_id, now.strftime("%H:%M"))
-
-                await message.reply(f"✅ Task marked as completed!\n📹 Video saved: [View Video]({public_link})", parse_mode="Markdown")
-            else:
-                await message.reply("⚠ This task's 40-minute response window has expired.")
-        else:
-            await message.reply("⚠ No pending task found.")
+    # A new video replaces any question still open about an earlier one
+    await state.finish()
+    windows = await open_windows(message.chat.id)
+    if len(windows) == 1:
+        await complete_task_with_video(message, windows[0][0], message.video.file_id, message.message_id)
+    elif windows:
+        await state.set_state(TaskVideoState.choosing_task)
+        await state.update_data(video_id=message.video.file_id, video_message_id=message.message_id)
+        keyboard = InlineKeyboardMarkup(row_width=1)
+        keyboard.add(*[
+            InlineKeyboardButton(text=f"{task_text} (until {deadline:%H:%M})", callback_data=f"video:{task_id}")
+            for task_id, task_text, deadline in windows
+        ])
+        await message.reply("❓ Several tasks are open. Which one is this video for?", reply_markup=keyboard)
     else:
-        waiting_for_task[message.from_user.id] = message.video.file_id
+        # The pending video lives in FSM data, so it survives restarts and expires with the state
         await state.set_state(TaskVideoState.waiting_for_task_name)
-        await message.reply("❓ What is this video for? Use format: TaskName: HH:MM")
+        await state.update_data(video_id=message.video.file_id)
+        await message.reply("❓ No reminder is open right now. What is this video for? Use format: TaskName: HH:MM")
+
+async def open_windows(chat_id):
+    """(task_id, task_text, deadline) of the tasks whose reminder fired in the last 40 minutes."""
+    if run_schedulers and alone():
+        return reminder_scheduler.windows.list(chat_id)  # Kept in memory by the only scheduler
+    # Reminders are (also) sent by other processes; read everyone's claims from the database
+    now = datetime.now(TASHKENT_TZ)
+    rows = await get_open_windows(chat_id, int((now - RESPONSE_WINDOW).timestamp()))
+    return [
+        (task_id, task_text, datetime.fromtimestamp(notified_ts, TASHKENT_TZ) + RESPONSE_WINDOW)
+        for task_id, task_text, notified_ts in rows
+    ]
+
+async def complete_task_with_video(message: Message, task_id, video_id, video_message_id):
+    chat_id = message.chat.id
+    now = datetime.now(TASHKENT_TZ)
+    if not any(window[0] == task_id for window in await open_windows(chat_id)):
+        await message.reply("⚠ This task's 40-minute response window has expired.")
+        return
+    reminder_scheduler.windows.close(chat_id, task_id)
+    if not await mark_task_completed(chat_id, task_id, video_id, now.strftime("%H:%M")):
+        await message.reply("⚠ This task was already marked as missed.")
+        return
+    public_link = f"https://t.me/c/{chat_link_id(chat_id)}/{video_message_id}"
+    await message.reply(f"✅ Task marked as completed!\n📹 Video saved: [View Video]({public_link})", parse_mode="Markdown")
+
+async def process_video_task_choice(callback_query: types.CallbackQuery, state: FSMContext):
+    user_data = await state.get_data()
+    _, _, value = callback_query.data.partition(":")
+    await bot.answer_callback_query(callback_query.id)
+    if not value.isdigit() or not user_data.get("video_id"):
+        await state.finish()
+        await callback_query.message.reply("⚠ Invalid selection.")
+        return
+    await state.finish()
+    await callback_query.message.edit_reply_markup(reply_markup=None)
+    await complete_task_with_video(
+        callback_query.message, int(value), user_data["video_id"], user_data["video_message_id"]
+    )
+
+async def abandon_video_choice(message: Message, state: FSMContext):
+    """A message sent instead of picking a task drops the pending choice and is handled as usual."""
+    await state.finish()
+    StateFilter.ctx_state.set(None)  # aiogram caches the state it resolved; keep it in step
+    await dp.process_update(types.Update.get_current())
+
+async def expired_video_choice(callback_query: types.CallbackQuery):
+    await bot.answer_callback_query(callback_query.id, "⚠ This choice has expired. Send the video again.")
+    await callback_query.message.edit_reply_markup(reply_markup=None)
 
-@dp.message_handler(state=TaskVideoState.waiting_for_task_name)
 async def process_task_name(message: Message, state: FSMContext):
     if ":" in message.text:
         parts = message.text.split(":", 1)  # Split only at the first colon
@@ -315,11 +436,13 @@ async def process_task_name(message: Message, state: FSMContext):
             task_time = parts[1].strip()
 
             if len(task_time) == 5 and task_time[2] == ":" and task_time.replace(":", "").isdigit():
-                video_id = waiting_for_task.get(message.from_user.id)
+                video_id = (await state.get_data()).get("video_id")
                 if video_id:
                     now = datetime.now(TASHKENT_TZ)
-                    save_task_video(task_name, now.strftime("%H:%M"), message.message_id, now.strftime("%H:%M"))
-                    del waiting_for_task[message.from_user.id]
+                    await save_task_video(
+                        message.chat.id, message.from_user.id, task_name,
+                        now.strftime("%H:%M"), message.message_id, now.strftime("%H:%M")
+                    )
                     await state.finish()
                     await message.reply(f"✅ Task '{task_name}' at {task_time} saved with video.")
                 else:
@@ -331,44 +454,22 @@ async def process_task_name(message: Message, state: FSMContext):
     else:
         await message.reply("⚠ Invalid format. Use: TaskName: HH:MM")
 
+async def outbox_sender():
+    # Resend anything left over from the previous run, then deliver new messages
+    await outbox.restore()
+    await outbox.run()
+
 async def task_scheduler():
-    while True:
-        now = datetime.now(TASHKENT_TZ).strftime("%H:%M")
-        tasks = get_pending_tasks()
-        
-        for task in tasks:
-            task_id, task_text, task_time, notified_at = task
-            if task_time == now and not notified_at:
-                current_time = datetime.now(TASHKENT_TZ).isoformat()
-                await bot.send_message(
-                    chat_id=-1002265534780,
-                    text=f"Reminder: {task_text} - Please complete it!",
-                    message_thread_id=TOPIC_ID_TODAYS_RESULTS
-                )
-                
-                conn = sqlite3.connect(DB_NAME)
-                cursor = conn.cursor()
-                cursor.execute("UPDATE tasks SET notified_at = ? WHERE id = ?", (current_time, task_id))
-                conn.commit()
-                conn.close()
-                
-                await asyncio.sleep(2400)
-                if get_latest_pending_task_id() == task_id:  # Check if still pending
-                    mark_task_missed(task_id)
-                    await bot.send_message(
-                        chat_id=-1002265534780,
-                        text=f"❌ Task missed: {task_text}",
-                        message_thread_id=TOPIC_ID_TODAYS_RESULTS
-                    )
-        
-        await asyncio.sleep(30)
+    # Build the deadline queue once; save_task keeps it current afterwards
+    await reminder_scheduler.load()
+    await reminder_scheduler.run()
 
 async def daily_bills_report_scheduler():
     while True:
         now = datetime.now(TASHKENT_TZ)
         # Check if it's 10:00 PM (22:00) each day
-        if now.hour == 22 and now.minute == 0:
-            await generate_daily_bills_report(-1002265534780)  # Send to the same chat as task reminders
+        if now.hour == 22 and now.minute == 0 and await claim_run("daily_bills_report", now.date().isoformat()):
+            await send_daily_bills_reports()
         
         # Wait until 10:00 PM tomorrow or the next minute if past 10:00 PM today
         next_check = now.replace(hour=22, minute=0, second=0, microsecond=0)
@@ -377,31 +478,65 @@ async def daily_bills_report_scheduler():
         wait_time = (next_check - now).total_seconds()
         await asyncio.sleep(wait_time)
 
+async def retention_scheduler():
+    from retention import run_retention
+    while True:
+        # Once a day at ARCHIVE_HOUR, when the chats are quiet
+        now = datetime.now(TASHKENT_TZ)
+        next_run = now.replace(hour=ARCHIVE_HOUR, minute=0, second=0, microsecond=0)
+        if now >= next_run:
+            next_run += timedelta(days=1)
+        await asyncio.sleep((next_run - now).total_seconds())
+        if not await claim_run("retention", next_run.date().isoformat()):
+            continue
+        try:
+            await run_retention()
+        except Exception as e:
+            logger.exception("retention run failed: %s", e)
+
+async def send_daily_bills_reports():
+    # One query per table for every chat instead of a round of queries per chat
+    today = datetime.now(TASHKENT_TZ).date().isoformat()
+    yesterday = (datetime.now(TASHKENT_TZ).date() - timedelta(days=1)).isoformat()
+    versions = report_cache.versions()
+    today_summaries = await get_bills_summaries_by_chat(today)
+    yesterday_summaries = await get_bills_summaries_by_chat(yesterday)
+    today_bills = await get_bills_by_chat(today)
+    # Chats that track bills: those with a bills topic, and any that recorded bills today
+    chats = {chat_id for chat_id in topics.chats() if topics.thread(chat_id, "bills") is not None}
+    for chat_id in chats | set(today_summaries):
+        report = format_daily_bills_report(
+            today, today_summaries.get(chat_id), yesterday_summaries.get(chat_id), today_bills.get(chat_id)
+        )
+        report_cache.put(("bills_daily", chat_id, today), report, chat_id, yesterday, today, versions.get(chat_id, 0))
+        await outbox.send_message(chat_id, report, message_thread_id=topics.thread(chat_id, "bills"))
+
 async def generate_daily_bills_report(chat_id):
     today = datetime.now(TASHKENT_TZ).date().isoformat()
     yesterday = (datetime.now(TASHKENT_TZ).date() - timedelta(days=1)).isoformat()
+    key = ("bills_daily", chat_id, today)
+    await sync_report_cache(chat_id)
+    report = report_cache.get(key)
+    if report is None:
+        version = report_cache.version(chat_id)
+        # Totals come from the bills_daily rollup; only today's rows are read for the listing
+        today_summary = await get_bills_summary(chat_id, today)
+        yesterday_summary = await get_bills_summary(chat_id, yesterday)
+        today_bills = await get_daily_bills(chat_id, today) if today_summary else None
+        report = format_daily_bills_report(today, today_summary, yesterday_summary, today_bills)
+        report_cache.put(key, report, chat_id, yesterday, today, version)
+    await outbox.send_message(chat_id, report, message_thread_id=topics.thread(chat_id, "bills"))
+
+def format_daily_bills_report(today, today_summary, yesterday_summary, today_bills):
+    if not today_summary:
+        return "⚠ No bill transactions recorded for today."
     
-    # Get today's bills
-    today_bills = get_daily_bills(today)
-    yesterday_bills = get_yesterday_bills()
-    
-    if not today_bills:
-        await bot.send_message(chat_id, "⚠ No bill transactions recorded for today.")
-        return
-    
-    # Calculate today's totals
-    today_income = sum(amount for _, amount, _, _ in today_bills if amount > 0)
-    today_expenses = sum(abs(amount) for _, amount, _, _ in today_bills if amount < 0)
-    today_balance = today_income - today_expenses
-    
-    # Calculate yesterday's totals (if any)
-    yesterday_income = sum(amount for _, amount, _, _ in yesterday_bills if amount > 0) if yesterday_bills else 0
-    yesterday_expenses = sum(abs(amount) for _, amount, _, _ in yesterday_bills if amount < 0) if yesterday_bills else 0
-    yesterday_balance = yesterday_income - yesterday_expenses if yesterday_bills else 0
+    today_income, today_expenses, _, _, today_balance = today_summary
+    yesterday_expenses = yesterday_summary[1] if yesterday_summary else 0
     
     # Determine productivity compared to yesterday
     productivity_comparison = "more productive" if today_expenses < yesterday_expenses else "less productive" if today_expenses > yesterday_expenses else "equally productive"
-    if not yesterday_bills:
+    if not yesterday_summary:
         productivity_comparison = "no data from yesterday for comparison"
     
     # Format the report
@@ -418,7 +553,65 @@ async def generate_daily_bills_report(chat_id):
         transactions = "\n".join([f"- {type.capitalize()}: ${abs(amount):.2f} at {time} - {description}" for type, amount, description, time in today_bills])
         report += f"\n\n🔍 **Today’s Transactions:**\n{transactions}"
     
-    await bot.send_message(chat_id, report)
+    return report
+
+MAX_DAILY_ROWS = 62  # Longer spans are broken down by month to keep the message short
+
+def bills_period_range(period, today):
+    """Map 'week', 'month', 'year' or 'YYYY-MM-DD..YYYY-MM-DD' to an inclusive (start, end) date pair."""
+    if period == "week":
+        return today - timedelta(days=6), today
+    if period == "month":
+        return today.replace(day=1), today
+    if period == "year":
+        return today.replace(month=1, day=1), today
+    start, _, end = period.partition("..")
+    start = datetime.strptime(start.strip(), "%Y-%m-%d").date()
+    end = datetime.strptime(end.strip(), "%Y-%m-%d").date() if end else start
+    return min(start, end), max(start, end)
+
+async def generate_bills_range_report(chat_id, period):
+    try:
+        start_date, end_date = bills_period_range(period, datetime.now(TASHKENT_TZ).date())
+    except ValueError:
+        await outbox.send_message(
+            chat_id, "⚠ Use: /report week, /report month, /report year or /report YYYY-MM-DD..YYYY-MM-DD",
+            message_thread_id=topics.thread(chat_id, "bills")
+        )
+        return
+    
+    start, end = start_date.isoformat(), end_date.isoformat()
+    key = ("bills_range", chat_id, start, end)
+    await sync_report_cache(chat_id)
+    report = report_cache.get(key)
+    if report is None:
+        version = report_cache.version(chat_id)
+        rows = await get_bills_range(chat_id, start, end, (end_date - start_date).days >= MAX_DAILY_ROWS)
+        report = format_bills_range_report(start_date, end_date, rows)
+        report_cache.put(key, report, chat_id, start, end, version)
+    await outbox.send_message(chat_id, report, message_thread_id=topics.thread(chat_id, "bills"))
+
+def format_bills_range_report(start_date, end_date, rows):
+    if not rows:
+        return f"⚠ No bill transactions recorded between {start_date} and {end_date}."
+    
+    by_month = (end_date - start_date).days >= MAX_DAILY_ROWS
+    income = sum(row[1] for row in rows)
+    expenses = sum(row[2] for row in rows)
+    transactions = sum(row[3] + row[4] for row in rows)
+    breakdown = "\n".join([
+        f"- {period_key}: +${day_income:.2f} / -${day_expenses:.2f} → ${balance:.2f} (running ${running:.2f})"
+        for period_key, day_income, day_expenses, _, _, balance, running in rows
+    ])
+    report = (
+        f"💰 **Bills Report {start_date} – {end_date}**\n"
+        f"🌞 Income: ${income:.2f}\n"
+        f"💸 Expenses: ${expenses:.2f}\n"
+        f"💵 Balance: ${income - expenses:.2f}\n"
+        f"🧾 Transactions: {transactions}\n\n"
+        f"📅 **{'Monthly' if by_month else 'Daily'} Breakdown:**\n{breakdown}"
+    )
+    return report
 
 async def weekly_report_scheduler():
     global startup_time
@@ -429,7 +622,8 @@ async def weekly_report_scheduler():
         
         # Check if it's the same time as startup, 7 days later
         if (now.date() - startup_day).days == 7 and now.time().hour == startup_time_of_day.hour and now.time().minute == startup_time_of_day.minute:
-            await generate_weekly_report(-1002265534780)  # Send to the same chat as task reminders
+            if await claim_run("weekly_report", now.date().isoformat()):
+                await send_weekly_reports()
         
         # Wait until the next day or the exact startup time on the 7th day
         next_check = now.replace(hour=startup_time_of_day.hour, minute=startup_time_of_day.minute, second=0, microsecond=0)
@@ -438,38 +632,48 @@ async def weekly_report_scheduler():
         wait_time = (next_check - now).total_seconds()
         await asyncio.sleep(wait_time)
 
-async def generate_weekly_report(chat_id):
-    # Get response times for the last 7 days up to today
+def weekly_report_range():
+    # The last 7 days up to today (inclusive)
     end_date = datetime.now(TASHKENT_TZ).date()
-    start_date = end_date - timedelta(days=6)  # Last 7 days (inclusive)
+    start_date = end_date - timedelta(days=6)
+    return start_date.isoformat(), end_date.isoformat()
+
+async def send_weekly_reports():
+    # Response times of every chat come from one query
+    start, end = weekly_report_range()
+    await sync_report_cache()  # Writes by other processes since the charts were cached
+    versions = report_cache.versions()
+    by_chat = await get_response_times_by_chat(start, end)
+    for chat_id in set(topics.chats()) | set(by_chat):
+        key = ("weekly", chat_id, start, end)
+        messages = report_cache.get(key)  # Charts already rendered for /report are not drawn again
+        if messages is None:
+            messages = await build_weekly_report(by_chat.get(chat_id, {}))
+            report_cache.put(key, messages, chat_id, start, end, versions.get(chat_id, 0))
+        await send_weekly_report(chat_id, messages)
 
-    response_times = {}
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT date(notified_at), 
-               (strftime('%s', completed_at) - strftime('%s', notified_at)) / 60.0 AS response_time
-        FROM tasks 
-        WHERE completed_at IS NOT NULL 
-          AND notified_at IS NOT NULL
-          AND completed_at > notified_at
-          AND date(notified_at) BETWEEN ? AND ?
-        ORDER BY date(notified_at)
-    """, (start_date.isoformat(), end_date.isoformat()))
-    
-    data = cursor.fetchall()
-    conn.close()
-    
-    for date, response_minutes in data:
-        if response_minutes is not None and response_minutes >= 0:
-            if date not in response_times:
-                response_times[date] = []
-            response_times[date].append(response_minutes)
+async def generate_weekly_report(chat_id):
+    start, end = weekly_report_range()
+    key = ("weekly", chat_id, start, end)
+    await sync_report_cache(chat_id)
+    messages = report_cache.get(key)
+    if messages is None:
+        version = report_cache.version(chat_id)
+        messages = await build_weekly_report(await get_response_times_between(chat_id, start, end))
+        report_cache.put(key, messages, chat_id, start, end, version)
+    await send_weekly_report(chat_id, messages)
+
+async def send_weekly_report(chat_id, messages):
+    for text, png in messages:
+        if png is None:
+            await outbox.send_message(chat_id, text)
+        else:
+            await outbox.send_photo(chat_id, png, caption=text)
 
+async def build_weekly_report(response_times):
+    """Return the report as (text, png or None) messages, ready to send or cache."""
     if not response_times:
-        await bot.send_message(chat_id, "⚠ No response time data found for the last 7 days.")
-        return
+        return [("⚠ No response time data found for the last 7 days.", None)]
 
     all_response_times = []  # Collect all valid response times in minutes
     dates = list(response_times.keys())
@@ -487,15 +691,13 @@ async def generate_weekly_report(chat_id):
                     minutes = MAX_REASONABLE_MINUTES  # Cap at 24 hours
                 all_response_times.append(minutes)
             except (ValueError, TypeError) as e:
-                print(f"Error processing value for {date}: {e}")
+                logger.warning("bad response time date=%s: %s", date, e)
                 continue
 
     if not all_response_times:
         if warnings:
-            await bot.send_message(chat_id, "⚠ No valid response time data available after filtering.\n" + "\n".join(warnings))
-        else:
-            await bot.send_message(chat_id, "⚠ No valid response time data available.")
-        return
+            return [("⚠ No valid response time data available after filtering.\n" + "\n".join(warnings), None)]
+        return [("⚠ No valid response time data available.", None)]
 
     # Calculate statistics
     avg_response_time_minutes = sum(all_response_times) / len(all_response_times)
@@ -508,23 +710,10 @@ async def generate_weekly_report(chat_id):
     else:  # 24 hours or more
         avg_response_time_display = f"{avg_response_time_minutes / 1440:.1f} days"
 
-    # Line Chart - Response Time Trend (in minutes, one point per day or all points)
-    plt.figure(figsize=(6, 4))
+    # Line Chart - Response Time Trend (in minutes, one point per day), rendered in a worker process
     daily_averages = [sum(response_times[date]) / len(response_times[date]) for date in dates if response_times[date]]
-    plt.plot(dates, daily_averages, marker="o", linestyle="-", color="#FFA500")
-    plt.xlabel("Date")
-    plt.ylabel("Avg Response Time (minutes)")
-    plt.title("Task Response Time Trend")
-    plt.xticks(rotation=45)
-    plt.grid(True, linestyle="--", alpha=0.7)  # Add grid for better readability
-    
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png", bbox_inches="tight")
-    buf.seek(0)
-    plt.close()
-
-    await bot.send_photo(chat_id, InputFile(buf, "response_time_trend.png"), 
-                         caption="📈 Task Response Time Trend")
+    from chart_rendering import render_response_time_chart  # Loaded on the first report only
+    png = await render_response_time_chart(dates, daily_averages)
 
     # Detailed report with warnings if any
     report = (
@@ -535,28 +724,200 @@ async def generate_weekly_report(chat_id):
     )
     if warnings:
         report += f"\n⚠ Warnings:\n" + "\n".join(warnings)
-    await bot.send_message(chat_id, report)
+    return [("📈 Task Response Time Trend", png), (report, None)]
+
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024  # Telegram's limit for documents sent by bots
+EXPORT_USAGE = "⚠ Use: /export tasks|bills [week|month|year|YYYY-MM-DD..YYYY-MM-DD] [csv|jsonl]"
+
+async def handle_export_command(message: Message):
+    from exporter import FORMATS, export_filename, write_export
+
+    args = message.get_args().lower().split()
+    kind = args[0] if args else None
+    options = args[1:]
+    file_format = next((option for option in options if option in FORMATS), "csv")
+    periods = [option for option in options if option not in FORMATS]
+    if kind not in ("tasks", "bills") or len(periods) > 1:
+        await message.reply(EXPORT_USAGE)
+        return
+    start_date = end_date = None
+    if periods:
+        try:
+            start_date, end_date = bills_period_range(periods[0], datetime.now(TASHKENT_TZ).date())
+        except ValueError:
+            await message.reply(EXPORT_USAGE)
+            return
+        start_date, end_date = start_date.isoformat(), end_date.isoformat()
+
+    await message.reply(f"📦 Exporting {kind}...")
+    with tempfile.TemporaryFile() as f:
+        # Encoding and gzip run off the event loop; rows stream from a read-only connection into the file
+        count = await asyncio.get_running_loop().run_in_executor(
+            None, write_export, f, kind, message.chat.id, start_date, end_date, file_format
+        )
+        if f.tell() > MAX_UPLOAD_BYTES:
+            await message.reply("⚠ The export is larger than 50 MB; choose a shorter period.")
+            return
+        f.seek(0)
+        await bot.send_document(
+            message.chat.id, InputFile(f, filename=export_filename(kind, file_format, start_date, end_date)),
+            caption=f"📦 {count} {kind}", message_thread_id=message.message_thread_id
+        )
+
+def timed(handler):
+    # A stuck handler would otherwise hold up every later update of its chat topic
+    return with_timeout(handler, HANDLER_TIMEOUTS.get(handler.__name__, HANDLER_TIMEOUT))
+
+def register_handlers(dp):
+    # Order matters: aiogram runs the first handler whose filters match
+    dp.register_message_handler(timed(handle_topic_command), commands=["topic"])
+    dp.register_message_handler(timed(handle_stats_command), commands=["stats"])
+    dp.register_message_handler(timed(handle_export_command), commands=["export"])
+    dp.register_message_handler(timed(handle_recurring_command), commands=["recurring"])
+    dp.register_message_handler(timed(handle_task_message), lambda message: topics.is_topic(message, "plans"))
+    dp.register_message_handler(
+        timed(handle_bills_report_command),
+        lambda message: message.text and message.text.startswith('/report') and topics.is_topic(message, "bills")
+    )
+    dp.register_message_handler(
+        timed(handle_bills_message),
+        lambda message: message.text and not message.text.startswith('/') and topics.is_topic(message, "bills")
+    )
+    dp.register_message_handler(timed(handle_report_command), commands=["report"])
+    dp.register_message_handler(timed(handle_search_command), commands=["search"])
+    dp.register_message_handler(timed(process_search_query), state=SearchState.waiting_for_query)
+    dp.register_callback_query_handler(timed(process_search_result), state=SearchState.showing_results)
+    dp.register_callback_query_handler(
+        timed(process_video_task_choice), lambda query: query.data.startswith("video:"), state=TaskVideoState.choosing_task
+    )
+    dp.register_callback_query_handler(
+        timed(expired_video_choice), lambda query: query.data.startswith("video:"), state="*"
+    )
+    # A new video is handled in any state; other messages leave the task choice and are re-dispatched
+    dp.register_message_handler(timed(handle_video_message), content_types=types.ContentType.VIDEO, state="*")
+    dp.register_message_handler(
+        timed(abandon_video_choice), content_types=types.ContentType.ANY, state=TaskVideoState.choosing_task
+    )
+    dp.register_message_handler(timed(process_task_name), state=TaskVideoState.waiting_for_task_name)
+
+def create_app(token=TOKEN, schedulers=True, worker=False):
+    """Build the bot, dispatcher and delivery pipeline. Nothing touches the network or the database yet.
+
+    With ``schedulers=False`` reminders and scheduled reports are left to worker.py processes;
+    ``worker=True`` builds such a process, which only learns of new plans by polling for them.
+    """
+    global bot, dp, storage, topics, outbox, reminder_scheduler, update_pool, run_schedulers, startup_time
+    storage = SQLiteStorage()  # Persistent FSM state; entries expire after a day of inactivity
+    bot = Bot(token=token)
+    dp = Dispatcher(bot, storage=storage)
+    if METRICS_ENABLED:
+        from metrics_middleware import MetricsMiddleware
+        metrics.enable()
+        dp.middleware.setup(MetricsMiddleware())
+
+    # Plans, results and bills topics of every chat the bot serves
+    topics = TopicRegistry()
+    # Scheduled reminders and reports are delivered through the rate-limited outbox
+    outbox = Outbox(bot)
+    # The bot schedules the plans it saves itself; it only polls for tasks and templates
+    # that workers may have taken over while they are alive
+    reminder_scheduler = ReminderScheduler(
+        outbox, topics, poll_interval=SCHEDULER_POLL_INTERVAL, poll_when=None if worker else lambda: not alone()
+    )
+    # Polling and the webhook both hand updates to this pool; each chat topic stays in order
+    update_pool = UpdatePool(dp, UPDATE_WORKERS)
+    run_schedulers = schedulers
+    startup_time = datetime.now(TASHKENT_TZ)
+    register_handlers(dp)
+    return dp
+
+background_tasks = []
+metrics_server = None
+
+async def on_heartbeat():
+    # Renewals keep this process's outbox rows its own; orphans of stopped processes are adopted
+    await outbox.restore()
+    # Topics bound with /topic in the bot process reach the workers' reminders and reports
+    await topics.load()
+
+def start_background_tasks():
+    # Called from every entry point; the tasks are only ever created once
+    if background_tasks:
+        return
+    background_tasks.extend([
+        asyncio.create_task(outbox_sender()),
+        asyncio.create_task(heartbeat(on_renew=on_heartbeat)),
+    ])
+    if run_schedulers:
+        background_tasks.extend([
+            asyncio.create_task(task_scheduler()),
+            asyncio.create_task(weekly_report_scheduler()),
+            asyncio.create_task(daily_bills_report_scheduler()),
+            asyncio.create_task(retention_scheduler()),
+        ])
+
+async def start_metrics_server():
+    global metrics_server
+    if metrics.enabled and metrics_server is None:
+        metrics_server = await metrics.start_server(METRICS_HOST, METRICS_PORT)
+        logger.info("metrics listening url=http://%s:%s/metrics", METRICS_HOST, METRICS_PORT)
+
+async def startup(serve_metrics=True, join_delay=0):
+    """``join_delay``: seconds between taking the instance lease and starting the schedulers."""
+    # Schema checks are a single PRAGMA read when the database is already current
+    from database_creation import init_db
+    await run_db(init_db)
+    await topics.load()
+    await renew_instance_lease()  # Before the outbox adopts orphans, so its own rows are never taken
+    if serve_metrics:
+        await start_metrics_server()
+    await asyncio.sleep(join_delay)
+    start_background_tasks()
+
+async def on_startup(dispatcher):
+    await startup()
+
+async def on_shutdown(dispatcher):
+    for task in background_tasks:
+        task.cancel()
+    if metrics_server is not None:
+        await metrics_server.cleanup()
+    chart_rendering = sys.modules.get("chart_rendering")
+    if chart_rendering is not None:
+        chart_rendering.shutdown()
+    await storage.close()
+    await release_instance_lease()  # Lets other processes adopt unsent messages right away
+    close_connection()
+
+async def main(skip_updates=False):
+    await startup()
+    update_pool.start()
 
-async def main():
-    # Start the scheduler tasks
-    asyncio.create_task(task_scheduler())
-    asyncio.create_task(weekly_report_scheduler())
-    asyncio.create_task(daily_bills_report_scheduler())  # Add daily bills report scheduler
-    
     # Start polling
     try:
-        await dp.start_polling(allowed_updates=types.AllowedUpdates.ALL)
+        await dp.reset_webhook(check=False)
+        if skip_updates:
+            await dp.skip_updates()
+        await update_pool.poll(allowed_updates=types.AllowedUpdates.ALL)
     except Exception as e:
-        print(f"Bot stopped: {str(e)}")
+        logger.exception("bot stopped: %s", e)
     finally:
+        await update_pool.stop()
         await bot.close()
+        await on_shutdown(dp)
 
 if __name__ == "__main__":
-    from aiogram import executor
-    from aiogram.utils.executor import start_polling
-
-    loop = asyncio.get_event_loop()
-    loop.create_task(task_scheduler())
-    loop.create_task(weekly_report_scheduler())
-    loop.create_task(daily_bills_report_scheduler())  # Ensure daily bills report scheduler runs
-    start_polling(dp, skip_updates=True)
\ No newline at end of file
+    logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+    create_app(schedulers="--no-schedulers" not in sys.argv)
+    if "--webhook" in sys.argv:
+        from webhook import run_webhook
+        run_webhook(
+            dp, WEBHOOK_URL, WEBHOOK_PATH, WEBAPP_HOST, WEBAPP_PORT,
+            update_pool, secret=WEBHOOK_SECRET,
+            on_startup=on_startup, on_shutdown=on_shutdown
+        )
+    else:
+        try:
+            asyncio.run(main(skip_updates=True))
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,229 @@
+# metrics.py
+"""In-process metrics with Prometheus text exposition.
+
+Nothing is recorded until ``enable()`` is called; instrumented code checks
+``metrics.enabled`` first, so a disabled bot pays one attribute lookup per event.
+"""
+import bisect
+import sys
+import threading
+import time
+
+enabled = False
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 60.0, 300.0, 1800.0)
+
+_lock = threading.Lock()  # SQL metrics are recorded on the database thread
+REGISTRY = []
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values = {}  # label values -> total
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with _lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        REGISTRY.append(self)
+
+    def observe(self, value, *label_values):
+        with _lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def count(self, label_values):
+        series = self.series.get(label_values)
+        return sum(series[:-1]) if series else 0
+
+    def quantile(self, q, label_values):
+        """Upper bound of the bucket holding the q-th observation (Prometheus-style estimate)."""
+        series = self.series.get(label_values)
+        if not series:
+            return None
+        rank = q * sum(series[:-1])
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labels, label_values, [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Time spent in aiogram handlers.", ("handler",))
+HANDLER_TIMEOUTS = Counter("bot_handler_timeouts_total", "Handlers cancelled for running past their timeout.", ("handler",))
+SQL_SECONDS = Histogram("bot_sql_seconds", "Time spent executing and fetching SQL statements.", ("function",), SQL_BUCKETS)
+SQL_ROWS = Counter("bot_sql_rows_total", "Rows returned or changed by SQL statements.", ("function",))
+SCHEDULER_LAG = Histogram("bot_scheduler_lag_seconds", "Fire time minus scheduled time.", ("kind",), LAG_BUCKETS)
+OUTBOX_SEND_SECONDS = Histogram("bot_outbox_send_seconds", "Telegram API latency of outbound messages.", ("kind",))
+OUTBOX_MESSAGES = Counter("bot_outbox_messages_total", "Outbound delivery attempts by result.", ("result",))
+
+
+def render():
+    lines = []
+    with _lock:
+        for metric in REGISTRY:
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def _latency_lines(histogram, top=None):
+    rows = []
+    for label_values, series in histogram.series.items():
+        count = sum(series[:-1])
+        if count:
+            rows.append((series[-1], label_values, count))
+    rows.sort(reverse=True)
+    lines = []
+    for total, label_values, count in rows[:top]:
+        p95 = histogram.quantile(0.95, label_values)
+        lines.append(f"- {'/'.join(map(str, label_values))}: {count}× avg {total / count * 1000:.1f} ms, p95 ≤ {p95 * 1000:g} ms")
+    return lines or ["- no data"]
+
+
+def summary():
+    """Short human-readable digest for the admin /stats command."""
+    with _lock:
+        sections = [
+            ("⏱ Handlers", _latency_lines(HANDLER_SECONDS)),
+            ("🗄 SQL (by total time)", _latency_lines(SQL_SECONDS, top=8)),
+            ("⏰ Scheduler lag", _latency_lines(SCHEDULER_LAG)),
+            ("📤 Outbound sends", _latency_lines(OUTBOX_SEND_SECONDS)),
+        ]
+        results = ", ".join(f"{name}: {value}" for (name,), value in sorted(OUTBOX_MESSAGES.values.items()))
+        timeouts = ", ".join(f"{name}: {value}" for (name,), value in sorted(HANDLER_TIMEOUTS.values.items()))
+    text = "\n\n".join(f"{title}\n" + "\n".join(lines) for title, lines in sections)
+    return f"📈 **Bot metrics**\n\n{text}\n\n📬 Outbox results: {results or 'none'}\n⌛ Handler timeouts: {timeouts or 'none'}"
+
+
+class InstrumentedCursor:
+    """sqlite3 cursor proxy that times each statement and counts its rows.
+
+    A statement's time covers ``execute`` plus the fetches that follow it; it is
+    recorded when the next statement starts or the transaction ends. Statements are
+    labelled with the name of the function that issued them.
+    """
+
+    __slots__ = ("_cursor", "_function", "_elapsed", "_rows")
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._function = None
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def _start(self, function):
+        self.finish()
+        self._function = function
+
+    def finish(self):
+        if self._function is not None:
+            SQL_SECONDS.observe(self._elapsed, self._function)
+            SQL_ROWS.inc(self._function, amount=self._rows)
+            self._function, self._elapsed, self._rows = None, 0.0, 0
+
+    def _run(self, method, *args):
+        self._start(sys._getframe(2).f_code.co_name)
+        started = time.perf_counter()
+        method(*args)
+        self._elapsed += time.perf_counter() - started
+        self._rows += max(self._cursor.rowcount, 0)
+        return self
+
+    def execute(self, sql, parameters=()):
+        return self._run(self._cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(self._cursor.executemany, sql, seq_of_parameters)
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        result = method(*args)
+        self._elapsed += time.perf_counter() - started
+        return result
+
+    def fetchone(self):
+        row = self._fetch(self._cursor.fetchone)
+        self._rows += row is not None
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._fetch(self._cursor.fetchmany, size or self._cursor.arraysize)
+        self._rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(self._cursor.fetchall)
+        self._rows += len(rows)
+        return rows
+
+
+async def start_server(host, port):
+    """Serve ``render()`` at http://host:port/metrics; returns the aiohttp runner to clean up."""
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(body=render().encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,32 @@
+# metrics_middleware.py
+import time
+
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+import metrics
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Records how long each message and callback handler takes, labelled by handler name."""
+
+    def _start(self, data):
+        data["metrics_handler"] = current_handler.get().__name__
+        data["metrics_started"] = time.perf_counter()
+
+    def _stop(self, results, data):
+        handler = data.get("metrics_handler")
+        if handler is not None:
+            metrics.HANDLER_SECONDS.observe(time.perf_counter() - data["metrics_started"], handler)
+
+    async def on_process_message(self, message, data):
+        self._start(data)
+
+    async def on_post_process_message(self, message, results, data):
+        self._stop(results, data)
+
+    async def on_process_callback_query(self, callback_query, data):
+        self._start(data)
+
+    async def on_post_process_callback_query(self, callback_query, results, data):
+        self._stop(results, data)
@@ -0,0 +1,247 @@
+# outbox.py
+import asyncio
+import io
+import logging
+import time
+from collections import deque
+
+from aiogram.types import InputFile
+from aiogram.utils.exceptions import BadRequest, RetryAfter, Unauthorized
+
+import metrics
+from database_async import (
+    add_outbox_message, claim_outbox_messages, delete_outbox_message,
+    record_outbox_attempt, update_outbox_text
+)
+from leases import INSTANCE_ID
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows roughly 30 messages per second overall and 20 per minute to one group
+GLOBAL_RATE = 25.0  # Messages per second across all chats
+GLOBAL_BURST = 25
+CHAT_RATE = 20 / 60  # Messages per second to a single chat
+CHAT_BURST = 5
+COALESCE_DELAY = 1.5  # Seconds a coalescible message waits for siblings before it is sent
+MAX_MESSAGE_LENGTH = 4096
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 2.0  # Seconds, raised to the number of failed attempts
+
+
+def split_text(text, limit=MAX_MESSAGE_LENGTH):
+    """Split ``text`` into parts Telegram accepts, breaking at the last newline that fits."""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].removeprefix("\n")
+    parts.append(text)
+    return parts
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class OutboundMessage:
+    __slots__ = ("id", "chat_id", "thread_id", "kind", "text", "photo", "coalesce_key", "attempts", "ready_at")
+
+    def __init__(self, message_id, chat_id, thread_id, kind, text, photo=None, coalesce_key=None, attempts=0):
+        self.id = message_id
+        self.chat_id = chat_id
+        self.thread_id = thread_id
+        self.kind = kind
+        self.text = text
+        self.photo = photo
+        self.coalesce_key = coalesce_key
+        self.attempts = attempts
+        self.ready_at = 0.0
+
+
+class ChatQueue:
+    __slots__ = ("chat_id", "messages", "bucket", "blocked_until", "busy")
+
+    def __init__(self, chat_id, rate, burst):
+        self.chat_id = chat_id
+        self.messages = deque()
+        self.bucket = TokenBucket(rate, burst)
+        self.blocked_until = 0.0
+        self.busy = False  # One message in flight per chat keeps delivery in order
+
+
+class Outbox:
+    """Persistent, rate-limited delivery queue for outgoing Telegram messages.
+
+    Messages are written to the ``outbox`` table before they are queued and deleted once
+    Telegram accepts them, so nothing is lost across restarts. Each chat has its own token
+    bucket on top of a global one; flood-control errors pause only the affected chat for
+    ``retry_after`` seconds. Messages sent with the same ``coalesce_key`` while the first
+    one is still queued are merged into a single message. Rows are tagged with this
+    process's instance id; ``restore()`` adopts those of processes whose lease expired.
+    """
+
+    def __init__(self, bot, global_rate=GLOBAL_RATE, global_burst=GLOBAL_BURST,
+                 chat_rate=CHAT_RATE, chat_burst=CHAT_BURST, coalesce_delay=COALESCE_DELAY, owner=INSTANCE_ID):
+        self.bot = bot
+        self.owner = owner
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.coalesce_delay = coalesce_delay
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats = {}  # chat_id -> ChatQueue
+        self._coalescing = {}  # coalesce_key -> queued OutboundMessage that can still absorb text
+        self._enqueue_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._sending = set()
+
+    def __len__(self):
+        return sum(len(chat.messages) + chat.busy for chat in self._chats.values())
+
+    async def send_message(self, chat_id, text, message_thread_id=None, coalesce_key=None):
+        # Telegram rejects longer texts with BadRequest, which would drop the whole message
+        async with self._enqueue_lock:
+            for part in split_text(text):
+                pending = self._coalescing.get(coalesce_key) if coalesce_key else None
+                if pending and len(pending.text) + len(part) + 1 <= MAX_MESSAGE_LENGTH:
+                    pending.text += "\n" + part
+                    await update_outbox_text(pending.id, pending.text)
+                    continue
+                message_id = await add_outbox_message(chat_id, message_thread_id, "text", part, None, coalesce_key, self.owner)
+                self._enqueue(OutboundMessage(message_id, chat_id, message_thread_id, "text", part, coalesce_key=coalesce_key))
+
+    async def send_photo(self, chat_id, photo, caption=None, message_thread_id=None):
+        async with self._enqueue_lock:
+            message_id = await add_outbox_message(chat_id, message_thread_id, "photo", caption, photo, owner=self.owner)
+            self._enqueue(OutboundMessage(message_id, chat_id, message_thread_id, "photo", caption, photo))
+
+    async def restore(self):
+        """Queue messages left by a previous run or by another process that has stopped."""
+        async with self._enqueue_lock:
+            orphans = await claim_outbox_messages(self.owner, int(time.time()))
+            for message_id, chat_id, thread_id, kind, text, photo, coalesce_key, attempts in orphans:
+                message = OutboundMessage(message_id, chat_id, thread_id, kind, text, photo, coalesce_key, attempts)
+                self._enqueue(message, delay=0)
+
+    def _enqueue(self, message, delay=None):
+        if delay is None:
+            delay = self.coalesce_delay if message.coalesce_key else 0
+        message.ready_at = time.monotonic() + delay
+        chat = self._chats.get(message.chat_id)
+        if chat is None:
+            chat = self._chats[message.chat_id] = ChatQueue(message.chat_id, self.chat_rate, self.chat_burst)
+        chat.messages.append(message)
+        if message.coalesce_key:
+            self._coalescing[message.coalesce_key] = message
+        self._wakeup.set()
+
+    async def run(self):
+        while True:
+            delay = self._dispatch()
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def wait_empty(self, poll=0.05):
+        while self._chats:
+            await asyncio.sleep(poll)
+
+    def _dispatch(self):
+        """Start delivery for every chat whose next message is allowed now; return the next wake-up delay."""
+        now = time.monotonic()
+        delay = None
+        for chat in list(self._chats.values()):
+            if chat.busy or not chat.messages:
+                continue
+            message = chat.messages[0]
+            wait = max(
+                message.ready_at - now,
+                chat.blocked_until - now,
+                chat.bucket.wait_time(now),
+                self._global.wait_time(now),
+            )
+            if wait > 0:
+                delay = wait if delay is None else min(delay, wait)
+                continue
+
+            chat.messages.popleft()
+            chat.busy = True
+            chat.bucket.take(now)
+            self._global.take(now)
+            if self._coalescing.get(message.coalesce_key) is message:
+                del self._coalescing[message.coalesce_key]
+            task = asyncio.create_task(self._deliver(chat, message))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+        return delay
+
+    async def _send(self, message):
+        if message.kind == "photo":
+            await self.bot.send_photo(
+                message.chat_id, InputFile(io.BytesIO(message.photo), "chart.png"),
+                caption=message.text, message_thread_id=message.thread_id
+            )
+        else:
+            await self.bot.send_message(message.chat_id, message.text, message_thread_id=message.thread_id)
+
+    async def _timed_send(self, message):
+        if not metrics.enabled:
+            return await self._send(message)
+        started = time.perf_counter()
+        try:
+            await self._send(message)
+        finally:
+            metrics.OUTBOX_SEND_SECONDS.observe(time.perf_counter() - started, message.kind)
+
+    async def _deliver(self, chat, message):
+        result = "sent"
+        try:
+            await self._timed_send(message)
+        except RetryAfter as e:
+            # Flood control: hold this chat only, then retry the same message first
+            result = "flood"
+            chat.blocked_until = time.monotonic() + e.timeout
+            chat.messages.appendleft(message)
+        except (BadRequest, Unauthorized) as e:
+            result = "dropped"
+            logger.warning("dropping outbound message id=%s chat_id=%s: %s", message.id, message.chat_id, e)
+            await delete_outbox_message(message.id)
+        except Exception as e:
+            message.attempts += 1
+            await record_outbox_attempt(message.id)
+            if message.attempts >= MAX_ATTEMPTS:
+                result = "dropped"
+                logger.error("dropping outbound message id=%s chat_id=%s attempts=%s: %s", message.id, message.chat_id, message.attempts, e)
+                await delete_outbox_message(message.id)
+            else:
+                result = "retry"
+                chat.blocked_until = time.monotonic() + RETRY_BACKOFF ** message.attempts
+                chat.messages.appendleft(message)
+        else:
+            await delete_outbox_message(message.id)
+        finally:
+            if metrics.enabled:
+                metrics.OUTBOX_MESSAGES.inc(result)
+            chat.busy = False
+            if not chat.messages and self._chats.get(chat.chat_id) is chat:
+                del self._chats[chat.chat_id]
+            self._wakeup.set()
@@ -0,0 +1,311 @@
+# reminder_scheduler.py
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import datetime, timedelta
+
+import pytz
+
+import metrics
+from database_async import (
+    fire_template, get_active_templates, get_pending_tasks, mark_task_missed, mark_task_notified, mark_task_overdue
+)
+
+logger = logging.getLogger(__name__)
+
+TASHKENT_TZ = pytz.timezone("Asia/Tashkent")
+RESPONSE_WINDOW = timedelta(minutes=40)  # Time a user has to answer a reminder with a video
+CATCH_UP_WINDOW = timedelta(hours=3)  # Reminders overdue by up to this much are still sent; older ones are missed
+
+REMIND = "remind"
+MISS = "miss"
+TEMPLATE = "template"  # Next occurrence of a recurring task; its tasks row is created when it fires
+
+WEEKDAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+NAMED_RULES = {
+    "daily": frozenset(range(7)),
+    "weekdays": frozenset(range(5)),
+    "weekends": frozenset((5, 6)),
+}
+
+
+def parse_task_time(task_time):
+    hour, minute = task_time.split(":")
+    return int(hour), int(minute)
+
+
+def next_reminder_due(task_time, now, catch_up=timedelta(0)):
+    """Return the next occurrence of HH:MM, or the last one if it is within ``catch_up``."""
+    hour, minute = parse_task_time(task_time)
+    due = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if due < now.replace(second=0, microsecond=0) - catch_up:
+        due += timedelta(days=1)
+    return due
+
+
+def parse_rule(text):
+    """Normalize 'daily', 'weekdays', 'weekends' or days like 'mon,wed,fri' / 'mon-thu'; None if invalid."""
+    text = text.strip().lower()
+    if text in NAMED_RULES:
+        return text
+    days = set()
+    for part in text.replace(" ", "").split(","):
+        first, dash, last = part.partition("-")
+        if first not in WEEKDAY_NAMES or (dash and last not in WEEKDAY_NAMES):
+            return None
+        start = WEEKDAY_NAMES.index(first)
+        end = WEEKDAY_NAMES.index(last) if last else start
+        days.update(range(start, end + 1) if start <= end else [*range(start, 7), *range(end + 1)])
+    for name, named_days in NAMED_RULES.items():
+        if days == named_days:
+            return name
+    return ",".join(WEEKDAY_NAMES[day] for day in sorted(days))
+
+
+def rule_days(rule):
+    return NAMED_RULES.get(rule) or frozenset(WEEKDAY_NAMES.index(day) for day in rule.split(","))
+
+
+def next_occurrence_due(task_time, rule, now, catch_up=timedelta(0), after_day=None):
+    """Like ``next_reminder_due`` but only on the rule's weekdays and after ``after_day`` (YYYY-MM-DD)."""
+    days = rule_days(rule)
+    due = next_reminder_due(task_time, now, catch_up)
+    while due.weekday() not in days or (after_day and due.date().isoformat() <= after_day):
+        due += timedelta(days=1)
+    return due
+
+
+class OpenWindows:
+    """Notified tasks whose completion window is still open, per chat.
+
+    Filled when a reminder fires and emptied when the task is completed or its miss
+    deadline passes, so a result video finds its task without a query.
+    """
+
+    def __init__(self):
+        self._windows = {}  # chat_id -> {task_id: (task_text, deadline)}
+
+    def open(self, chat_id, task_id, task_text, deadline):
+        self._windows.setdefault(chat_id, {})[task_id] = (task_text, deadline)
+
+    def close(self, chat_id, task_id):
+        """Remove a window; return False if it was not open."""
+        windows = self._windows.get(chat_id)
+        if not windows or windows.pop(task_id, None) is None:
+            return False
+        if not windows:
+            del self._windows[chat_id]
+        return True
+
+    def get(self, chat_id, task_id, now=None):
+        """(task_text, deadline) of one open window, or None."""
+        window = self._windows.get(chat_id, {}).get(task_id)
+        if window is None or window[1] <= (now or datetime.now(TASHKENT_TZ)):
+            return None
+        return window
+
+    def list(self, chat_id, now=None):
+        """Open windows of a chat as (task_id, task_text, deadline), soonest deadline first."""
+        now = now or datetime.now(TASHKENT_TZ)
+        windows = self._windows.get(chat_id, {})
+        return sorted(
+            ((task_id, text, deadline) for task_id, (text, deadline) in windows.items() if deadline > now),
+            key=lambda window: window[2]
+        )
+
+
+class ReminderScheduler:
+    """Keeps upcoming reminder and miss deadlines in a heap and fires each one on time.
+
+    The heap is built once from the database by ``load()`` and then kept up to date
+    through ``schedule_task()``, so the run loop never rescans the ``tasks`` table.
+    Recurring templates keep only their next occurrence in the heap; the ``tasks``
+    row is created when it fires, and the occurrence after it is pushed then.
+
+    With ``poll_interval`` set (when plans are saved by another process, see worker.py)
+    the small pending set is re-read that often to pick up tasks this process has not
+    seen; ``poll_when``, if given, is asked before each poll whether one is needed
+    right now. Every reminder is claimed in the database before it is sent, so schedulers in
+    several processes can share the work without sending anything twice.
+    """
+
+    def __init__(self, outbox, topics, poll_interval=None, poll_when=None):
+        self.outbox = outbox
+        self.topics = topics  # TopicRegistry; reminders go to each chat's results topic
+        self.poll_interval = poll_interval  # Seconds between refresh() calls in run(); None never polls
+        self.poll_when = poll_when
+        self._queue = []  # (due, seq, kind, chat_id, task_id, task_text)
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._running = set()
+        self._tasks = set()  # Ids of pending tasks in the heap
+        self._templates = set()  # Ids of templates whose next occurrence is in the heap
+        self.windows = OpenWindows()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def _push(self, due, kind, chat_id, task_id, task_text):
+        (self._templates if kind == TEMPLATE else self._tasks).add(task_id)
+        entry = (due, next(self._counter), kind, chat_id, task_id, task_text)
+        heapq.heappush(self._queue, entry)
+        # Wake the run loop only if the new deadline is earlier than the one it waits for
+        if self._queue[0] is entry:
+            self._wakeup.set()
+
+    async def load(self, now=None):
+        await self.refresh(now, catch_up=CATCH_UP_WINDOW)
+
+    async def refresh(self, now=None, catch_up=timedelta(0)):
+        """Push pending tasks and active templates that are not in the heap yet.
+
+        A task's reminder is due at the first HH:MM after the plan was saved. One that
+        fell due while no scheduler ran is sent right away if it is at most
+        CATCH_UP_WINDOW late, and marked missed otherwise.
+        """
+        now = now or datetime.now(TASHKENT_TZ)
+        overdue = []
+        for task_id, chat_id, task_text, task_time, notified_ts, created_ts in await get_pending_tasks():
+            if task_id in self._tasks:
+                continue
+            if notified_ts:
+                notified = datetime.fromtimestamp(notified_ts, TASHKENT_TZ)
+                self.windows.open(chat_id, task_id, task_text, notified + RESPONSE_WINDOW)
+                self._push(notified + RESPONSE_WINDOW, MISS, chat_id, task_id, task_text)
+            elif created_ts:
+                due = next_reminder_due(task_time, datetime.fromtimestamp(created_ts, TASHKENT_TZ))
+                if due < now - CATCH_UP_WINDOW:
+                    overdue.append((chat_id, task_id, task_text, due))
+                else:
+                    self._push(due, REMIND, chat_id, task_id, task_text)
+            else:
+                due = next_reminder_due(task_time, now, catch_up=catch_up)
+                self._push(due, REMIND, chat_id, task_id, task_text)
+        for chat_id, task_id, task_text, due in overdue:
+            await self._miss_overdue(chat_id, task_id, task_text, due)
+        for template_id, chat_id, task_text, task_time, rule, last_fired_day in await get_active_templates():
+            if template_id in self._templates:
+                continue
+            due = next_occurrence_due(task_time, rule, now, catch_up, last_fired_day)
+            self._push(due, TEMPLATE, chat_id, template_id, task_text)
+
+    def schedule_task(self, chat_id, task_id, task_text, task_time, now=None):
+        now = now or datetime.now(TASHKENT_TZ)
+        self._push(next_reminder_due(task_time, now), REMIND, chat_id, task_id, task_text)
+
+    def schedule_template(self, chat_id, template_id, task_text, task_time, rule, now=None):
+        if template_id in self._templates:
+            return  # Saved again; its next occurrence is already in the heap
+        now = now or datetime.now(TASHKENT_TZ)
+        self._push(next_occurrence_due(task_time, rule, now), TEMPLATE, chat_id, template_id, task_text)
+
+    def pop_due(self, now):
+        due = []
+        while self._queue and self._queue[0][0] <= now:
+            due.append(heapq.heappop(self._queue))
+        return due
+
+    async def run(self):
+        next_refresh = None
+        while True:
+            now = datetime.now(TASHKENT_TZ)
+            if self.poll_interval:
+                if next_refresh is None:
+                    next_refresh = now + timedelta(seconds=self.poll_interval)
+                elif now >= next_refresh:
+                    if self.poll_when is None or self.poll_when():
+                        try:
+                            # Reminders due since the last poll are still sent
+                            await self.refresh(now, catch_up=timedelta(seconds=self.poll_interval))
+                        except Exception as e:
+                            logger.exception("scheduler refresh failed: %s", e)
+                    next_refresh = now + timedelta(seconds=self.poll_interval)
+            for due, _, kind, chat_id, task_id, task_text in self.pop_due(now):
+                if metrics.enabled:
+                    metrics.SCHEDULER_LAG.observe((now - due).total_seconds(), kind)
+                timer = asyncio.create_task(self._fire(kind, chat_id, task_id, task_text))
+                self._running.add(timer)
+                timer.add_done_callback(self._running.discard)
+
+            deadlines = [entry for entry in (self._queue[0][0] if self._queue else None, next_refresh) if entry]
+            timeout = (min(deadlines) - now).total_seconds() if deadlines else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, kind, chat_id, task_id, task_text):
+        try:
+            if kind == REMIND:
+                await self._remind(chat_id, task_id, task_text)
+            elif kind == TEMPLATE:
+                await self._remind_template(chat_id, task_id, task_text)
+            else:
+                await self._miss(chat_id, task_id, task_text)
+        except Exception as e:
+            logger.exception("fire failed kind=%s chat_id=%s task_id=%s: %s", kind, chat_id, task_id, e)
+
+    def _coalesce_key(self, kind, chat_id, thread_id, now):
+        # Reminders (or misses) for the same chat and minute go out as one message
+        return f"{kind}:{chat_id}:{thread_id}:{now:%Y-%m-%d %H:%M}"
+
+    async def _send_reminder(self, chat_id, task_text, notified_at):
+        thread_id = self.topics.thread(chat_id, "results")
+        await self.outbox.send_message(
+            chat_id=chat_id,
+            text=f"Reminder: {task_text} - Please complete it!",
+            message_thread_id=thread_id,
+            coalesce_key=self._coalesce_key(REMIND, chat_id, thread_id, notified_at)
+        )
+
+    async def _remind(self, chat_id, task_id, task_text):
+        notified_at = datetime.now(TASHKENT_TZ)
+        # Claim before sending: another process may have fired the same reminder
+        if not await mark_task_notified(chat_id, task_id, int(notified_at.timestamp())):
+            self._tasks.discard(task_id)  # The next refresh() picks up its miss deadline, if still pending
+            return
+        await self._send_reminder(chat_id, task_text, notified_at)
+        self.windows.open(chat_id, task_id, task_text, notified_at + RESPONSE_WINDOW)
+        self._push(notified_at + RESPONSE_WINDOW, MISS, chat_id, task_id, task_text)
+
+    async def _miss_overdue(self, chat_id, task_id, task_text, due):
+        if not await mark_task_overdue(chat_id, task_id):
+            return  # Reminded by another process since it was read
+        logger.warning("reminder overdue, marked missed chat_id=%s task_id=%s due=%s", chat_id, task_id, due.isoformat())
+        thread_id = self.topics.thread(chat_id, "results")
+        now = datetime.now(TASHKENT_TZ)
+        await self.outbox.send_message(
+            chat_id=chat_id,
+            text=f"❌ Task missed: {task_text} (its reminder was due at {due:%Y-%m-%d %H:%M} while the bot was offline)",
+            message_thread_id=thread_id,
+            coalesce_key=self._coalesce_key(MISS, chat_id, thread_id, now)
+        )
+
+    async def _remind_template(self, chat_id, template_id, task_text):
+        notified_at = datetime.now(TASHKENT_TZ)
+        fired = await fire_template(chat_id, template_id, int(notified_at.timestamp()))
+        if fired is None:
+            # Stopped since it was scheduled, or this day's occurrence was fired by another
+            # process; refresh() schedules the next occurrence if the template is still active
+            self._templates.discard(template_id)
+            return
+        task_id, task_text, task_time, rule = fired
+        await self._send_reminder(chat_id, task_text, notified_at)
+        self.windows.open(chat_id, task_id, task_text, notified_at + RESPONSE_WINDOW)
+        self._push(notified_at + RESPONSE_WINDOW, MISS, chat_id, task_id, task_text)
+        due = next_occurrence_due(task_time, rule, notified_at, after_day=notified_at.date().isoformat())
+        self._push(due, TEMPLATE, chat_id, template_id, task_text)
+
+    async def _miss(self, chat_id, task_id, task_text):
+        self.windows.close(chat_id, task_id)
+        self._tasks.discard(task_id)
+        if await mark_task_missed(chat_id, task_id):  # False if the task was completed in time or by another process
+            thread_id = self.topics.thread(chat_id, "results")
+            await self.outbox.send_message(
+                chat_id=chat_id,
+                text=f"❌ Task missed: {task_text}",
+                message_thread_id=thread_id,
+                coalesce_key=self._coalesce_key(MISS, chat_id, thread_id, datetime.now(TASHKENT_TZ))
+            )
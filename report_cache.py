@@ -0,0 +1,112 @@
+# report_cache.py
+import threading
+from collections import OrderedDict
+
+CACHE_SIZE = 256  # Cached reports and statistics across all chats
+
+
+class ReportCache:
+    """Bounded LRU of computed reports, invalidated by the writes that change them.
+
+    Every entry belongs to one chat and covers an inclusive date window (``None`` for
+    all-time results). A write for a chat and date drops exactly the entries whose
+    window contains that date, plus the chat's all-time entries. Each invalidation
+    also bumps the chat's version: results computed from a read that started before
+    the write are refused by ``put`` instead of being cached stale.
+
+    Other processes sharing the database (worker.py, the importer) write too. Every
+    write also counts in the chat's row of ``report_versions``; ``sync`` compares that
+    stored version with the one this cache last saw and drops the chat's entries when
+    another process has written since.
+    """
+
+    def __init__(self, max_entries=CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (chat_id, start_date, end_date, value)
+        self._versions = {}  # chat_id -> number of invalidations so far
+        self._stored = {}  # chat_id -> report_versions value the chat's entries are consistent with
+        self._lock = threading.Lock()  # Writes invalidate from the database thread
+
+    def __len__(self):
+        return len(self._entries)
+
+    def version(self, chat_id):
+        return self._versions.get(chat_id, 0)
+
+    def versions(self):
+        """Snapshot of every chat's version, for reads that cover several chats at once."""
+        with self._lock:
+            return dict(self._versions)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[3]
+
+    def put(self, key, value, chat_id, start_date=None, end_date=None, version=None):
+        with self._lock:
+            if version is not None and version != self._versions.get(chat_id, 0):
+                return False  # A write landed while this value was being computed
+            self._entries[key] = (chat_id, start_date, end_date, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def invalidate(self, chat_id, dates=(), stored_version=None):
+        """Drop the chat's entries covering any of ``dates`` (YYYY-MM-DD) and its all-time entries.
+
+        ``stored_version`` is the chat's report_versions value after this process's write;
+        if it follows the last one seen, no other process wrote and the other entries stay.
+        """
+        dates = [date for date in dates if date]
+        with self._lock:
+            self._versions[chat_id] = self._versions.get(chat_id, 0) + 1
+            if stored_version is not None and self._stored.get(chat_id, 0) == stored_version - 1:
+                self._stored[chat_id] = stored_version
+            stale = [
+                key for key, (entry_chat, start, end, _) in self._entries.items()
+                if entry_chat == chat_id and (start is None or any(start <= date <= end for date in dates))
+            ]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def sync(self, chat_id, stored_version):
+        """Drop the chat's entries if its stored version moved on since this cache last saw it."""
+        with self._lock:
+            return self._sync(chat_id, stored_version)
+
+    def sync_all(self, stored_versions):
+        """``sync`` every chat; ``stored_versions`` maps chat_id to version, missing chats count as 0."""
+        with self._lock:
+            chats = set(self._stored) | set(stored_versions) | {entry[0] for entry in self._entries.values()}
+            return sum(self._sync(chat_id, stored_versions.get(chat_id, 0)) for chat_id in chats)
+
+    def _sync(self, chat_id, stored_version):
+        if self._stored.get(chat_id, 0) == stored_version:
+            return 0
+        self._stored[chat_id] = stored_version
+        self._versions[chat_id] = self._versions.get(chat_id, 0) + 1  # Refuse results read before the write
+        stale = [key for key, entry in self._entries.items() if entry[0] == chat_id]
+        for key in stale:
+            del self._entries[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stored.clear()
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+report_cache = ReportCache()
@@ -0,0 +1,150 @@
+# retention.py
+"""Move finished tasks and old bills out of the live database into the archive.
+
+Usage:
+    python -m retention [--days 180] [--batch-size 500]
+    python -m retention --enable-incremental-vacuum
+
+Completed and missed tasks and bills older than ARCHIVE_AFTER_DAYS are copied to the
+archive database (``<DB_NAME>_archive.db``, attached as ``archive``) and deleted from
+the live tables in small batches, so the bot's own queries run in between. The pages
+they free are then released a few at a time with incremental vacuum. Databases created
+before incremental vacuum was enabled need one ``--enable-incremental-vacuum`` run
+while the bot is stopped.
+
+The bills_daily rollup stays live, so bills reports over any span are unaffected;
+the all_tasks view, /search and /export read both databases.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+from config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+from database_actions import day_start_ts
+from database_async import run_db
+from database_connection import ARCHIVE_SCHEMA, ARCHIVED_COLUMNS, close_connection, transaction
+
+logger = logging.getLogger(__name__)
+
+TASHKENT_TZ = pytz.timezone("Asia/Tashkent")
+MIN_ARCHIVE_AFTER_DAYS = 31  # Today's and this week's reports read the live tables only
+VACUUM_PAGES = 256  # Pages released per incremental vacuum step
+BATCH_PAUSE = 0.05  # Seconds between batches, so queued bot queries get the database
+
+# Oldest first; tasks are dated by completion, or by the reminder if they were missed, or
+# by when they were saved if the reminder was never sent (marked missed as overdue)
+EXPIRED_IDS = {
+    "tasks": """SELECT id FROM main.tasks
+                WHERE status IN ('completed', 'missed') AND COALESCE(completed_ts, notified_ts, created_ts) < ?
+                ORDER BY id LIMIT ?""",
+    "bills": "SELECT id FROM main.bills WHERE date < ? ORDER BY id LIMIT ?",
+}
+
+
+def archive_cutoff(days, now=None):
+    """(epoch, YYYY-MM-DD) of local midnight ``days`` days ago; older rows are archived."""
+    now = now or datetime.now(TASHKENT_TZ)
+    cutoff_date = (now.date() - timedelta(days=days)).isoformat()
+    return day_start_ts(cutoff_date), cutoff_date
+
+
+def archive_batch(kind, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move up to ``batch_size`` expired ``kind`` rows to the archive; return how many were selected."""
+    columns = ", ".join(ARCHIVED_COLUMNS[kind])
+    with transaction() as cursor:
+        cursor.execute(EXPIRED_IDS[kind], (cutoff, batch_size))
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            return 0
+        marks = ", ".join("?" * len(ids))
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO {ARCHIVE_SCHEMA}.{kind} ({columns})
+            SELECT {columns} FROM main.{kind} WHERE id IN ({marks})
+        """, ids)
+    # Commits to attached WAL databases are not atomic together, so the copy is committed
+    # first and only rows the archive holds are deleted: a crash in between leaves
+    # duplicates that the next run clears, never a lost row.
+    with transaction() as cursor:
+        cursor.execute(
+            f"DELETE FROM main.{kind} WHERE id IN (SELECT id FROM {ARCHIVE_SCHEMA}.{kind} WHERE id IN ({marks}))",
+            ids
+        )
+    return len(ids)
+
+
+def vacuum_step(pages=VACUUM_PAGES):
+    """Release up to ``pages`` free pages of the live database; return the number left, or None if not enabled."""
+    with transaction() as cursor:
+        cursor.execute("PRAGMA main.auto_vacuum")
+        if cursor.fetchone()[0] != 2:  # INCREMENTAL
+            return None
+        cursor.execute(f"PRAGMA main.incremental_vacuum({int(pages)})")
+        cursor.fetchall()  # Each step of the statement frees one page
+        cursor.execute("PRAGMA main.freelist_count")
+        return cursor.fetchone()[0]
+
+
+def enable_incremental_vacuum():
+    """Switch an existing live database to incremental vacuum; rewrites the whole file once."""
+    with transaction() as cursor:
+        cursor.execute("PRAGMA main.auto_vacuum = INCREMENTAL")
+        cursor.execute("VACUUM main")
+
+
+async def run_retention(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, pause=BATCH_PAUSE, now=None):
+    """Archive expired rows batch by batch, then vacuum; return ``{kind: rows moved}``."""
+    if days < MIN_ARCHIVE_AFTER_DAYS:
+        raise ValueError(f"retention horizon must be at least {MIN_ARCHIVE_AFTER_DAYS} days")
+    cutoff_ts, cutoff_date = archive_cutoff(days, now)
+    moved = {}
+    for kind, cutoff in (("tasks", cutoff_ts), ("bills", cutoff_date)):
+        moved[kind] = 0
+        while True:
+            count = await run_db(archive_batch, kind, cutoff, batch_size)
+            moved[kind] += count
+            if count < batch_size:
+                break
+            await asyncio.sleep(pause)
+
+    free_pages = await run_db(vacuum_step)
+    if free_pages is None:
+        logger.info("incremental vacuum is off; run python -m retention --enable-incremental-vacuum once")
+    while free_pages:
+        await asyncio.sleep(pause)
+        free_pages = await run_db(vacuum_step)
+    logger.info("archived tasks=%s bills=%s before=%s", moved["tasks"], moved["bills"], cutoff_date)
+    return moved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m retention", description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="archive rows older than this")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="convert the live database (full VACUUM; stop the bot first)")
+    args = parser.parse_args(argv)
+    if args.days < MIN_ARCHIVE_AFTER_DAYS:
+        parser.error(f"--days must be at least {MIN_ARCHIVE_AFTER_DAYS}")
+
+    from database_creation import init_db
+    init_db()
+    started = time.perf_counter()
+    try:
+        if args.enable_incremental_vacuum:
+            enable_incremental_vacuum()
+            print(f"Incremental vacuum enabled in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+            return 0
+        moved = asyncio.run(run_retention(args.days, args.batch_size, pause=0))
+    finally:
+        close_connection()
+    print(f"Archived {moved['tasks']} tasks and {moved['bills']} bills in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+# tenants.py
+from config import DEFAULT_CHAT_ID, DEFAULT_TOPICS
+from database_async import get_chat_topics, set_chat_topic
+
+TOPIC_ROLES = ("plans", "results", "bills")
+
+
+class TopicRegistry:
+    """Which forum topic of each chat plays which role (plans, results, bills).
+
+    Bindings are stored in ``chat_topics`` and cached here; the original group keeps
+    ``DEFAULT_TOPICS`` until an admin rebinds a topic with ``/topic``. ``/topic`` runs
+    in the bot, so every process calls ``load()`` again on each lease renewal.
+    """
+
+    def __init__(self):
+        self._topics = {DEFAULT_CHAT_ID: dict(DEFAULT_TOPICS)}  # chat_id -> {role: thread_id}
+
+    async def load(self):
+        loaded = {DEFAULT_CHAT_ID: dict(DEFAULT_TOPICS)}
+        for chat_id, role, thread_id in await get_chat_topics():
+            loaded.setdefault(chat_id, {})[role] = thread_id
+        self._topics = loaded
+
+    def chats(self):
+        return list(self._topics)
+
+    def thread(self, chat_id, role):
+        return self._topics.get(chat_id, {}).get(role)
+
+    def is_topic(self, message, role):
+        thread_id = self.thread(message.chat.id, role)
+        return thread_id is not None and message.message_thread_id == thread_id
+
+    async def set_topic(self, chat_id, role, thread_id):
+        await set_chat_topic(chat_id, role, thread_id)
+        self._topics.setdefault(chat_id, {})[role] = thread_id
@@ -0,0 +1,96 @@
+# tests/conftest.py
+import asyncio
+import itertools
+import os
+import sys
+
+import pytest
+from aiogram import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database_connection  # noqa: E402
+from config import DEFAULT_CHAT_ID, DEFAULT_TOPICS  # noqa: E402
+from database_creation import init_db  # noqa: E402
+from fake_bot import FakeBot  # noqa: E402
+from report_cache import report_cache  # noqa: E402
+
+CHAT_ID = DEFAULT_CHAT_ID
+USER_ID = 1001
+_update_ids = itertools.count(1)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh, migrated database in a temporary directory."""
+    database_connection.close_connection()
+    monkeypatch.setattr(database_connection, "DB_NAME", str(tmp_path / "test.db"))
+    init_db()
+    report_cache.clear()
+    yield tmp_path / "test.db"
+    database_connection.close_connection()
+
+
+@pytest.fixture
+def app(db):
+    """main's bot, dispatcher and outbox with every Telegram call going to a FakeBot."""
+    import main
+    main.create_app(token="123456:test")
+    main.fake_bot = FakeBot().install(main.bot)
+    yield main
+
+
+async def dispatch(app, *updates):
+    """Run updates through the app's UpdatePool, one after another, as polling would deliver them."""
+    await app.topics.load()
+    app.update_pool.start()
+    try:
+        for update in updates:
+            await app.update_pool.submit(update)
+            for queue in app.update_pool.queues:
+                await queue.join()
+    finally:
+        await app.update_pool.stop()
+        await app.storage.close()
+
+
+async def delivered(app, *updates):
+    """Dispatch updates, wait until the outbox has sent what they queued, and return the sent texts."""
+    app.fake_bot.calls.clear()
+    sender = asyncio.create_task(app.outbox.run())
+    try:
+        await dispatch(app, *updates)
+        await app.outbox.wait_empty(poll=0.01)
+    finally:
+        sender.cancel()
+    return app.fake_bot.sent
+
+
+def message_update(text=None, topic=None, chat_id=CHAT_ID, user_id=USER_ID, video=None, thread_id=None):
+    """Update carrying a message in one of DEFAULT_TOPICS (``topic``) or in ``thread_id``."""
+    update_id = next(_update_ids)
+    message = {
+        "message_id": update_id, "date": 0,
+        "chat": {"id": chat_id, "type": "supergroup", "is_forum": True},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+    }
+    thread_id = DEFAULT_TOPICS[topic] if topic else thread_id
+    if thread_id:
+        message.update(message_thread_id=thread_id, is_topic_message=True)
+    if text is not None:
+        message["text"] = text
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    if video is not None:
+        message["video"] = {"file_id": video, "file_unique_id": video, "width": 1, "height": 1, "duration": 1}
+    return types.Update(update_id=update_id, message=message)
+
+
+def callback_update(data, topic=None, chat_id=CHAT_ID, user_id=USER_ID):
+    update_id = next(_update_ids)
+    message = message_update("buttons", topic, chat_id).message.to_python()
+    return types.Update(update_id=update_id, callback_query={
+        "id": str(update_id), "chat_instance": "1", "data": data,
+        "from": {"id": user_id, "is_bot": False, "first_name": "Test"}, "message": message,
+    })
@@ -0,0 +1,121 @@
+# tests/test_analytics.py
+from datetime import date, datetime
+
+import numpy as np
+import pytest
+
+import analytics
+from analytics import COMPLETED, DAY, HISTORY_DTYPE, MISSED, TASHKENT_TZ
+from conftest import CHAT_ID
+from database_connection import transaction
+
+NOW = TASHKENT_TZ.localize(datetime(2025, 3, 12, 12, 0))  # A Wednesday
+OFFSET = 5 * 60 * 60  # Tashkent is UTC+5 all year
+T = (date(2025, 3, 12) - date(1970, 1, 1)).days  # Local day number of NOW
+
+
+def record(activity, status, day, hour=12, response=None):
+    """One history row notified at ``hour`` local time on ``day``, completed ``response`` minutes later."""
+    notified = day * DAY - OFFSET + hour * 3600
+    completed = notified + response * 60 if response is not None else 0
+    return activity, status, hour, notified, completed
+
+
+def history(*records):
+    return np.array(list(records), dtype=HISTORY_DTYPE)
+
+
+def test_load_history_numbers_activities_and_skips_pending_tasks(db):
+    with transaction() as cursor:
+        cursor.executemany(
+            "INSERT INTO tasks (chat_id, task, time, status, notified_ts, completed_ts) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (CHAT_ID, " Gym ", "07:05", "completed", 1000, 1600),
+                (CHAT_ID, "read", "21:30", "missed", 2000, None),
+                (CHAT_ID, "gym", "7:00", "missed", None, None),
+                (CHAT_ID, "Walk", "09:00", "pending", None, None),
+                (CHAT_ID + 1, "Swim", "06:00", "completed", 3000, 3300),
+            ]
+        )
+    names, rows = analytics.load_history(CHAT_ID)
+    assert names == ["gym", "read"]
+    assert sorted(rows.tolist()) == [(0, COMPLETED, 7, 1000, 1600), (0, MISSED, 7, 0, 0), (1, MISSED, 21, 2000, 0)]
+
+
+def test_response_percentiles_are_capped_and_use_completed_videos_only():
+    rows = history(
+        *(record(0, COMPLETED, T, response=minutes) for minutes in (10, 20, 30, 40, 2000)),
+        record(0, MISSED, T),
+        (0, COMPLETED, 12, 0, 5000),  # Never notified
+    )
+    percentiles, count = analytics.response_percentiles(rows)
+    assert count == 5
+    # Sorted minutes 10, 20, 30, 40, 1440 (capped); linear interpolation between ranks
+    assert percentiles == pytest.approx({50: 30.0, 90: 40 + 0.6 * 1400, 99: 40 + 0.96 * 1400})
+
+
+def test_rolling_completion_compares_each_window_with_the_one_before():
+    days = np.array([T, T, T - 6, T - 7, T - 13, T - 20, T - 40, T - 60, -1])
+    completed = np.array([True, False, True, False, True, False, True, True, True])
+    rates = analytics.rolling_completion(days, completed, T)
+    # 7 days: 2 of 3 done, before that 1 of 2; 30 days: 3 of 6, before that 1 of 1 (T - 60 is out of range)
+    assert rates[7] == pytest.approx((2 / 3, 1 / 2))
+    assert rates[30] == pytest.approx((1 / 2, 1.0))
+
+
+def test_rolling_completion_without_tasks_in_a_window_is_none():
+    assert analytics.rolling_completion(np.array([T - 10]), np.array([True]), T)[7] == (None, 1.0)
+
+
+def test_activity_streaks_current_and_longest():
+    entries = [
+        (0, T), (0, T - 1), (0, T - 2),  # gym: alive, 3 days
+        *((0, day) for day in range(T - 10, T - 5)),  # gym: 5 days, ended earlier
+        (1, T - 1), (1, T - 2),  # read: ends yesterday, still alive
+        (1, T - 5),
+        (2, T - 3), (2, T - 3), (2, T - 4),  # run: two completions on one day; ended two days ago
+    ]
+    activities = np.array([activity for activity, _ in entries] + [0, 1])
+    days = np.array([day for _, day in entries] + [T - 3, -1])
+    completed = np.array([True] * len(entries) + [False, True])  # A miss and an undated task never count
+    assert analytics.activity_streaks(activities, days, completed, T) == {0: (3, 5), 1: (2, 2), 2: (0, 2)}
+
+
+def test_activity_streaks_without_completions():
+    assert analytics.activity_streaks(np.array([0]), np.array([T]), np.array([False]), T) == {}
+
+
+def test_completion_heatmap_cells_by_weekday_and_planned_time():
+    days = np.array([T, T, T - 1, T - 6, -1, T])
+    hours = np.array([7, 8, 23, 0, 7, -1])
+    completed = np.array([True, False, True, False, True, True])
+    heatmap = analytics.completion_heatmap(days, hours, completed)
+    assert heatmap.shape == (7, 8)
+    assert heatmap[2, 2] == 0.5  # Wednesday 06-09: one of two
+    assert heatmap[1, 7] == 1.0  # Tuesday 21-24
+    assert heatmap[3, 0] == 0.0  # Thursday 00-03
+    assert np.isnan(heatmap).sum() == 7 * 8 - 3
+
+
+def test_format_stats(monkeypatch):
+    monkeypatch.setattr(analytics, "utc_offset", lambda: OFFSET)
+    rows = history(
+        record(0, COMPLETED, T, hour=7, response=10),
+        record(0, COMPLETED, T - 1, hour=7, response=30),
+        record(0, MISSED, T - 8, hour=7),
+        record(1, MISSED, T - 1, hour=21),
+    )
+    text = analytics.format_stats(analytics.compute_stats(["gym", "read"], rows, NOW))
+    lines = text.split("\n")
+    assert lines[0] == "📊 **Habit Stats** (4 tasks since 2025-03-04, 2 completed)"
+    assert lines[1] == "⏱ Response time: p50 20.0 min · p90 28.0 min · p99 29.8 min (2 videos)"
+    assert lines[2] == "✅ Completion: 7 days 67% (▲ 67 pts), 30 days 50%"
+    assert lines[4:6] == ["🔥 Streaks (current / best):", "- gym: 2 / 2 days"]
+    assert "- read" not in text  # Never completed, so no streak
+    # Tuesday 06-09 has the completion on T - 1 and the miss on T - 8 (also a Tuesday)
+    assert lines[10] == "Tue        ▒▒             ··"
+    assert lines[11] == "Wed        ██               "
+
+
+def test_format_stats_without_history():
+    assert analytics.format_stats(analytics.compute_stats([], history())) == "⚠ No completed or missed tasks yet."
@@ -0,0 +1,120 @@
+# tests/test_bills.py
+import asyncio
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import database_actions
+import importer
+from conftest import CHAT_ID, USER_ID, delivered, message_update
+from database_connection import transaction
+from reminder_scheduler import TASHKENT_TZ
+
+OTHER_CHAT_ID = CHAT_ID - 1
+
+
+def rollup():
+    with transaction() as cursor:
+        cursor.execute("""SELECT chat_id, date, income, expenses, income_count, expense_count, balance
+                          FROM bills_daily ORDER BY chat_id, date""")
+        return cursor.fetchall()
+
+
+def summed_bills():
+    with transaction() as cursor:
+        cursor.execute("""SELECT chat_id, date,
+                                 TOTAL(CASE WHEN amount > 0 THEN amount END), -TOTAL(CASE WHEN amount < 0 THEN amount END),
+                                 COUNT(CASE WHEN amount > 0 THEN 1 END), COUNT(CASE WHEN amount < 0 THEN 1 END),
+                                 TOTAL(amount)
+                          FROM bills GROUP BY chat_id, date ORDER BY chat_id, date""")
+        return cursor.fetchall()
+
+
+def test_rollup_equals_the_bills_after_saving_and_importing(db):
+    database_actions.save_bills(CHAT_ID, USER_ID, "2025-02-01", [
+        ("income", 100.0, "Salary", "09:00"), ("expense", -20.5, "Lunch", "13:00"), ("expense", -4.5, "Tea", "16:00"),
+    ])
+    database_actions.save_bills(CHAT_ID, USER_ID, "2025-02-01", [("expense", -5.0, "Taxi", "19:00")])
+    database_actions.save_bill(OTHER_CHAT_ID, USER_ID, "2025-02-01", "income", 7.0, None, "10:00")
+    imported, errors = importer.import_records("bills", [
+        {"date": "2025-02-01", "amount": "-10", "time": "20:00", "description": "Dinner"},
+        {"date": "2025-02-02", "amount": 50, "time": "08:00"},
+        {"date": "2025-02-02", "amount": -1.25, "time": "08:30", "chat_id": OTHER_CHAT_ID},
+        {"date": "2025-02-03", "amount": "abc", "time": "08:00"},
+    ], chunk_size=2)
+    assert (imported, len(errors)) == (3, 1)
+    assert rollup() == summed_bills()
+    assert database_actions.get_bills_summary(CHAT_ID, "2025-02-01") == (100.0, 40.0, 1, 4, 60.0)
+
+
+def test_bills_range_has_a_running_balance_and_rolls_up_by_month(db):
+    for day, amount in (("2024-12-30", 10.0), ("2025-01-02", -4.0), ("2025-01-02", 20.0), ("2025-02-10", -30.0), ("2025-03-01", 99.0)):
+        database_actions.save_bill(CHAT_ID, USER_ID, day, "income" if amount > 0 else "expense", amount, None, "12:00")
+    assert database_actions.get_bills_range(CHAT_ID, "2024-12-31", "2025-02-28") == [
+        ("2025-01-02", 20.0, 4.0, 1, 1, 16.0, 16.0),
+        ("2025-02-10", 0.0, 30.0, 0, 1, -30.0, -14.0),
+    ]
+    assert database_actions.get_bills_range(CHAT_ID, "2024-12-01", "2025-02-28", by_month=True) == [
+        ("2024-12", 10.0, 0.0, 1, 0, 10.0, 10.0),
+        ("2025-01", 20.0, 4.0, 1, 1, 16.0, 26.0),
+        ("2025-02", 0.0, 30.0, 0, 1, -30.0, -4.0),
+    ]
+
+
+@pytest.mark.parametrize("period, expected", [
+    ("week", ("2025-03-06", "2025-03-12")),
+    ("month", ("2025-03-01", "2025-03-12")),
+    ("year", ("2025-01-01", "2025-03-12")),
+    ("2025-02-01..2025-02-28", ("2025-02-01", "2025-02-28")),
+    ("2025-02-28..2025-02-01", ("2025-02-01", "2025-02-28")),
+    ("2025-02-01 .. 2025-02-03", ("2025-02-01", "2025-02-03")),
+    ("2025-02-14", ("2025-02-14", "2025-02-14")),
+    ("2025-02-14..", ("2025-02-14", "2025-02-14")),
+])
+def test_bills_period_range(app, period, expected):
+    start, end = app.bills_period_range(period, date(2025, 3, 12))
+    assert (start.isoformat(), end.isoformat()) == expected
+
+
+@pytest.mark.parametrize("period", ["fortnight", "2025-02-30", "..2025-02-01", "2025-02-01..soon"])
+def test_bills_period_range_rejects_other_periods(app, period):
+    with pytest.raises(ValueError):
+        app.bills_period_range(period, date(2025, 3, 12))
+
+
+def test_report_periods_in_the_bills_topic(app):
+    today = datetime.now(TASHKENT_TZ).date()
+    for days_ago, amount in ((0, -5.0), (3, 40.0), (3, -15.0), (7, 1000.0)):
+        day = (today - timedelta(days=days_ago)).isoformat()
+        database_actions.save_bill(CHAT_ID, USER_ID, day, "income" if amount > 0 else "expense", amount, "x", "12:00")
+    database_actions.save_bill(CHAT_ID, USER_ID, "2024-11-20", "income", 70.0, None, "12:00")
+    database_actions.save_bill(CHAT_ID, USER_ID, "2025-01-31", "expense", -20.0, None, "12:00")
+
+    def bills(text):
+        return message_update(text, topic="bills")
+
+    async def scenario():
+        week = await delivered(app, bills("/report week"))
+        custom = await delivered(app, bills("/report 2025-02-10..2024-11-15"))
+        wrong = await delivered(app, bills("/report someday"))
+        return week, custom, wrong, [payload["message_thread_id"] for _, _, payload in app.fake_bot.calls]
+
+    week, custom, wrong, threads = asyncio.run(scenario())
+    three_days_ago = (today - timedelta(days=3)).isoformat()
+    assert week[0] == "📊 Generating Bills Report (week)..."
+    assert week[1].split("\n") == [
+        f"💰 **Bills Report {today - timedelta(days=6)} – {today}**",
+        "🌞 Income: $40.00", "💸 Expenses: $20.00", "💵 Balance: $20.00", "🧾 Transactions: 3", "",
+        "📅 **Daily Breakdown:**",
+        f"- {three_days_ago}: +$40.00 / -$15.00 → $25.00 (running $25.00)",
+        f"- {today}: +$0.00 / -$5.00 → $-5.00 (running $20.00)",
+    ]
+    # 88 days is more than MAX_DAILY_ROWS, so months are listed instead of days
+    assert custom[1].split("\n")[0] == "💰 **Bills Report 2024-11-15 – 2025-02-10**"
+    assert custom[1].split("\n")[6:] == [
+        "📅 **Monthly Breakdown:**",
+        "- 2024-11: +$70.00 / -$0.00 → $70.00 (running $70.00)",
+        "- 2025-01: +$0.00 / -$20.00 → $-20.00 (running $50.00)",
+    ]
+    assert wrong[1].startswith("⚠ Use: /report week")
+    assert set(threads) == {app.topics.thread(CHAT_ID, "bills")}
@@ -0,0 +1,111 @@
+# tests/test_exporter.py
+import asyncio
+import gzip
+import io
+
+import pytest
+
+import database_actions
+import database_connection
+import exporter
+import importer
+from conftest import CHAT_ID, USER_ID, delivered, message_update
+from database_actions import EXPORT_COLUMNS
+from database_connection import transaction
+from database_creation import init_db
+
+OTHER_CHAT_ID = CHAT_ID - 1
+
+
+def fill():
+    """Tasks and bills with NULLs, quotes, commas, newlines and non-ASCII text, plus one row of another chat."""
+    with transaction() as cursor:
+        cursor.executemany(
+            """INSERT INTO tasks (chat_id, user_id, task, time, status, notified_ts, notified_day, video_id, completed_ts)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            [
+                (CHAT_ID, USER_ID, "Gym", "07:00", "completed", 1739844000, "2025-02-18", "vid1", 1739845200),
+                (CHAT_ID, None, 'Read "War, and Peace"', "21:30", "missed", 1739903400, "2025-02-18", None, None),
+                (CHAT_ID, USER_ID, "Йога\nstretch", "06:00", "pending", None, None, None, None),
+                (OTHER_CHAT_ID, USER_ID, "Swim", "08:00", "completed", 1739851200, "2025-02-18", None, 1739852000),
+            ]
+        )
+    database_actions.save_bills(CHAT_ID, USER_ID, "2025-02-18", [
+        ("income", 1200.5, "Salary, February", "09:00"), ("expense", -3.25, None, "16:00"),
+    ])
+    database_actions.save_bills(CHAT_ID, None, "2025-03-01", [("expense", -40.0, 'Café "Ōsaka"', "13:15")])
+    database_actions.save_bill(OTHER_CHAT_ID, USER_ID, "2025-02-18", "expense", -1.0, "Tea", "10:00")
+
+
+def stored(kind):
+    columns = ", ".join(EXPORT_COLUMNS[kind][1:])  # Ids are assigned anew on import
+    with transaction() as cursor:
+        cursor.execute(f"SELECT {columns} FROM {kind} WHERE chat_id = ? ORDER BY id", (CHAT_ID,))
+        return cursor.fetchall()
+
+
+@pytest.mark.parametrize("file_format", exporter.FORMATS)
+@pytest.mark.parametrize("kind", ["tasks", "bills"])
+def test_export_round_trips_through_the_importer(db, tmp_path, monkeypatch, kind, file_format):
+    fill()
+    original = stored(kind)
+    path = tmp_path / exporter.export_filename(kind, file_format)
+    with open(path, "wb") as f:
+        assert exporter.write_export(f, kind, CHAT_ID, file_format=file_format, chunk_size=2) == len(original)
+
+    database_connection.close_connection()
+    monkeypatch.setattr(database_connection, "DB_NAME", str(tmp_path / "restored.db"))
+    init_db()
+    imported, errors = importer.import_records(kind, importer.read_records(str(path)))
+    assert (imported, errors) == (len(original), [])
+    assert stored(kind) == original
+    if kind == "bills":
+        assert database_actions.get_bills_summary(CHAT_ID, "2025-02-18") == (1200.5, 3.25, 1, 1, 1197.25)
+
+
+def test_export_of_a_date_range(db):
+    fill()
+    buffer = io.BytesIO()
+    assert exporter.write_export(buffer, "bills", CHAT_ID, "2025-02-01", "2025-02-28", "jsonl", compress=False) == 2
+    assert "Ōsaka" not in buffer.getvalue().decode()
+    buffer = io.BytesIO()
+    assert exporter.write_export(buffer, "tasks", CHAT_ID, "2025-02-18", "2025-02-18", "csv") == 2  # Not the pending one
+    header, *rows = gzip.decompress(buffer.getvalue()).decode().splitlines()
+    assert header == ",".join(EXPORT_COLUMNS["tasks"]) and len(rows) == 2
+    assert exporter.export_filename("tasks", "csv", "2025-02-18", "2025-02-18") == "tasks_2025-02-18_2025-02-18.csv.gz"
+
+
+def test_export_command_sends_a_gzipped_file(app, monkeypatch):
+    fill()
+
+    async def scenario():
+        sent = {}
+        for command in ("/export bills", "/export bills 2025-03-01..2025-03-31 jsonl", "/export tasks week month",
+                        "/export everything", "/export bills 2025-02-30"):
+            replies = await delivered(app, message_update(command, topic="bills"))
+            documents = [payload for method, _, payload in app.fake_bot.calls if method == "send_document"]
+            sent[command] = replies, documents
+        monkeypatch.setattr(app, "MAX_UPLOAD_BYTES", 10)
+        sent["too large"] = await delivered(app, message_update("/export bills", topic="bills")), [
+            payload for method, _, payload in app.fake_bot.calls if method == "send_document"
+        ]
+        return sent
+
+    sent = asyncio.run(scenario())
+    replies, (document,) = sent["/export bills"]
+    assert replies == ["📦 Exporting bills...", "📦 3 bills"]
+    assert document["document"].filename == "bills.csv.gz"
+    assert document["message_thread_id"] == app.topics.thread(CHAT_ID, "bills")
+    lines = gzip.decompress(document["content"]).decode().splitlines()
+    assert len(lines) == 4 and '"Salary, February"' in lines[1] and "Tea" not in "".join(lines)
+
+    replies, (document,) = sent["/export bills 2025-03-01..2025-03-31 jsonl"]
+    assert document["document"].filename == "bills_2025-03-01_2025-03-31.jsonl.gz"
+    records = gzip.decompress(document["content"]).decode().splitlines()
+    assert len(records) == 1 and '"amount": -40.0' in records[0]
+
+    for command in ("/export tasks week month", "/export everything", "/export bills 2025-02-30"):
+        assert sent[command] == ([app.EXPORT_USAGE], [])
+    assert sent["too large"] == (
+        ["📦 Exporting bills...", "⚠ The export is larger than 50 MB; choose a shorter period."], []
+    )
@@ -0,0 +1,50 @@
+# tests/test_fsm_storage.py
+import asyncio
+
+import database_actions
+from conftest import CHAT_ID, USER_ID
+from fsm_storage import SQLiteStorage
+
+
+def test_writes_are_cached_then_flushed_in_the_background(db):
+    async def scenario():
+        storage = SQLiteStorage(flush_interval=0.05)
+        await storage.set_state(chat=CHAT_ID, user=USER_ID, state="SearchState:waiting_for_query")
+        await storage.update_data(chat=CHAT_ID, user=USER_ID, query="gym")
+        assert database_actions.get_fsm_record(str(CHAT_ID), str(USER_ID), 0) is None  # Not written yet
+        assert await storage.get_state(chat=CHAT_ID, user=USER_ID) == "SearchState:waiting_for_query"
+        await asyncio.sleep(0.2)
+        assert database_actions.get_fsm_record(str(CHAT_ID), str(USER_ID), 0) is not None
+        await storage.close()
+
+        reloaded = SQLiteStorage()  # A restarted bot reads the state back from SQLite
+        assert await reloaded.get_state(chat=CHAT_ID, user=USER_ID) == "SearchState:waiting_for_query"
+        assert await reloaded.get_data(chat=CHAT_ID, user=USER_ID) == {"query": "gym"}
+
+    asyncio.run(scenario())
+
+
+def test_finished_conversations_are_deleted_on_flush(db):
+    async def scenario():
+        storage = SQLiteStorage(flush_interval=60)
+        await storage.set_state(chat=CHAT_ID, user=USER_ID, state="TaskVideoState:waiting_for_task_name")
+        await storage.flush()
+        await storage.reset_state(chat=CHAT_ID, user=USER_ID)
+        await storage.close()
+
+    asyncio.run(scenario())
+    assert database_actions.get_fsm_record(str(CHAT_ID), str(USER_ID), 0) is None
+
+
+def test_state_expires_after_ttl(db):
+    async def scenario():
+        storage = SQLiteStorage(ttl=1, flush_interval=60)
+        await storage.set_state(chat=CHAT_ID, user=USER_ID, state="SearchState:showing_results")
+        await storage.flush()
+        await asyncio.sleep(1.1)
+        assert await storage.get_state(chat=CHAT_ID, user=USER_ID) is None
+        assert await SQLiteStorage().get_state(chat=CHAT_ID, user=USER_ID) is None
+        assert await storage.purge_expired() == 1
+        await storage.close()
+
+    asyncio.run(scenario())
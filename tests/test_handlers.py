@@ -0,0 +1,203 @@
+# tests/test_handlers.py
+import asyncio
+import gzip
+from datetime import datetime
+
+import database_actions
+from conftest import CHAT_ID, USER_ID, callback_update, delivered, dispatch, message_update
+from fake_bot import FakeBot
+from outbox import Outbox
+from reminder_scheduler import TASHKENT_TZ, ReminderScheduler
+from tenants import TopicRegistry
+
+OTHER_CHAT_ID = -1002000000002
+
+
+def test_plan_message_saves_and_schedules_tasks(app):
+    asyncio.run(dispatch(app, message_update("Breakfast: 8:30\nGym: 07:00\nnot a task", topic="plans")))
+    assert [task[2:4] for task in database_actions.get_pending_tasks(CHAT_ID)] == [("Gym", "07:00"), ("Breakfast", "08:30")]
+    assert len(app.reminder_scheduler) == 2
+    assert app.fake_bot.sent[-1].startswith("✅")
+
+
+def test_resent_recurring_plan_is_not_duplicated(app):
+    plan = "Stretch: 06:30 daily\nPiano: 19:00 mon,wed"
+    asyncio.run(dispatch(app, message_update(plan, topic="plans"), message_update(plan, topic="plans")))
+    assert [template[2:5] for template in database_actions.get_active_templates(CHAT_ID)] == [
+        ("Stretch", "06:30", "daily"), ("Piano", "19:00", "mon,wed")
+    ]
+    assert len(app.reminder_scheduler) == 2
+
+def test_bills_message_is_saved_in_one_batch(app):
+    asyncio.run(dispatch(app, message_update("100\n-50: Coffee\n+20: Freelance work\noops", topic="bills")))
+    today = datetime.now(TASHKENT_TZ).date().isoformat()
+    assert database_actions.get_bills_summary(CHAT_ID, today) == (120.0, 50.0, 2, 1, 70.0)
+    reply = app.fake_bot.sent[-1]
+    assert reply.startswith("✅ Saved 3 transactions")
+    assert '⚠ Line 4: "oops" – ' in reply
+
+
+def test_search_query_after_search_command_through_the_pool(app):
+    task_id = database_actions.save_task(CHAT_ID, 1, "Workout", "17:00")
+    asyncio.run(dispatch(app, message_update("/search"), message_update("Workout")))
+    assert app.fake_bot.sent[0].startswith("🔍")
+    assert f"ID: {task_id}" in app.fake_bot.sent[1]
+    assert asyncio.run(app.storage.get_state(chat=CHAT_ID, user=USER_ID)) is None  # One match ends the search
+
+
+def test_one_users_state_does_not_apply_to_the_next_update_on_the_worker(app):
+    database_actions.save_task(CHAT_ID, 1, "Workout", "17:00")
+
+    async def scenario():
+        await dispatch(app, message_update("/search", user_id=1))
+        # Same topic, so both updates run on one worker: user 1 answers, then user 2 just chats
+        await dispatch(app, message_update("Workout", user_id=1), message_update("Workout", user_id=2))
+
+    asyncio.run(scenario())
+    assert len(app.fake_bot.sent) == 2
+
+
+async def open_two_reminders(app):
+    await app.topics.load()
+    task_ids = [database_actions.save_task(CHAT_ID, USER_ID, name, "07:00") for name in ("Gym", "Read")]
+    for task_id, name in zip(task_ids, ("Gym", "Read")):
+        await app.reminder_scheduler._remind(CHAT_ID, task_id, name)
+    return task_ids
+
+
+def test_plan_sent_while_choosing_a_task_for_a_video_is_still_saved(app):
+    async def scenario():
+        await open_two_reminders(app)
+        await dispatch(app, message_update(video="vid1", topic="results"), message_update("Run: 18:00", topic="plans"))
+        return await app.storage.get_state(chat=CHAT_ID, user=USER_ID)
+
+    assert asyncio.run(scenario()) is None
+    assert app.fake_bot.sent[0].startswith("❓ Several tasks are open")
+    assert app.fake_bot.sent[1] == "✅ Tasks saved and scheduled."
+    assert "Run" in [task[2] for task in database_actions.get_pending_tasks(CHAT_ID)]
+
+
+def test_choosing_a_task_completes_it_and_an_invalid_choice_ends_the_question(app):
+    async def scenario():
+        gym, read = await open_two_reminders(app)
+        run = database_actions.save_task(CHAT_ID, USER_ID, "Run", "07:00")
+        await app.reminder_scheduler._remind(CHAT_ID, run, "Run")  # Two windows stay open after one choice
+        await dispatch(app, message_update(video="vid1", topic="results"), callback_update(f"video:{read}", topic="results"))
+        await dispatch(app, message_update(video="vid2", topic="results"), callback_update("video:oops", topic="results"))
+        return gym, read, await app.storage.get_state(chat=CHAT_ID, user=USER_ID)
+
+    gym, read, state = asyncio.run(scenario())
+    assert database_actions.get_task(CHAT_ID, read)[3] == "completed"
+    assert database_actions.get_task(CHAT_ID, gym)[3] == "pending"
+    assert app.fake_bot.sent[-1] == "⚠ Invalid selection."
+    assert state is None
+
+
+def test_new_video_while_choosing_asks_again_for_the_new_video(app):
+    async def scenario():
+        await open_two_reminders(app)
+        await dispatch(app, message_update(video="vid1", topic="results"), message_update(video="vid2", topic="results"))
+        return await app.storage.get_data(chat=CHAT_ID, user=USER_ID)
+
+    assert asyncio.run(scenario())["video_id"] == "vid2"
+    assert [text[:2] for text in app.fake_bot.sent] == ["❓ ", "❓ "]
+
+
+def test_topic_bound_in_the_bot_reaches_a_worker_on_its_next_heartbeat(app, monkeypatch):
+    worker_bot = FakeBot()
+
+    async def scenario():
+        # A second instance, as worker.py builds it, loaded before the binding
+        worker_topics = TopicRegistry()
+        await worker_topics.load()
+        app.fake_bot.admins.add(USER_ID)
+        await dispatch(app, message_update("/topic results", chat_id=OTHER_CHAT_ID, thread_id=41))
+        monkeypatch.setattr(app, "topics", worker_topics)
+        await app.on_heartbeat()  # Run on each lease renewal
+        assert OTHER_CHAT_ID in worker_topics.chats()
+        outbox = Outbox(worker_bot, coalesce_delay=0)
+        task_id = database_actions.save_task(OTHER_CHAT_ID, USER_ID, "Run", "07:00")
+        await ReminderScheduler(outbox, worker_topics)._remind(OTHER_CHAT_ID, task_id, "Run")
+        sender = asyncio.create_task(outbox.run())
+        await outbox.wait_empty(poll=0.01)
+        sender.cancel()
+
+    asyncio.run(scenario())
+    assert app.fake_bot.sent == ["✅ This topic now receives results."]
+    assert [(chat_id, payload["message_thread_id"]) for _, chat_id, payload in worker_bot.calls] == [(OTHER_CHAT_ID, 41)]
+
+
+def test_nightly_bills_report_goes_to_the_bills_topic_of_chats_that_track_bills(app):
+    today = datetime.now(TASHKENT_TZ).date().isoformat()
+    third_chat = OTHER_CHAT_ID - 1
+    database_actions.set_chat_topic(OTHER_CHAT_ID, "results", 41)  # Uses reminders only
+    database_actions.save_bills(third_chat, USER_ID, today, [("income", 10.0, None, "09:00")])  # No bills topic
+
+    async def scenario():
+        await app.topics.load()
+        sender = asyncio.create_task(app.outbox.run())
+        await app.send_daily_bills_reports()
+        await app.outbox.wait_empty(poll=0.01)
+        sender.cancel()
+
+    asyncio.run(scenario())
+    sent = {chat_id: (payload["message_thread_id"], payload["text"]) for _, chat_id, payload in app.fake_bot.calls}
+    assert set(sent) == {CHAT_ID, third_chat}
+    assert sent[CHAT_ID] == (app.topics.thread(CHAT_ID, "bills"), "⚠ No bill transactions recorded for today.")
+    assert sent[third_chat][0] is None and sent[third_chat][1].startswith("💰")
+
+
+def test_one_chat_never_sees_another_chats_data(app):
+    # CHAT_ID has a completed task and a bill; OTHER_CHAT_ID has its own topics and one missed task
+    now = int(datetime.now(TASHKENT_TZ).timestamp())
+    today = datetime.now(TASHKENT_TZ).date().isoformat()
+    gym = database_actions.save_task(CHAT_ID, USER_ID, "Gym", "07:00")
+    database_actions.mark_task_notified(CHAT_ID, gym, now - 600)
+    database_actions.mark_task_completed(CHAT_ID, gym, "vid", "07:10")
+    database_actions.save_bills(CHAT_ID, USER_ID, today, [("income", 100.0, "Salary", "09:00")])
+    for role, thread_id in (("plans", 51), ("results", 52), ("bills", 53)):
+        database_actions.set_chat_topic(OTHER_CHAT_ID, role, thread_id)
+    yoga = database_actions.save_task(OTHER_CHAT_ID, USER_ID, "Yoga", "08:00")
+    database_actions.mark_task_notified(OTHER_CHAT_ID, yoga, now - 3600)
+    database_actions.mark_task_missed(OTHER_CHAT_ID, yoga)
+
+    def other(text, thread_id=None):
+        return message_update(text, chat_id=OTHER_CHAT_ID, thread_id=thread_id)
+
+    async def scenario():
+        assert (await delivered(app, other("/search"), other("Gym")))[-1] == "⚠ No matching tasks found."
+        assert f"ID: {yoga}" in (await delivered(app, other("/search"), other("Yoga")))[-1]
+        stats = (await delivered(app, other("/stats")))[-1]
+        assert "(1 tasks since" in stats and "0 completed" in stats and "gym" not in stats
+        assert (await delivered(app, other("/report")))[-1] == "⚠ No response time data found for the last 7 days."
+        assert (await delivered(app, other("/report", thread_id=53)))[-1] == "⚠ No bill transactions recorded for today."
+        bills_week = (await delivered(app, other("/report week", thread_id=53)))[-1]
+        assert bills_week.startswith("⚠ No bill transactions recorded between")
+        # The data is there for its own chat
+        assert f"ID: {gym}" in (await delivered(app, message_update("/search"), message_update("Gym")))[-1]
+        assert (await delivered(app, message_update("/report", topic="bills")))[-1].startswith("💰")
+        await delivered(app, other("/export tasks csv"))
+        return [gzip.decompress(payload["content"]).decode() for method, _, payload in app.fake_bot.calls if method == "send_document"]
+
+    export, = asyncio.run(scenario())
+    assert "Yoga" in export and "Gym" not in export
+
+
+def test_only_chat_admins_bind_topics_and_bindings_route_messages(app):
+    bills = message_update("-5: Tea", chat_id=OTHER_CHAT_ID, thread_id=60)
+    bind = message_update("/topic bills", chat_id=OTHER_CHAT_ID, thread_id=60)
+
+    async def scenario():
+        denied = await delivered(app, bind, bills)
+        app.fake_bot.admins.add(USER_ID)
+        bound = await delivered(app, message_update("/topic bills", chat_id=OTHER_CHAT_ID, thread_id=60),
+                                message_update("-5: Tea", chat_id=OTHER_CHAT_ID, thread_id=60))
+        return denied, bound
+
+    denied, bound = asyncio.run(scenario())
+    today = datetime.now(TASHKENT_TZ).date().isoformat()
+    assert denied == ["⚠ Only chat admins can bind topics."]
+    assert bound[0] == "✅ This topic now receives bills." and bound[1].startswith("✅ Saved 1 transaction")
+    assert database_actions.get_bills_summary(OTHER_CHAT_ID, today)[1] == 5.0
+    assert database_actions.get_bills_summary(CHAT_ID, today) is None
+    assert database_actions.get_chat_topics() == [(OTHER_CHAT_ID, "bills", 60)]
@@ -0,0 +1,13 @@
+# tests/test_import_time.py
+from benchmarks.import_time import FORBIDDEN_MODULES, IMPORT_BUDGET_MS, measure
+
+RUNS = 3  # The fastest fresh import counts, as in python -m benchmarks.import_time
+
+
+def test_import_main_stays_within_budget_and_has_no_side_effects():
+    # Each run is `python -X importtime -c "import main"` in a fresh interpreter and empty directory
+    times, loaded, created = min((measure("main") for _ in range(RUNS)), key=lambda run: run[0]["main"][1])
+    total_ms = times["main"][1] / 1000
+    assert total_ms <= IMPORT_BUDGET_MS, f"import main took {total_ms:.1f} ms"
+    assert sorted(name for name in loaded if name.split(".")[0] in FORBIDDEN_MODULES) == []
+    assert created == []
@@ -0,0 +1,41 @@
+# tests/test_importer.py
+import io
+import sys
+
+import database_actions
+import importer
+from conftest import CHAT_ID
+from database_connection import transaction
+
+
+def test_tasks_without_status_are_imported_as_completed_or_missed(db):
+    records = [
+        {"task": "Gym", "time": "07:00", "completed_at": "2024-05-01T07:20:00+05:00"},
+        {"task": "Read", "time": "21:00", "notified_at": "2024-05-01T21:00:00+05:00"},
+        {"task": "Call", "time": "12:00", "status": "Pending"},
+        {"task": "Cook", "time": "18:00", "status": "postponed"},
+    ]
+    imported, errors = importer.import_records("tasks", records)
+    assert imported == 3 and len(errors) == 1
+    assert database_actions.get_task_statistics(CHAT_ID)[:2] == (1, 1)
+    assert [task[2] for task in database_actions.get_pending_tasks(CHAT_ID)] == ["Call"]
+
+
+def test_bare_completion_time_is_imported_without_a_timestamp(db):
+    records = [
+        {"task": "Run", "time": "07:00", "notified_at": "2025-02-19T07:00:00+05:00", "completed_at": "07:40"},
+        {"task": "Swim", "time": "08:00", "status": "missed", "completed_at": " 8:15 "},
+        {"task": "Walk", "time": "09:00", "completed_at": "soon"},
+    ]
+    imported, errors = importer.import_records("tasks", records)
+    assert imported == 2 and len(errors) == 1 and "record 3" in errors[0]
+    with transaction() as cursor:
+        cursor.execute("SELECT task, status, notified_day, completed_ts FROM tasks ORDER BY id")
+        assert cursor.fetchall() == [("Run", "completed", "2025-02-19", None), ("Swim", "missed", None, None)]
+
+
+def test_reading_stdin_leaves_it_open(monkeypatch):
+    stdin = io.StringIO('{"task": "Gym", "time": "07:00"}\n\n{"task": "Read", "time": "21:00"}\n')
+    monkeypatch.setattr(sys, "stdin", stdin)
+    assert [record["task"] for record in importer.read_records("-")] == ["Gym", "Read"]
+    assert not stdin.closed
@@ -0,0 +1,51 @@
+# tests/test_leases.py
+import asyncio
+import time
+
+import database_actions
+import leases
+from conftest import CHAT_ID
+
+
+def test_scheduler_run_is_claimed_once_per_period(db):
+    assert database_actions.claim_scheduler_run("weekly_report", "2025-02-23", "a", 100)
+    assert not database_actions.claim_scheduler_run("weekly_report", "2025-02-23", "b", 101)
+    assert database_actions.claim_scheduler_run("weekly_report", "2025-03-02", "b", 102)
+    assert database_actions.claim_scheduler_run("retention", "2025-02-23", "b", 103)
+
+
+def test_claim_run_is_exclusive_between_concurrent_claimants(db):
+    async def scenario():
+        return await asyncio.gather(*[leases.claim_run("daily_bills_report", "2025-02-23") for _ in range(5)])
+
+    assert sorted(asyncio.run(scenario())) == [False] * 4 + [True]
+
+
+def test_lease_is_held_until_it_expires_or_is_released(db):
+    assert database_actions.renew_lease("instance:a", "a", 190, 100)
+    assert not database_actions.renew_lease("instance:a", "b", 200, 150)
+    assert database_actions.renew_lease("instance:a", "a", 250, 160)  # The holder renews
+    assert database_actions.renew_lease("instance:a", "b", 300, 260)  # Expired, taken over
+    database_actions.release_lease("instance:a", "b")
+    assert database_actions.renew_lease("instance:a", "a", 400, 270)
+
+
+def test_outbox_rows_are_adopted_only_after_the_owner_lease_expires(db):
+    database_actions.renew_lease("instance:a", "a", 190, 100)
+    message_id = database_actions.add_outbox_message(CHAT_ID, 6, "text", "hello", owner="a")
+    assert database_actions.claim_outbox_messages("b", 150) == []
+    database_actions.renew_lease("instance:b", "b", 290, 200)
+    adopted = database_actions.claim_outbox_messages("b", 200)
+    assert [row[0] for row in adopted] == [message_id]
+    assert database_actions.claim_outbox_messages("c", 210) == []  # Now b's, and b is alive
+
+
+def test_renewal_counts_the_other_live_instances(db, monkeypatch):
+    monkeypatch.setattr(leases, "peers", 0)
+    now = int(time.time())
+    database_actions.renew_lease("instance:gone", "gone", now - 1, now - 91)
+    asyncio.run(leases.renew_instance_lease())
+    assert leases.alone()
+    database_actions.renew_lease("instance:worker", "worker", now + 90, now)
+    asyncio.run(leases.renew_instance_lease())
+    assert leases.peers == 1 and not leases.alone()
@@ -0,0 +1,57 @@
+# tests/test_migrations.py
+import sqlite3
+from datetime import datetime, timezone
+
+import database_connection
+import database_creation
+from database_creation import init_db
+
+
+def utc(*args):
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp())
+
+
+def test_epoch_migration_repairs_legacy_timestamps(tmp_path, monkeypatch):
+    path = tmp_path / "legacy.db"
+    # A database at schema version 3, as the bot left it before epoch timestamps
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, task TEXT NOT NULL, time TEXT NOT NULL,
+                    status TEXT DEFAULT 'pending', notified_at TEXT DEFAULT NULL,
+                    video_id TEXT DEFAULT NULL, completed_at TEXT DEFAULT NULL)""")
+    conn.execute("""CREATE TABLE bills (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT NOT NULL, type TEXT NOT NULL,
+                    amount REAL NOT NULL, description TEXT, time TEXT NOT NULL)""")
+    for _, migration in database_creation.MIGRATIONS[:3]:
+        migration(conn.cursor())
+    conn.executemany("INSERT INTO tasks (task, time, status, notified_at, completed_at) VALUES (?, ?, ?, ?, ?)", [
+        ("Gym", "07:00", "completed", "2025-02-18T07:00:00+04:37", "2025-02-18T07:25:00+04:37"),  # pytz LMT offset
+        ("Read", "23:30", "completed", "2025-02-18 23:30:00", "2025-02-19 00:10:00"),  # Naive, Tashkent time
+        ("Run", "07:00", "completed", "2025-02-19T07:00:00+05:00", "07:40"),  # Bare HH:MM completion
+        ("Walk", "18:00", "pending", None, None),
+    ])
+    conn.execute("PRAGMA user_version = 3")
+    conn.commit()
+    conn.close()
+
+    database_connection.close_connection()
+    monkeypatch.setattr(database_connection, "DB_NAME", str(path))
+    try:
+        init_db()
+        with database_connection.transaction() as cursor:
+            cursor.execute("PRAGMA user_version")
+            assert cursor.fetchone()[0] == database_creation.SCHEMA_VERSION
+            cursor.execute("SELECT task, notified_ts, completed_ts, notified_day, notified_at, completed_at FROM tasks ORDER BY id")
+            rows = cursor.fetchall()
+    finally:
+        database_connection.close_connection()
+
+    assert rows == [
+        ("Gym", utc(2025, 2, 18, 2, 0), utc(2025, 2, 18, 2, 25), "2025-02-18",
+         "2025-02-18T07:00:00+05:00", "2025-02-18T07:25:00+05:00"),
+        # Local 23:30 is 18:30 UTC, and still the 18th in Tashkent
+        ("Read", utc(2025, 2, 18, 18, 30), utc(2025, 2, 18, 19, 10), "2025-02-18",
+         "2025-02-18T23:30:00+05:00", "2025-02-19T00:10:00+05:00"),
+        ("Run", utc(2025, 2, 19, 2, 0), None, "2025-02-19", "2025-02-19T07:00:00+05:00", "07:40"),
+        ("Walk", None, None, None, None, None),
+    ]
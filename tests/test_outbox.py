@@ -0,0 +1,49 @@
+# tests/test_outbox.py
+import asyncio
+
+import database_actions
+from conftest import CHAT_ID
+from fake_bot import FakeBot
+from outbox import MAX_MESSAGE_LENGTH, Outbox, split_text
+
+
+def unthrottled(bot, coalesce_delay=0):
+    return Outbox(bot, global_rate=1e9, global_burst=1e9, chat_rate=1e9, chat_burst=1e9, coalesce_delay=coalesce_delay)
+
+
+async def deliver(outbox, messages, **kwargs):
+    sender = asyncio.create_task(outbox.run())
+    try:
+        for text in messages:
+            await outbox.send_message(chat_id=CHAT_ID, text=text, **kwargs)
+        await outbox.wait_empty(poll=0.01)
+    finally:
+        sender.cancel()
+
+
+def test_messages_with_one_coalesce_key_go_out_as_one(db):
+    bot = FakeBot()
+    asyncio.run(deliver(unthrottled(bot, coalesce_delay=0.05), ["first", "second", "third"], coalesce_key="report"))
+    assert bot.sent == ["first\nsecond\nthird"]
+    assert database_actions.claim_outbox_messages("other", 0) == []  # Delivered rows are deleted
+
+
+def test_flood_control_requeues_the_message_in_order(db):
+    bot = FakeBot(flood_every=2, retry_after=0)
+    asyncio.run(deliver(unthrottled(bot), [f"message {n}" for n in range(5)]))
+    assert bot.flood_errors >= 2
+    assert bot.sent == [f"message {n}" for n in range(5)]
+
+
+def test_split_text_breaks_at_newlines_within_the_limit():
+    assert split_text("short") == ["short"]
+    assert split_text("aaaa\nbb\ncccc", limit=8) == ["aaaa\nbb", "cccc"]
+    assert split_text("a" * 10 + "\nbb", limit=4) == ["aaaa", "aaaa", "aa", "bb"]
+
+
+def test_long_texts_go_out_in_parts_telegram_accepts(db):
+    bot = FakeBot()
+    lines = [f"- Expense: ${n}.00 at 12:00 - lunch number {n}" for n in range(300)]
+    asyncio.run(deliver(unthrottled(bot, coalesce_delay=0.05), ["\n".join(lines), "later"], coalesce_key="report"))
+    assert len(bot.sent) > 2 and all(len(text) <= MAX_MESSAGE_LENGTH for text in bot.sent)
+    assert "\n".join(bot.sent) == "\n".join(lines + ["later"])
@@ -0,0 +1,113 @@
+# tests/test_reminder_scheduler.py
+import asyncio
+from datetime import datetime, timedelta
+
+import database_actions
+import reminder_scheduler
+from conftest import CHAT_ID, USER_ID
+from fake_bot import FakeBot
+from outbox import Outbox
+from reminder_scheduler import TASHKENT_TZ, ReminderScheduler
+from tenants import TopicRegistry
+
+
+async def wait_for(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached in time"
+        await asyncio.sleep(0.02)
+
+
+def test_reminder_is_sent_then_missed_after_the_window(db, monkeypatch):
+    monkeypatch.setattr(reminder_scheduler, "RESPONSE_WINDOW", timedelta(seconds=0.3))
+    task_id = database_actions.save_task(CHAT_ID, USER_ID, "Gym", datetime.now(TASHKENT_TZ).strftime("%H:%M"))
+    bot = FakeBot()
+
+    async def scenario():
+        topics = TopicRegistry()
+        await topics.load()
+        outbox = Outbox(bot, coalesce_delay=0)
+        scheduler = ReminderScheduler(outbox, topics)
+        await scheduler.load()
+        tasks = [asyncio.create_task(outbox.run()), asyncio.create_task(scheduler.run())]
+        try:
+            await wait_for(lambda: scheduler.windows.list(CHAT_ID))
+            assert database_actions.get_task(CHAT_ID, task_id)[3] == "pending"
+            await wait_for(lambda: database_actions.get_task(CHAT_ID, task_id)[3] == "missed")
+            await outbox.wait_empty(poll=0.01)
+            assert scheduler.windows.list(CHAT_ID) == []
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    asyncio.run(scenario())
+    assert bot.sent == ["Reminder: Gym - Please complete it!", "❌ Task missed: Gym"]
+
+
+def test_completed_task_is_not_missed(db):
+    task_id = database_actions.save_task(CHAT_ID, USER_ID, "Read", "07:00")
+    bot = FakeBot()
+
+    async def scenario():
+        topics = TopicRegistry()
+        await topics.load()
+        outbox = Outbox(bot, coalesce_delay=0)
+        scheduler = ReminderScheduler(outbox, topics)
+        await scheduler._remind(CHAT_ID, task_id, "Read")
+        assert database_actions.mark_task_completed(CHAT_ID, task_id, "video", "07:05")
+        await scheduler._miss(CHAT_ID, task_id, "Read")
+        sender = asyncio.create_task(outbox.run())
+        await outbox.wait_empty(poll=0.01)
+        sender.cancel()
+
+    asyncio.run(scenario())
+    assert database_actions.get_task(CHAT_ID, task_id)[3] == "completed"
+    assert bot.sent == ["Reminder: Read - Please complete it!"]
+
+
+def test_polls_for_new_plans_only_when_asked_to(db):
+    polling = False
+
+    async def scenario():
+        topics = TopicRegistry()
+        await topics.load()
+        scheduler = ReminderScheduler(Outbox(FakeBot()), topics, poll_interval=0.05, poll_when=lambda: polling)
+        await scheduler.load()
+        runner = asyncio.create_task(scheduler.run())
+        try:
+            database_actions.save_task(CHAT_ID, USER_ID, "Swim", "18:30")  # Saved by another process
+            await asyncio.sleep(0.2)
+            assert len(scheduler) == 0
+            nonlocal polling
+            polling = True
+            await wait_for(lambda: len(scheduler) == 1)
+        finally:
+            runner.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_reminders_due_while_offline_are_sent_late_or_marked_missed(db):
+    now = datetime.now(TASHKENT_TZ)
+    late = database_actions.save_task(CHAT_ID, USER_ID, "Walk", (now - timedelta(hours=1)).strftime("%H:%M"))
+    lost = database_actions.save_task(CHAT_ID, USER_ID, "Plan", (now - timedelta(hours=5)).strftime("%H:%M"))
+    with database_actions.transaction() as cursor:  # Saved before the bot went down
+        cursor.execute("UPDATE tasks SET created_ts = ? WHERE id = ?", (int((now - timedelta(hours=2)).timestamp()), late))
+        cursor.execute("UPDATE tasks SET created_ts = ? WHERE id = ?", (int((now - timedelta(hours=26)).timestamp()), lost))
+    bot = FakeBot()
+
+    async def scenario():
+        topics = TopicRegistry()
+        await topics.load()
+        outbox = Outbox(bot, coalesce_delay=0)
+        scheduler = ReminderScheduler(outbox, topics)
+        await scheduler.load(now)
+        assert [entry[4] for entry in scheduler.pop_due(now)] == [late]
+        sender = asyncio.create_task(outbox.run())
+        await outbox.wait_empty(poll=0.01)
+        sender.cancel()
+
+    asyncio.run(scenario())
+    assert database_actions.get_task(CHAT_ID, late)[3] == "pending"
+    assert database_actions.get_task(CHAT_ID, lost)[3] == "missed"
+    assert len(bot.sent) == 1 and bot.sent[0].startswith("❌ Task missed: Plan")
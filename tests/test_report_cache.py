@@ -0,0 +1,50 @@
+# tests/test_report_cache.py
+import asyncio
+import sqlite3
+import time
+
+import database_actions
+from conftest import CHAT_ID, USER_ID
+from report_cache import report_cache
+
+
+def write_from_another_process(db, sql, *args):
+    """A write through a connection of its own, bumping the chat's version as every writer does."""
+    conn = sqlite3.connect(db)
+    with conn:
+        conn.execute(sql, args)
+        database_actions.bump_report_version(conn.cursor(), CHAT_ID)
+    conn.close()
+
+
+def test_writes_by_another_process_drop_cached_statistics(db):
+    task_id, = database_actions.save_tasks(CHAT_ID, USER_ID, [("Run", "07:00")])
+    database_actions.mark_task_missed(CHAT_ID, task_id)
+    assert database_actions.get_task_statistics(CHAT_ID) == (0, 1, 0)
+
+    write_from_another_process(db, "UPDATE tasks SET status = 'completed' WHERE id = ?", task_id)
+    assert database_actions.get_task_statistics(CHAT_ID) == (1, 0, 100)
+
+
+def test_own_writes_keep_entries_outside_their_dates(db):
+    database_actions.sync_report_cache(CHAT_ID)
+    report_cache.put(("march", CHAT_ID), "m", CHAT_ID, "2025-03-01", "2025-03-31")
+    report_cache.put(("april", CHAT_ID), "a", CHAT_ID, "2025-04-01", "2025-04-30")
+    database_actions.save_bills(CHAT_ID, USER_ID, "2025-04-02", [("expense", -5.0, "tea", "09:00")])
+    assert database_actions.sync_report_cache(CHAT_ID) == 0
+    assert report_cache.get(("march", CHAT_ID)) == "m"
+    assert report_cache.get(("april", CHAT_ID)) is None
+
+    write_from_another_process(db, "DELETE FROM bills")
+    assert database_actions.sync_report_cache() == 1
+    assert report_cache.get(("march", CHAT_ID)) is None
+
+
+def test_open_windows_are_read_from_the_database_while_peers_are_alive(app, monkeypatch):
+    # Reminder sent by a worker: claimed in the database, unknown to this process's scheduler
+    task_id, = database_actions.save_tasks(CHAT_ID, USER_ID, [("Run", "07:00")])
+    database_actions.mark_task_notified(CHAT_ID, task_id, int(time.time()))
+
+    assert asyncio.run(app.open_windows(CHAT_ID)) == []
+    monkeypatch.setattr("leases.peers", 1)
+    assert [window[0] for window in asyncio.run(app.open_windows(CHAT_ID))] == [task_id]
@@ -0,0 +1,104 @@
+# tests/test_retention.py
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import database_actions
+import retention
+from conftest import CHAT_ID, USER_ID
+from database_connection import transaction
+from report_cache import report_cache
+from retention import TASHKENT_TZ
+
+DAYS = 180
+
+
+def add_task(task, status, day, notified=True, completed=False, created=True):
+    """Insert a task reminded at 08:00 on ``day`` and saved an hour before; return its id."""
+    ts = int(database_actions.day_start_ts(day.isoformat())) + 8 * 3600
+    with transaction() as cursor:
+        cursor.execute(
+            """INSERT INTO tasks (chat_id, user_id, task, time, status, notified_ts, notified_day, completed_ts, created_ts)
+               VALUES (?, ?, ?, '08:00', ?, ?, ?, ?, ?)""",
+            (CHAT_ID, USER_ID, task, status, ts if notified else None, day.isoformat() if notified else None,
+             ts + 600 if completed else None, ts - 3600 if created else None)
+        )
+        return cursor.lastrowid
+
+
+def live_ids(kind):
+    with transaction() as cursor:
+        cursor.execute(f"SELECT id FROM main.{kind} ORDER BY id")
+        return [row[0] for row in cursor.fetchall()]
+
+
+def archived_ids(kind):
+    with transaction() as cursor:
+        cursor.execute(f"SELECT id FROM archive.{kind} ORDER BY id")
+        return [row[0] for row in cursor.fetchall()]
+
+
+def test_archive_batch_moves_only_finished_rows_past_the_cutoff(db):
+    today = datetime.now(TASHKENT_TZ).date()
+    old, recent = today - timedelta(days=DAYS + 10), today - timedelta(days=10)
+    expired = [
+        add_task("Gym", "completed", old, completed=True),
+        add_task("Read", "missed", old),
+        add_task("Walk", "missed", old, notified=False),  # Marked missed as overdue: only created_ts
+    ]
+    kept = [
+        add_task("Gym", "completed", recent, completed=True),
+        add_task("Plan", "pending", old, notified=False),
+        add_task("Legacy", "missed", old, notified=False, created=False),  # Undated; never archived
+    ]
+    database_actions.save_bills(CHAT_ID, USER_ID, old.isoformat(), [("expense", -3.0, "Tea", "09:00")])
+    database_actions.save_bills(CHAT_ID, USER_ID, recent.isoformat(), [("expense", -4.0, "Tea", "09:00")])
+
+    cutoff_ts, cutoff_date = retention.archive_cutoff(DAYS)
+    assert retention.archive_batch("tasks", cutoff_ts, batch_size=2) == 2
+    assert retention.archive_batch("tasks", cutoff_ts, batch_size=2) == 1
+    assert retention.archive_batch("tasks", cutoff_ts, batch_size=2) == 0
+    assert retention.archive_batch("bills", cutoff_date) == 1
+    assert archived_ids("tasks") == expired and live_ids("tasks") == kept
+    assert len(archived_ids("bills")) == 1 and len(live_ids("bills")) == 1
+
+
+def test_archived_tasks_are_still_read_through_all_tasks(db):
+    today = datetime.now(TASHKENT_TZ).date()
+    old = today - timedelta(days=DAYS + 10)
+    gym = add_task("Gym session", "completed", old, completed=True)
+    add_task("Read", "missed", old)
+    add_task("Gym session", "completed", today, completed=True)
+    before = database_actions.get_task_statistics(CHAT_ID)
+    first_page = database_actions.search_tasks_page(CHAT_ID, "gym")
+
+    asyncio.run(retention.run_retention(DAYS, pause=0))
+    report_cache.clear()
+    assert archived_ids("tasks") != []
+    assert database_actions.get_task_statistics(CHAT_ID) == before == (2, 1, 2 / 3 * 100)
+    assert database_actions.search_tasks_page(CHAT_ID, "gym") == first_page
+    assert [task[0] for task in first_page[0]][-1] == gym
+    assert database_actions.get_task(CHAT_ID, gym)[1] == "Gym session"
+
+
+def test_run_retention_moves_everything_in_batches(db, monkeypatch):
+    today = datetime.now(TASHKENT_TZ).date()
+    for day in range(5):
+        add_task("Gym", "completed", today - timedelta(days=DAYS + 1 + day), completed=True)
+    batches = []
+    archive_batch = retention.archive_batch
+
+    def counted(kind, cutoff, batch_size):
+        batches.append((kind, archive_batch(kind, cutoff, batch_size)))
+        return batches[-1][1]
+
+    monkeypatch.setattr(retention, "archive_batch", counted)
+    assert asyncio.run(retention.run_retention(DAYS, batch_size=2, pause=0)) == {"tasks": 5, "bills": 0}
+    assert batches == [("tasks", 2), ("tasks", 2), ("tasks", 1), ("bills", 0)]
+    assert live_ids("tasks") == []
+
+
+def test_retention_horizon_has_a_minimum(db):
+    with pytest.raises(ValueError):
+        asyncio.run(retention.run_retention(retention.MIN_ARCHIVE_AFTER_DAYS - 1))
@@ -0,0 +1,149 @@
+# tests/test_search.py
+import asyncio
+
+import pytest
+
+from conftest import CHAT_ID, USER_ID, callback_update, dispatch, message_update
+from database_actions import SEARCH_PAGE_SIZE, build_search_filters, parse_search_query, search_tasks_page
+from database_connection import ARCHIVE_SCHEMA, ARCHIVED_COLUMNS, transaction
+
+NO_FILTERS = {"time": None, "start_date": None, "end_date": None, "status": None}
+
+
+def add_tasks(*tasks, chat_id=CHAT_ID):
+    """Insert ``(task, time, status, notified_ts, notified_day)`` rows; return their ids."""
+    ids = []
+    with transaction() as cursor:
+        for task in tasks:
+            cursor.execute(
+                "INSERT INTO tasks (chat_id, task, time, status, notified_ts, notified_day) VALUES (?, ?, ?, ?, ?, ?)",
+                (chat_id, *task)
+            )
+            ids.append(cursor.lastrowid)
+    return ids
+
+
+def found(query, chat_id=CHAT_ID):
+    rows, _ = search_tasks_page(chat_id, query, limit=100)
+    return sorted(row[0] for row in rows)
+
+
+@pytest.mark.parametrize("query, terms, filters", [
+    ("Workout 17:00", ["Workout"], {"time": "17:00"}),
+    ("Workout:7:05", ["Workout"], {"time": "07:05"}),
+    ("gym run 2025-02-18..2025-02-01 status:MISSED", ["gym", "run"],
+     {"start_date": "2025-02-01", "end_date": "2025-02-18", "status": "missed"}),
+    ("read 2025-02-18", ["read"], {"start_date": "2025-02-18", "end_date": "2025-02-18"}),
+    ("read 2025-02-30", ["read"], {}),  # Not a date: no filter
+    ("read 2025-02-01..2025-13-01", ["read"], {}),
+    ("25:99", ["25", "99"], {}),  # Not a time: searched as words
+    ("status:later gym", ["gym"], {}),  # Unknown status: dropped
+    ('"gym" OR -run* NEAR(a) col:x', ["gym", "OR", "run", "NEAR", "a", "col", "x"], {}),
+    ("Café ☕", ["Café"], {}),
+])
+def test_parse_search_query(query, terms, filters):
+    assert parse_search_query(query) == (terms, {**NO_FILTERS, **filters})
+
+
+def test_search_terms_are_quoted_for_fts():
+    _, where, params = build_search_filters(CHAT_ID, ["gym", 'a"b', "OR"], NO_FILTERS)
+    assert "tasks_fts MATCH ?" in where
+    assert params == [CHAT_ID, '"gym"* "a""b"* "OR"*']
+
+
+def test_search_matches_prefixes_of_every_word_and_applies_filters(db):
+    gym, gym_run, cafe, yoga = add_tasks(
+        ("Gym", "07:00", "completed", 1739844000, "2025-02-18"),
+        ("Gym or run", "17:00", "missed", 1739930400, "2025-02-19"),
+        ("Cafe reading", "09:00", "pending", None, None),
+        ("Yoga", "07:00", "completed", 1739844000, "2025-02-18"),
+    )
+    assert found("gy") == [gym, gym_run]
+    assert found("gym run") == [gym_run]
+    assert found("gym OR") == [gym_run]  # FTS operators are searched as words
+    assert found('gym" OR "run') == [gym_run]
+    assert found("NEAR(gym run) -yoga *") == []
+    assert found("café READ") == [cafe]  # Case and diacritics are folded
+    assert found("07:00") == [gym, yoga]
+    assert found("gym 2025-02-19") == [gym_run]
+    assert found("2025-02-01..2025-02-18") == [gym, yoga]
+    assert found("gym status:completed") == [gym]
+    assert found("gym", chat_id=CHAT_ID + 1) == []
+    assert search_tasks_page(CHAT_ID, "?! status:later") == ([], False)  # Nothing to search for
+
+
+def test_fts_index_follows_updates_and_deletes(db):
+    gym, read = add_tasks(("Gym", "07:00", "pending", None, None), ("Read", "21:00", "pending", None, None))
+    with transaction() as cursor:
+        cursor.execute("UPDATE tasks SET task = 'Swim' WHERE id = ?", (gym,))
+        cursor.execute("UPDATE tasks SET status = 'completed' WHERE id = ?", (read,))  # Not the text: index untouched
+    assert found("gym") == []
+    assert found("swim") == [gym]
+    assert found("read") == [read]
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM tasks WHERE id = ?", (gym,))
+        cursor.execute("INSERT INTO tasks_fts(tasks_fts) VALUES ('integrity-check')")
+    assert found("swim") == []
+    assert found("read status:completed") == [read]
+
+
+def paged_tasks():
+    """25 "Gym" tasks: distinct, equal and NULL notified_ts, some of them archived; return ids in result order."""
+    tasks = [("Gym", "07:00", "missed", None, None)] * 8  # Ids 1-8
+    tasks += [("Gym", "07:00", "completed", 1000, "1970-01-01")] * 8  # Ids 9-16
+    tasks += [("Gym", "07:00", "completed", 2000 + 100 * i, "1970-01-01") for i in range(9)]  # Ids 17-25
+    ids = add_tasks(*tasks)
+    add_tasks(("Yoga", "07:00", "completed", 5000, "1970-01-01"), ("Gym", "07:00", "completed", 5000, None), chat_id=CHAT_ID + 1)
+    columns = ", ".join(ARCHIVED_COLUMNS["tasks"])
+    archived = (3, 4, 10, 11, 12, 20, 21)
+    with transaction() as cursor:
+        cursor.execute(f"INSERT INTO {ARCHIVE_SCHEMA}.tasks ({columns}) SELECT {columns} FROM main.tasks WHERE id IN {archived}")
+        cursor.execute(f"DELETE FROM main.tasks WHERE id IN {archived}")
+    order = list(reversed(ids[16:])) + list(reversed(ids[8:16])) + list(reversed(ids[:8]))
+    return order
+
+
+def test_search_pages_walk_every_match_once_across_live_and_archived_tasks(db):
+    order = paged_tasks()
+    pages, after = [], None
+    while True:
+        rows, more = search_tasks_page(CHAT_ID, "gym", after=after)
+        pages.append([row[0] for row in rows])
+        if not more:
+            break
+        after = (rows[-1][4], rows[-1][0])
+    assert [len(page) for page in pages] == [SEARCH_PAGE_SIZE, SEARCH_PAGE_SIZE, 5]
+    assert sum(pages, []) == order
+    # Page 1 ends inside the run of equal timestamps, page 2 inside the unnotified ones
+    assert search_tasks_page(CHAT_ID, "gym", after=(1000, 16))[0][0][0] == 15
+    assert [row[0] for row in search_tasks_page(CHAT_ID, "gym", after=(None, 6))[0]] == [5, 4, 3, 2, 1]
+    assert search_tasks_page(CHAT_ID, "gym", after=(None, 1)) == ([], False)
+    assert search_tasks_page(CHAT_ID, "gym", limit=len(order)) == (search_tasks_page(CHAT_ID, "gym", limit=100)[0], False)
+
+
+def test_next_and_prev_buttons_page_through_search_results(app):
+    order = paged_tasks()
+
+    async def page(*updates):
+        await dispatch(app, *updates)
+        data = await app.storage.get_data(chat=CHAT_ID, user=USER_ID)
+        keyboard = app.fake_bot.calls[-1][2]["reply_markup"]
+        buttons = [button.callback_data for row in keyboard.inline_keyboard for button in row]
+        return data["ids"], [button for button in buttons if button.startswith("page:")], app.fake_bot.sent[-1]
+
+    async def scenario():
+        first = await page(message_update("/search"), message_update("gym"))
+        second = await page(callback_update("page:next"))
+        third = await page(callback_update("page:next"))
+        back = await page(callback_update("page:prev"))
+        again = await page(callback_update("page:prev"), callback_update("page:next"))
+        return first, second, third, back, again
+
+    first, second, third, back, again = asyncio.run(scenario())
+    assert first[:2] == (order[:10], ["page:next"])
+    assert second[:2] == (order[10:20], ["page:prev", "page:next"])
+    assert third[:2] == (order[20:], ["page:prev"])
+    assert back[:2] == second[:2] and again[:2] == second[:2]
+    assert first[2].startswith("📋 Search results for 'gym' (page 1):\n1. Gym")
+    assert third[2].startswith("📋 Search results for 'gym' (page 3):\n21. Gym")
+    assert app.fake_bot.calls[-1][0] == "edit_message_text"
@@ -0,0 +1,57 @@
+# tests/test_update_pool.py
+import asyncio
+
+from aiogram import Bot, Dispatcher
+
+from conftest import message_update
+from update_pool import UpdatePool, with_timeout
+
+
+def recording_dispatcher(handled, delays):
+    dp = Dispatcher(Bot(token="123456:test"))
+
+    async def handler(message):
+        await asyncio.sleep(delays.get(message.text, 0.01))
+        handled.append(((message.chat.id, message.message_thread_id), message.text))
+
+    dp.register_message_handler(with_timeout(handler, 0.5))
+    return dp
+
+
+def test_each_topic_is_handled_in_order_while_topics_run_in_parallel():
+    handled = []
+    topics = [(-1001, 5), (-1001, 6), (-1002, None), (-1003, 3)]
+    dp = recording_dispatcher(handled, {"slow": 0.05})
+
+    async def scenario():
+        pool = UpdatePool(dp, workers=4, queue_size=2)  # Small queues exercise the backpressure path
+        pool.start()
+        started = asyncio.get_running_loop().time()
+        for n in range(5):
+            for chat_id, thread_id in topics:
+                text = "slow" if n % 2 == 0 else f"{n}"
+                await pool.submit(message_update(text, chat_id=chat_id, thread_id=thread_id))
+        await pool.stop()
+        return pool, asyncio.get_running_loop().time() - started
+
+    pool, elapsed = asyncio.run(scenario())
+    assert pool.processed == 20 and pool.failed == 0
+    for topic in topics:
+        assert [text for key, text in handled if key == topic] == ["slow", "1", "slow", "3", "slow"]
+    # Run one after another this would take 4 * (3 * 0.05 + 2 * 0.01) = 0.68 s
+    assert elapsed < 0.6
+
+
+def test_stuck_handler_is_cancelled_and_its_topic_moves_on():
+    handled = []
+    dp = recording_dispatcher(handled, {"stuck": 10})
+
+    async def scenario():
+        pool = UpdatePool(dp, workers=1)
+        pool.start()
+        await pool.submit(message_update("stuck", chat_id=-1001, thread_id=5))
+        await pool.submit(message_update("next", chat_id=-1001, thread_id=5))
+        await pool.stop()
+
+    asyncio.run(scenario())
+    assert handled == [((-1001, 5), "next")]
@@ -0,0 +1,86 @@
+# tests/test_webhook.py
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import database_actions
+from conftest import CHAT_ID, message_update
+import webhook
+from webhook import SECRET_HEADER, WebhookServer
+
+
+async def post_updates(app, updates, secret=None):
+    await app.topics.load()
+    server = WebhookServer(app.dp, "/webhook", app.update_pool, secret=secret)
+    app.update_pool.start()
+    async with TestClient(TestServer(server.make_app())) as client:
+        statuses = []
+        for update in updates:
+            headers = {SECRET_HEADER: secret} if secret else {}
+            response = await client.post("/webhook", json=update.to_python(), headers=headers)
+            statuses.append(response.status)
+            for queue in app.update_pool.queues:
+                await queue.join()
+        await app.update_pool.stop()
+        headers = {SECRET_HEADER: secret} if secret else {}
+        stats = await (await client.get("/webhook/stats", headers=headers)).json()
+    await app.storage.close()
+    return statuses, stats
+
+
+def test_search_conversation_over_the_webhook(app):
+    task_id = database_actions.save_task(CHAT_ID, 1, "Workout", "17:00")
+    search, query = message_update("/search"), message_update("Workout")
+    statuses, stats = asyncio.run(post_updates(app, [search, query, query], secret="s3cret"))
+    assert statuses == [200, 200, 200]
+    assert stats["received"] == 3 and stats["duplicates"] == 1 and stats["processed"] == 2
+    assert len(app.fake_bot.sent) == 2 and f"ID: {task_id}" in app.fake_bot.sent[1]
+
+
+def test_requests_without_the_secret_are_rejected(app):
+    async def scenario():
+        server = WebhookServer(app.dp, "/webhook", app.update_pool, secret="s3cret")
+        async with TestClient(TestServer(server.make_app())) as client:
+            forbidden = await client.post("/webhook", json=message_update("hi").to_python())
+            invalid = await client.post("/webhook", data=b"{", headers={SECRET_HEADER: "s3cret"})
+            not_an_update = await client.post("/webhook", json=[1, 2], headers={SECRET_HEADER: "s3cret"})
+            return forbidden.status, invalid.status, not_an_update.status, server.received
+
+    assert asyncio.run(scenario()) == (403, 400, 400, 0)
+
+
+def test_stats_require_the_secret(app):
+    async def scenario():
+        server = WebhookServer(app.dp, "/webhook", app.update_pool, secret="s3cret")
+        async with TestClient(TestServer(server.make_app())) as client:
+            anonymous = await client.get("/webhook/stats")
+            wrong = await client.get("/webhook/stats", headers={SECRET_HEADER: "guess"})
+            allowed = await client.get("/webhook/stats", headers={SECRET_HEADER: "s3cret"})
+            return anonymous.status, wrong.status, allowed.status, await allowed.json()
+
+    anonymous, wrong, allowed, stats = asyncio.run(scenario())
+    assert (anonymous, wrong, allowed) == (403, 403, 200)
+    assert stats == {"received": 0, "duplicates": 0, "processed": 0, "failed": 0, "queued": 0}
+
+
+def test_shutdown_closes_the_bot_session(app, monkeypatch):
+    served, closed = [], []
+    monkeypatch.setattr(webhook.web, "run_app", lambda web_app, **kwargs: served.append(web_app))
+
+    async def close():
+        closed.append(True)
+
+    async def on_shutdown(dp):
+        assert closed  # The session is closed before the app's own cleanup
+
+    monkeypatch.setattr(app.bot, "close", close)
+    webhook.run_webhook(app.dp, None, "/webhook", "127.0.0.1", 0, app.update_pool, on_shutdown=on_shutdown)
+
+    async def scenario():
+        web_app, = served
+        web_app.freeze()
+        await web_app.startup()
+        await web_app.shutdown()
+
+    asyncio.run(scenario())
+    assert closed == [True]
@@ -0,0 +1,111 @@
+# update_pool.py
+import asyncio
+import functools
+import logging
+
+from aiogram import Bot, Dispatcher, types
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE_PER_WORKER = 100
+POLL_TIMEOUT = 20  # Seconds Telegram holds a getUpdates request open
+POLL_ERROR_SLEEP = 5
+
+
+def ordering_key(update: types.Update):
+    """(chat_id, thread_id) whose updates must be handled in order, or None for chat-less updates."""
+    message = update.message or update.edited_message or update.channel_post or update.edited_channel_post
+    if message is None and update.callback_query is not None:
+        message = update.callback_query.message  # Button presses follow the messages of their topic
+    if message is not None:
+        return message.chat.id, message.message_thread_id
+    member = update.my_chat_member or update.chat_member or update.chat_join_request
+    if member is not None:
+        return member.chat.id, None
+    return None
+
+
+def with_timeout(handler, seconds):
+    """Cancel ``handler`` after ``seconds`` so one stuck update cannot block its chat's queue."""
+    @functools.wraps(handler)  # aiogram reads the handler's arguments through __wrapped__
+    async def wrapper(*args, **kwargs):
+        try:
+            return await asyncio.wait_for(handler(*args, **kwargs), seconds)
+        except asyncio.TimeoutError:
+            logger.warning("handler timed out handler=%s seconds=%s", handler.__name__, seconds)
+            if metrics.enabled:
+                metrics.HANDLER_TIMEOUTS.inc(handler.__name__)
+    return wrapper
+
+
+class UpdatePool:
+    """Fixed set of workers that run a Dispatcher's handlers, ordered per chat topic.
+
+    Every update is routed by a hash of its chat and thread to one worker's bounded
+    queue, so the updates of one topic are handled one after another in arrival order
+    while other chats and topics proceed in parallel. ``submit`` waits while that queue
+    is full, which stops polling, or holds the webhook response, until workers catch up.
+    """
+
+    def __init__(self, dp: Dispatcher, workers=4, queue_size=QUEUE_SIZE_PER_WORKER):
+        self.dp = dp
+        self.queues = [asyncio.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.processed = 0
+        self.failed = 0
+        self._tasks = []
+
+    def queued(self):
+        return sum(queue.qsize() for queue in self.queues)
+
+    def shard(self, update: types.Update):
+        key = ordering_key(update)
+        # Integer tuples hash the same in every process, so the routing is reproducible
+        return hash(key) % len(self.queues) if key is not None else update.update_id % len(self.queues)
+
+    async def submit(self, update: types.Update):
+        await self.queues[self.shard(update)].put(update)
+
+    async def worker(self, queue):
+        Bot.set_current(self.dp.bot)
+        Dispatcher.set_current(self.dp)
+        while True:
+            update = await queue.get()
+            try:
+                # A task per update gives it a fresh context: aiogram caches the FSM state
+                # it resolved in a ContextVar, which must not carry over to the next update
+                await asyncio.create_task(self.dp.process_update(update))
+            except Exception as e:
+                self.failed += 1
+                logger.exception("update processing failed update_id=%s: %s", update.update_id, e)
+            finally:
+                self.processed += 1
+                queue.task_done()
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self.worker(queue)) for queue in self.queues]
+
+    async def stop(self):
+        # Handlers are bounded by their timeouts, so draining always finishes
+        for queue in self.queues:
+            await queue.join()
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def poll(self, allowed_updates=None, timeout=POLL_TIMEOUT):
+        """Long-poll Telegram into the pool; no new batch is fetched while a queue is full."""
+        bot = self.dp.bot
+        offset = None
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=timeout, allowed_updates=allowed_updates)
+            except Exception as e:
+                logger.exception("getting updates failed: %s", e)
+                await asyncio.sleep(POLL_ERROR_SLEEP)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                await self.submit(update)
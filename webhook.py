@@ -0,0 +1,103 @@
+# webhook.py
+import logging
+from collections import OrderedDict
+
+from aiohttp import web
+from aiogram import Dispatcher, types
+
+from update_pool import UpdatePool
+
+logger = logging.getLogger(__name__)
+
+DEDUP_SIZE = 10000  # Recent update_ids remembered to drop Telegram's redeliveries
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """aiohttp endpoint that hands Telegram updates to an UpdatePool.
+
+    The request handler only parses and deduplicates the update and answers 200 right
+    away; the pool's workers run the actual handlers.
+    """
+
+    def __init__(self, dp: Dispatcher, path, pool: UpdatePool, secret=None, dedup_size=DEDUP_SIZE):
+        self.dp = dp
+        self.path = path
+        self.pool = pool
+        self.secret = secret
+        self.dedup_size = dedup_size
+        self.received = 0
+        self.duplicates = 0
+        self._seen = OrderedDict()
+
+    def is_duplicate(self, update_id):
+        if update_id in self._seen:
+            return True
+        self._seen[update_id] = None
+        if len(self._seen) > self.dedup_size:
+            self._seen.popitem(last=False)
+        return False
+
+    def authorized(self, request):
+        if self.secret and request.headers.get(SECRET_HEADER) != self.secret:
+            logger.warning("rejected webhook request remote=%s path=%s: bad secret token", request.remote, request.path)
+            return False
+        return True
+
+    async def handle(self, request):
+        if not self.authorized(request):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except ValueError as e:
+            logger.warning("rejected webhook request remote=%s: invalid JSON: %s", request.remote, e)
+            return web.Response(status=400)
+        if not isinstance(data, dict):
+            logger.warning("rejected webhook request remote=%s: not an update object", request.remote)
+            return web.Response(status=400)
+        self.received += 1
+        if self.is_duplicate(data.get("update_id")):
+            self.duplicates += 1
+            return web.Response()
+        await self.pool.submit(types.Update(**data))  # Waits when workers fall behind, which slows Telegram down
+        return web.Response()
+
+    async def handle_stats(self, request):
+        if not self.authorized(request):
+            return web.Response(status=403)
+        return web.json_response({
+            "received": self.received,
+            "duplicates": self.duplicates,
+            "processed": self.pool.processed,
+            "failed": self.pool.failed,
+            "queued": self.pool.queued(),
+        })
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        app.router.add_get(self.path + "/stats", self.handle_stats)
+        return app
+
+
+def run_webhook(dp, url, path, host, port, pool, secret=None, on_startup=None, on_shutdown=None):
+    server = WebhookServer(dp, path, pool, secret or None)
+    app = server.make_app()
+
+    async def startup(app):
+        pool.start()
+        if url:
+            # Keep updates that arrived while the bot was down instead of dropping them
+            await dp.bot.set_webhook(url.rstrip("/") + path, secret_token=secret or None, drop_pending_updates=False)
+        if on_startup:
+            await on_startup(dp)
+
+    async def shutdown(app):
+        await pool.stop()
+        await dp.bot.close()
+        if on_shutdown:
+            await on_shutdown(dp)
+
+    app.on_startup.append(startup)
+    app.on_shutdown.append(shutdown)
+    web.run_app(app, host=host, port=port)
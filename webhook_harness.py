@@ -0,0 +1,91 @@
+# webhook_harness.py
+"""POST recorded Telegram updates to a running webhook server and report throughput.
+
+Usage:
+    python main.py --webhook                      # in another terminal
+    python -m webhook_harness updates.jsonl --repeat 20 --concurrency 50
+
+Each line of the input file is one Update object as Telegram sends it. Fresh
+update_ids are assigned by default so repeated runs are not dropped as duplicates.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import statistics
+import time
+
+import aiohttp
+
+from config import WEBAPP_PORT, WEBHOOK_PATH, WEBHOOK_SECRET
+from webhook import SECRET_HEADER
+
+
+def load_updates(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def post_updates(url, updates, concurrency, secret=None):
+    latencies = []
+    errors = 0
+    headers = {SECRET_HEADER: secret} if secret else {}
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+
+    async def sender(session):
+        nonlocal errors
+        while not queue.empty():
+            update = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                async with session.post(url, json=update, headers=headers) as response:
+                    if response.status != 200:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*[sender(session) for _ in range(concurrency)])
+    return time.perf_counter() - started, latencies, errors
+
+
+async def fetch_stats(url):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url + "/stats") as response:
+            return await response.json()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m webhook_harness", description=__doc__.splitlines()[0])
+    parser.add_argument("updates", help="JSONL file of recorded Telegram updates")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{WEBAPP_PORT}{WEBHOOK_PATH}")
+    parser.add_argument("--repeat", type=int, default=1, help="send the recorded updates this many times")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--keep-ids", action="store_true", help="send the recorded update_ids unchanged")
+    args = parser.parse_args(argv)
+
+    recorded = load_updates(args.updates)
+    updates = [dict(update) for update in recorded for _ in range(args.repeat)]
+    if not args.keep_ids:
+        base = int(time.time() * 1000)
+        for update, update_id in zip(updates, itertools.count(base)):
+            update["update_id"] = update_id
+
+    elapsed, latencies, errors = asyncio.run(post_updates(args.url, updates, args.concurrency, WEBHOOK_SECRET))
+    latencies.sort()
+    print(f"Sent {len(updates)} updates in {elapsed:.2f}s ({len(updates) / elapsed:.0f} updates/s), {errors} errors")
+    if latencies:
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0]
+        print(f"Latency p50 {statistics.median(latencies) * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms")
+    try:
+        print(f"Server stats: {asyncio.run(fetch_stats(args.url))}")
+    except aiohttp.ClientError:
+        pass
+
+
+if __name__ == "__main__":
+    main()
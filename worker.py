@@ -0,0 +1,46 @@
+# worker.py
+"""Scheduler process: sends reminders and scheduled reports without receiving updates.
+
+Usage:
+    python main.py --no-schedulers    # the bot: polling or --webhook, answers users
+    python worker.py                  # one or more, on any host sharing the database
+
+Only one process may receive updates for a bot token, but any number of workers can
+run the reminder, report and retention schedulers next to it. Each reminder and each
+periodic job is claimed in the database before it runs (see leases.py), so nothing is
+sent twice, and a worker that stops has its unsent messages adopted by the others.
+Workers do not serve /metrics.
+"""
+import asyncio
+import logging
+import signal
+
+import main
+from config import LOG_FORMAT, LOG_LEVEL
+from leases import HEARTBEAT_INTERVAL, INSTANCE_ID
+
+logger = logging.getLogger(__name__)
+
+
+async def run_worker():
+    main.create_app(worker=True)
+    # Running bots learn of this worker on their next lease renewal; until then they would
+    # trust their in-memory reminder windows, so nothing is sent before that
+    await main.startup(serve_metrics=False, join_delay=HEARTBEAT_INTERVAL)
+    logger.info("worker started instance=%s", INSTANCE_ID)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await main.on_shutdown(main.dp)
+        await main.bot.close()
+        logger.info("worker stopped instance=%s", INSTANCE_ID)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+    asyncio.run(run_worker())